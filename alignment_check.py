@@ -0,0 +1,275 @@
+"""
+ai_input と AIの出力（novel_output）の対応チェック
+
+AIの出力で、シーン・分岐・画像・セリフが抜け落ちていないかを確認します。
+両方のファイルから目印になる行（【シーン: …】、【分岐: …】、画像のURL、
+【話者】セリフ）を取り出してハッシュ化し、シーンごとに順番を保ったまま
+突き合わせます（patience diff と同じ方法）。抜けている項目と、余分な項目を章ごとに表示します。
+
+使い方: python cli.py check [タイトル ...] [--verbose]
+"""
+
+import re
+from bisect import bisect_left
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from difflib import SequenceMatcher
+from pathlib import Path
+
+from chunked_export import is_part_file
+from image_cache import IMAGE_MARKERS, URL_PATTERN
+
+OUTPUT_DIR = Path('output')
+
+KIND_LABELS = {
+    'scene': 'シーン',
+    'branch': '分岐',
+    'image': '画像',
+    'speaker': 'セリフ',
+}
+
+_SPEAKER_LINE = re.compile(r'【([^】]+)】(.*)')
+_SPACES = re.compile(r'\s+')
+
+
+def _anchor(line):
+    """1行から (種類, 比較用の文字列) を返す（目印でなければ None）"""
+    line = line.strip()
+    if not line:
+        return None
+    if line.startswith('【シーン:') and '】' in line:
+        return 'scene', line[len('【シーン:'):line.index('】')].strip()
+    if line.startswith('【分岐:') and '】' in line:
+        return 'branch', line[len('【分岐:'):line.index('】')].strip()
+    if 'https://' in line and any(marker in line for marker in IMAGE_MARKERS):
+        match = URL_PATTERN.search(line)
+        if match:
+            return 'image', match.group(0)
+    match = _SPEAKER_LINE.match(line)
+    if match and match.group(1) != 'ドクターの選択肢':
+        return 'speaker', _SPACES.sub('', line)
+    return None
+
+
+def read_scenes(path):
+    """ファイルを1行ずつ読み、シーンごとの目印 [(シーン名, [(種類, 文字列, ハッシュ)])] を返す"""
+    scenes = [(None, [])]
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            anchor = _anchor(line)
+            if anchor is None:
+                continue
+            kind, text = anchor
+            if kind == 'scene':
+                scenes.append((text, []))
+            else:
+                scenes[-1][1].append((kind, text, hash((kind, text))))
+    if not scenes[0][1]:
+        scenes.pop(0)
+    return scenes
+
+
+def _unique_anchors(a, alo, ahi, b, blo, bhi):
+    """両方の区間にちょうど1回ずつ出てくる項目の組 [(a の添字, b の添字)] を、a の順番で返す"""
+    count_a = Counter(a[alo:ahi])
+    count_b = Counter(b[blo:bhi])
+    position_b = {b[j]: j for j in range(blo, bhi) if count_b[b[j]] == 1}
+    return [(i, position_b[a[i]]) for i in range(alo, ahi)
+            if count_a[a[i]] == 1 and a[i] in position_b]
+
+
+def _longest_increasing(pairs):
+    """b の添字が増えていく最長の部分列を返す（patience sorting、O(k log k)）"""
+    tails = []  # 長さ n+1 の部分列の末尾で、b の添字が最も小さいものの pairs での位置
+    tail_values = []
+    previous = [None] * len(pairs)
+    for index, (_, j) in enumerate(pairs):
+        length = bisect_left(tail_values, j)
+        if length:
+            previous[index] = tails[length - 1]
+        if length == len(tails):
+            tails.append(index)
+            tail_values.append(j)
+        else:
+            tails[length] = index
+            tail_values[length] = j
+    result = []
+    index = tails[-1] if tails else None
+    while index is not None:
+        result.append(pairs[index])
+        index = previous[index]
+    return result[::-1]
+
+
+def align(source, target):
+    """2つの目印の列を順番を保って突き合わせる
+
+    patience diff の方法で、両方の列に1回ずつしか出てこない項目を目印にして
+    順番が矛盾しない最長の組（最長増加部分列）を一致とし、目印の間の区間を
+    同じように分けていきます。区間の先頭・末尾の同じ項目もそのまま一致とします。
+    1回ずつしか出てこない項目がない区間（「……」の繰り返しなど）だけは
+    difflib.SequenceMatcher で比べます。1つの項目が移動しても、
+    その項目だけが欠落と余分になり、前後の項目は一致したままです。
+    目印を先に決めるので、一致する項目の数は最長共通部分列より少ないことがあります。
+
+    計算量はほぼ O(n log n) です。ただし SequenceMatcher に回す区間は
+    その区間の長さの2乗に比例するので、同じセリフだけが長く続く章では遅くなります。
+
+    Returns:
+        (source で一致しなかった添字のリスト, target で一致しなかった添字のリスト)
+    """
+    a = [item[2] for item in source]
+    b = [item[2] for item in target]
+    matched_source = set()
+    matched_target = set()
+    stack = [(0, len(a), 0, len(b))]
+    while stack:
+        alo, ahi, blo, bhi = stack.pop()
+        # 先頭と末尾で同じ項目はそのまま一致
+        while alo < ahi and blo < bhi and a[alo] == b[blo]:
+            matched_source.add(alo)
+            matched_target.add(blo)
+            alo += 1
+            blo += 1
+        while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+            ahi -= 1
+            bhi -= 1
+            matched_source.add(ahi)
+            matched_target.add(bhi)
+        if alo == ahi or blo == bhi:
+            continue
+        anchors = _longest_increasing(_unique_anchors(a, alo, ahi, b, blo, bhi))
+        if not anchors:
+            # 同じセリフ（「……」など）が何度も出てくるので、よく出る項目を無視する autojunk は使わない
+            matcher = SequenceMatcher(None, a[alo:ahi], b[blo:bhi], autojunk=False)
+            for i, j, size in matcher.get_matching_blocks():
+                matched_source.update(range(alo + i, alo + i + size))
+                matched_target.update(range(blo + j, blo + j + size))
+            continue
+        # 目印を一致とし、その間の区間をそれぞれ同じように突き合わせる
+        for i, j in anchors:
+            matched_source.add(i)
+            matched_target.add(j)
+            stack.append((alo, i, blo, j))
+            alo, blo = i + 1, j + 1
+        stack.append((alo, ahi, blo, bhi))
+    missing = [i for i in range(len(source)) if i not in matched_source]
+    extra = [j for j in range(len(target)) if j not in matched_target]
+    return missing, extra
+
+
+def check_chapter(title, source_path, target_path):
+    """1章分のチェック結果を返す（プロセスプールから呼ばれる）"""
+    source_scenes = read_scenes(source_path)
+    target_scenes = read_scenes(target_path)
+
+    # シーン見出しを突き合わせる
+    source_names = [(None, name, hash(name)) for name, _ in source_scenes]
+    target_names = [(None, name, hash(name)) for name, _ in target_scenes]
+    missing_scenes, extra_scenes = align(source_names, target_names)
+    missing_scene_set = set(missing_scenes)
+    extra_scene_set = set(extra_scenes)
+
+    totals = defaultdict(int)
+    found = defaultdict(int)
+    missing = []  # (シーン名, 種類, 文字列)
+    extra = []
+    target_by_name = defaultdict(deque)
+    for j, (name, items) in enumerate(target_scenes):
+        if j not in extra_scene_set:
+            target_by_name[name].append(items)
+
+    for i, (name, items) in enumerate(source_scenes):
+        if name is not None:
+            totals['scene'] += 1
+            if i not in missing_scene_set:
+                found['scene'] += 1
+        for kind, _, _ in items:
+            totals[kind] += 1
+        if i in missing_scene_set:
+            missing.append((name, 'scene', name))
+            continue
+        target_items = target_by_name[name].popleft() if target_by_name[name] else []
+        missing_items, extra_items = align(items, target_items)
+        missing_set = set(missing_items)
+        for index, (kind, text, _) in enumerate(items):
+            if index in missing_set:
+                missing.append((name, kind, text))
+            else:
+                found[kind] += 1
+        for index in extra_items:
+            kind, text, _ = target_items[index]
+            extra.append((name, kind, text))
+
+    for j in sorted(extra_scene_set):
+        extra.append((target_scenes[j][0], 'scene', target_scenes[j][0]))
+
+    return {
+        'title': title,
+        'totals': dict(totals),
+        'found': dict(found),
+        'missing': missing,
+        'extra': extra,
+    }
+
+
+def find_pairs(titles=None, output_dir=OUTPUT_DIR):
+    """チェックできる章 [(タイトル, ai_input, novel_output)] を返す"""
+    pairs = []
+    for source in sorted(Path(output_dir).glob('ai_input_*.txt')):
+        title = source.stem[len('ai_input_'):]
+        if is_part_file(source.stem) or (titles and title not in titles):
+            continue
+        target = Path(output_dir) / f'novel_output_{title}.txt'
+        if target.exists() and target.stat().st_size > 0:
+            pairs.append((title, source, target))
+    return pairs
+
+
+def check_chapters(pairs, jobs=None):
+    """複数の章を並列にチェック（結果は入力の順番）"""
+    if len(pairs) <= 1 or jobs == 1:
+        return [check_chapter(*pair) for pair in pairs]
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(check_chapter, *zip(*pairs)))
+
+
+def format_result(result, verbose=False):
+    """チェック結果を表示用の文字列にする
+
+    セリフは言い換えられることが多いので、--verbose の場合だけ1行ずつ表示します。
+    """
+    counts = ', '.join(
+        f"{label} {result['found'].get(kind, 0)}/{result['totals'].get(kind, 0)}"
+        for kind, label in KIND_LABELS.items()
+    )
+    lines = [f"{result['title']}: {counts}"]
+    for heading, items in (('欠落', result['missing']), ('余分', result['extra'])):
+        for scene, kind, text in items:
+            if kind == 'speaker' and not verbose:
+                continue
+            lines.append(f"  ⚠ {heading}: [{scene or '-'}] {KIND_LABELS[kind]}: {text}")
+    return '\n'.join(lines)
+
+
+def has_structural_gaps(result):
+    """シーン・分岐・画像に欠落があるかどうか"""
+    return any(kind != 'speaker' for _, kind, _ in result['missing'])
+
+
+def main(titles=None, verbose=False, jobs=None):
+    """output/ の各章をチェックして表示。欠落があれば 1 を返す"""
+    pairs = find_pairs(titles)
+    if not pairs:
+        print("チェックできる章がありません（ai_input と中身のある novel_output の組が必要です）。")
+        return 0
+    results = check_chapters(pairs, jobs=jobs)
+    for result in results:
+        print(format_result(result, verbose=verbose))
+    problems = [r['title'] for r in results if has_structural_gaps(r)]
+    print()
+    if problems:
+        print(f"⚠ シーン・分岐・画像の欠落がある章: {len(problems)}個")
+        return 1
+    print(f"✓ {len(results)}章すべてでシーン・分岐・画像がそろっています")
+    return 0
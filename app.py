@@ -1,8 +1,10 @@
 import streamlit as st
 import tempfile
 import os
+import time
 from pathlib import Path
 from simple_converter import extract_all_dialogues, create_html
+import app_jobs
 
 st.set_page_config(page_title="Excel→小説HTML変換ツール", layout="wide")
 
@@ -68,4 +70,42 @@ if uploaded_file is not None:
                     )
                     st.success("完成です！")
             else:
-                st.error("AIの変換結果を入力してください。")
\ No newline at end of file
+                st.error("AIの変換結果を入力してください。")
+
+
+# 複数のファイルをまとめて変換（AI変換なしで直接HTMLにする）
+st.divider()
+st.header("複数のファイルをまとめて変換")
+st.markdown("複数の main_*.xlsx（またはそれらをまとめたzip）を、AI変換なしでまとめてHTMLにします。"
+            "同じファイルをもう一度アップロードした場合は、前回の結果をすぐに返します。")
+
+batch_files = st.file_uploader("Excelファイル / zip", type=['xlsx', 'zip'], accept_multiple_files=True,
+                               key='batch_files')
+
+if batch_files and st.button("まとめて変換する"):
+    job = app_jobs.submit_uploads([(f.name, f.getvalue()) for f in batch_files])
+    st.session_state['batch_job'] = job.id
+
+job = app_jobs.get_job(st.session_state.get('batch_job'))
+if job is not None:
+    for message in job.skipped:
+        st.warning(f"読み飛ばしました: {message}")
+    rows, fraction = job.progress()
+    st.progress(fraction, text=f"{sum(1 for _, status, _ in rows if status.startswith('完了'))} / {len(rows)} ファイル")
+    st.table([{"ファイル": name, "状態": status, "内容": note} for name, status, note in rows])
+    
+    if job.finished:
+        if job.succeeded():
+            with open(job.zip_path, "rb") as f:
+                st.download_button(
+                    label=f"HTML（{len(job.succeeded())}ファイル）をzipでダウンロード",
+                    data=f,
+                    file_name="novel_html.zip",
+                    mime="application/zip"
+                )
+        else:
+            st.error("変換できたファイルがありません。")
+    else:
+        # 変換中は進み具合を更新し続ける
+        time.sleep(0.5)
+        st.rerun()
@@ -0,0 +1,384 @@
+"""
+アプリ（app.py）の複数ファイルの一括変換
+
+アップロードされた複数の .xlsx（または .xlsx をまとめたzip）を、バックグラウンドの
+プロセスプールで batch_converter.py --no-ai と同じようにHTMLに変換します。
+
+- ファイルごとの進み具合（待機中・変換中・完了・エラー）を ConversionJob.progress() で取得できます。
+- 変換できたHTMLは、完了した順に1つのzipファイル（output/uploads/jobs/）に追加します。
+  zipはディスク上に少しずつ書くので、全章のHTMLをメモリに載せることはありません。
+- 変換結果はアップロードの内容のハッシュ（ファイル名と描画処理の変更も含む）ごとに
+  output/uploads/ に保存し、同じファイルをもう一度アップロードした場合は変換せずにすぐ返します。
+  変換中に同じファイルがアップロードされた場合も、変換は1回だけ行います。
+  変換結果の合計が APP_JOBS["max_cache_mb"] を超えたら、最後に使ったのが古いものから削除します。
+
+Streamlit に依存しないので、ベンチマークなどから直接呼び出せます。
+"""
+
+import hashlib
+import io
+import itertools
+import json
+import os
+import shutil
+import threading
+import time
+import zipfile
+from pathlib import Path
+
+from output_writer import write_output, write_output_chunks
+
+try:
+    from config import APP_JOBS
+except ImportError:
+    APP_JOBS = {"max_workers": None, "max_file_mb": 200, "keep_jobs": 20, "max_cache_mb": 500}
+
+UPLOAD_DIR = Path('output') / 'uploads'
+JOBS_DIR = UPLOAD_DIR / 'jobs'
+
+STATUS_LABELS = {
+    'queued': '待機中',
+    'running': '変換中',
+    'done': '完了',
+    'cached': '完了（キャッシュ）',
+    'error': 'エラー',
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+_jobs = {}
+_jobs_lock = threading.Lock()
+_inflight = {}  # キャッシュのキー → 変換中の Future（同じファイルが同時にアップロードされた場合に共有する）
+_inflight_lock = threading.Lock()
+_job_ids = itertools.count(1)
+
+
+def expand_uploads(uploads, max_file_mb=None):
+    """アップロード [(ファイル名, 内容)] から、zipの中身も含めた .xlsx の一覧を返す
+
+    Returns:
+        ([(ファイル名, 内容)], [読み飛ばしたファイルとその理由])
+    """
+    max_bytes = (max_file_mb or APP_JOBS.get('max_file_mb', 200)) * 1024 * 1024
+    workbooks = []
+    skipped = []
+    for name, data in uploads:
+        if name.lower().endswith('.xlsx'):
+            if len(data) > max_bytes:
+                skipped.append(f"{name}（{len(data) / 1024 / 1024:,.0f} MB は大きすぎます）")
+                continue
+            workbooks.append((Path(name).name, data))
+            continue
+        if not name.lower().endswith('.zip'):
+            skipped.append(f"{name}（.xlsx / .zip ではありません）")
+            continue
+        try:
+            archive = zipfile.ZipFile(io.BytesIO(data))
+        except zipfile.BadZipFile:
+            skipped.append(f"{name}（zipファイルとして読めません）")
+            continue
+        with archive:
+            for info in archive.infolist():
+                member = Path(info.filename)
+                if info.is_dir() or member.suffix.lower() != '.xlsx' or '__MACOSX' in member.parts \
+                        or member.name.startswith('~$'):
+                    continue
+                if info.file_size > max_bytes:
+                    skipped.append(f"{name}: {member.name}（{info.file_size / 1024 / 1024:,.0f} MB は大きすぎます）")
+                    continue
+                workbooks.append((member.name, archive.read(info)))
+    return workbooks, skipped
+
+
+def upload_key(name, data):
+    """変換結果のキャッシュのキー（ファイル名・内容・描画処理のハッシュ）"""
+    from render_cache import renderer_fingerprint
+
+    digest = hashlib.sha256()
+    digest.update(renderer_fingerprint().encode('utf-8'))
+    digest.update(name.encode('utf-8') + b'\0')
+    digest.update(data)
+    return digest.hexdigest()[:24]
+
+
+def cached_result(key):
+    """キャッシュ済みの変換結果（なければ None）"""
+    result_path = UPLOAD_DIR / key / 'result.json'
+    try:
+        # 更新日時を「最後に使った日時」として整理に使う
+        os.utime(result_path)
+        with open(result_path, 'r', encoding='utf-8') as f:
+            result = json.load(f)
+    except FileNotFoundError:
+        return None
+    return result if Path(result['html']).exists() else None
+
+
+def _dir_size(path):
+    size = 0
+    for child in path.iterdir():
+        try:
+            size += child.stat().st_size
+        except FileNotFoundError:
+            continue
+    return size
+
+
+def prune_uploads(protected=(), max_mb=None):
+    """変換結果（output/uploads/<キー>/）の合計が max_cache_mb を超えた分を、最後に使ったのが古いものから削除する
+
+    Args:
+        protected: 削除しないキー（変換中・変換待ちのもの）
+
+    Returns:
+        (削除した変換結果の数, 削除したバイト数)
+    """
+    max_bytes = (max_mb or APP_JOBS.get('max_cache_mb', 500)) * 1024 * 1024
+    if not UPLOAD_DIR.exists():
+        return 0, 0
+    entries = []
+    for key_dir in UPLOAD_DIR.iterdir():
+        if key_dir == JOBS_DIR or not key_dir.is_dir():
+            continue
+        try:
+            try:
+                used = (key_dir / 'result.json').stat().st_mtime
+            except FileNotFoundError:  # 変換中か、変換できなかったもの
+                used = key_dir.stat().st_mtime
+            entries.append((used, _dir_size(key_dir), key_dir))
+        except FileNotFoundError:
+            continue
+    entries.sort(reverse=True)  # 最近使ったものから
+
+    total = 0
+    removed = removed_bytes = 0
+    for used, size, key_dir in entries:
+        total += size
+        if total <= max_bytes or key_dir.name in protected:
+            continue
+        shutil.rmtree(key_dir, ignore_errors=True)
+        removed += 1
+        removed_bytes += size
+    return removed, removed_bytes
+
+
+def convert_upload(name, workbook_path, key):
+    """1つのワークブックをHTMLに変換して結果を保存する（プロセスプールから呼ばれる）
+
+    Returns:
+        {'html': HTMLのパス, 'decisions': 分岐数, 'chars': 文字数, 'row_errors': 処理できなかった行数}
+    """
+    from batch_converter import extract_display_title, extract_title_from_filename
+    from simple_converter import iter_html, render_pages_cached
+    from story_rows import format_ai_input, iter_workbook_sheets
+
+    errors = []
+    try:
+        text, decision_count = format_ai_input(iter_workbook_sheets(workbook_path), errors)
+    finally:
+        os.remove(workbook_path)  # 結果だけをキャッシュに残す
+    html_path = UPLOAD_DIR / key / f'{extract_title_from_filename(name)}.html'
+    write_output_chunks(html_path, iter_html(render_pages_cached(text), extract_display_title(name)))
+    result = {'html': str(html_path), 'decisions': decision_count, 'chars': len(text), 'row_errors': len(errors)}
+    write_output(UPLOAD_DIR / key / 'result.json', json.dumps(result, ensure_ascii=False) + '\n')
+    return result
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            from concurrent.futures import ProcessPoolExecutor
+            _executor = ProcessPoolExecutor(max_workers=APP_JOBS.get('max_workers'))
+        return _executor
+
+
+def _submit_conversion(name, data, key):
+    """変換をプロセスプールに送る（同じキーを変換中なら、その Future を返す）"""
+    with _inflight_lock:
+        future = _inflight.get(key)
+        if future is not None:
+            return future
+        # ワーカーにはパスだけを渡す（アップロードの内容をプロセス間で受け渡さない）
+        workbook_path = UPLOAD_DIR / key / 'source.xlsx'
+        write_output(workbook_path, data)
+        future = _get_executor().submit(convert_upload, name, str(workbook_path), key)
+        _inflight[key] = future
+    future.add_done_callback(lambda f: _forget_inflight(key, f))
+    return future
+
+
+def _forget_inflight(key, future):
+    with _inflight_lock:
+        if _inflight.get(key) is future:
+            del _inflight[key]
+
+
+def shutdown():
+    """プロセスプールを止める（ベンチマークなど、アプリ以外から使った後の後片付け）"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown()
+            _executor = None
+
+
+class FileTask:
+    """ジョブの中の1ファイル"""
+
+    def __init__(self, name, key):
+        self.name = name
+        self.key = key
+        self.status = 'queued'
+        self.result = None
+        self.error = None
+        self.future = None
+        self.started = None
+        self.seconds = None
+
+    def state(self):
+        """表示用の状態（プールの空きを待っている間は 'queued'）"""
+        if self.status == 'queued' and self.future is not None and self.future.running():
+            return 'running'
+        return self.status
+
+
+class ConversionJob:
+    """アップロード1回分の変換
+
+    使い方:
+        job = submit_uploads([(ファイル名, 内容), ...])
+        job.progress()   # [(ファイル名, 状態, 補足)] と完了した割合
+        job.wait()       # すべて終わるまで待つ
+        job.zip_path     # 変換できたHTMLをまとめたzip（完了後）
+    """
+
+    def __init__(self, job_id, workbooks, skipped=()):
+        self.id = job_id
+        self.skipped = list(skipped)
+        self.tasks = [FileTask(name, upload_key(name, data)) for name, data in workbooks]
+        self.zip_path = JOBS_DIR / f'{os.getpid()}-{job_id}.zip'
+        self.created = time.time()
+        self._lock = threading.Lock()
+        self._finished = threading.Event()
+        self._remaining = len(self.tasks)
+        self._arcnames = set()
+        self.zip_path.parent.mkdir(parents=True, exist_ok=True)
+        self._zip = zipfile.ZipFile(self.zip_path, 'w', compression=zipfile.ZIP_DEFLATED)
+        if not self.tasks:
+            self._close()
+
+    def start(self, workbooks):
+        """キャッシュにないファイルをプロセスプールで変換し始める"""
+        for task, (name, data) in zip(self.tasks, workbooks):
+            result = cached_result(task.key)
+            if result is not None:
+                task.seconds = 0.0
+                self._finish(task, 'cached', result=result)
+                continue
+            task.started = time.perf_counter()
+            task.future = _submit_conversion(name, data, task.key)
+            task.future.add_done_callback(lambda f, task=task: self._on_done(task, f))
+        return self
+
+    def _on_done(self, task, future):
+        task.seconds = time.perf_counter() - task.started
+        try:
+            result = future.result()
+        except Exception as e:
+            self._finish(task, 'error', error=f'{type(e).__name__}: {e}')
+        else:
+            self._finish(task, 'done', result=result)
+
+    def _finish(self, task, status, result=None, error=None):
+        with self._lock:
+            task.result = result
+            task.error = error
+            if result is not None:
+                self._add_to_zip(Path(result['html']))
+            task.status = status
+            self._remaining -= 1
+            if self._remaining == 0:
+                self._close()
+
+    def _add_to_zip(self, html_path):
+        arcname = html_path.name
+        number = 2
+        while arcname in self._arcnames:  # 同じ名前のファイルが複数アップロードされた場合
+            arcname = f'{html_path.stem}-{number}{html_path.suffix}'
+            number += 1
+        self._arcnames.add(arcname)
+        self._zip.write(html_path, arcname)  # ファイルから少しずつ圧縮して追加される
+
+    def _close(self):
+        self._zip.close()
+        self._finished.set()
+
+    @property
+    def finished(self):
+        return self._finished.is_set()
+
+    def wait(self, timeout=None):
+        return self._finished.wait(timeout)
+
+    def progress(self):
+        """([(ファイル名, 状態の表示, 補足)], 完了した割合 0〜1)"""
+        rows = []
+        for task in self.tasks:
+            if task.status == 'error':
+                note = task.error
+            elif task.result is not None:
+                note = f"{task.result['chars']:,}文字, 分岐 {task.result['decisions']}個"
+                if task.seconds:
+                    note += f", {task.seconds:.1f}秒"
+            else:
+                note = ''
+            rows.append((task.name, STATUS_LABELS[task.state()], note))
+        done = sum(1 for task in self.tasks if task.status in ('done', 'cached', 'error'))
+        return rows, (done / len(self.tasks) if self.tasks else 1.0)
+
+    def succeeded(self):
+        return [task for task in self.tasks if task.status in ('done', 'cached')]
+
+
+def submit_uploads(uploads):
+    """アップロード [(ファイル名, 内容)] の変換を始めて ConversionJob を返す（すぐに戻ります）"""
+    workbooks, skipped = expand_uploads(uploads)
+    job = ConversionJob(next(_job_ids), workbooks, skipped)
+    with _jobs_lock:
+        _jobs[job.id] = job
+        _prune_jobs()
+        _prune_uploads()
+    return job.start(workbooks)
+
+
+def get_job(job_id):
+    return _jobs.get(job_id)
+
+
+def _prune_jobs():
+    """終わったジョブのうち、古いものを一覧とzipから削除する"""
+    keep = APP_JOBS.get('keep_jobs', 20)
+    finished = sorted((job for job in _jobs.values() if job.finished), key=lambda job: job.created)
+    for job in finished[:max(len(_jobs) - keep, 0)]:
+        del _jobs[job.id]
+        try:
+            os.remove(job.zip_path)
+        except FileNotFoundError:
+            pass
+
+
+def _prune_uploads():
+    """変換中・まだ終わっていないジョブの変換結果は残して、古い変換結果を削除する（_jobs_lock の中で呼ぶ）"""
+    protected = {task.key for job in _jobs.values() if not job.finished for task in job.tasks}
+    with _inflight_lock:
+        protected.update(_inflight)
+    prune_uploads(protected)
+
+
+def iter_zip_chunks(job, chunk_size=1 << 16):
+    """完成したzipを少しずつ返す（ダウンロード用）"""
+    job.wait()
+    with open(job.zip_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            yield chunk
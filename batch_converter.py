@@ -10,15 +10,29 @@
 使い方: python batch_converter.py
 """
 
+import contextlib
+import os
 import re
 from pathlib import Path
-from simple_converter import extract_all_dialogues, save_to_file, create_html
+from simple_converter import extract_all_dialogues, save_to_file, create_html_from_file, prepare_chapter_images
+from output_writer import format_write_stats
+from chunked_export import (load_manifest, merge_changed_output, missing_outputs, needs_stitch, stitch_outputs,
+                            stitch_problems, write_changed_scenes, write_chunks)
+from build_manifest import fingerprint_sheets, format_changes, is_current, record_scenes
+from story_rows import ChapterRows, format_ai_input, format_row_errors, iter_workbook_sheets
+from job_journal import StageTimer, compact, file_signature, is_rendered, load_state
+from story_events import events_path, open_event_stream, tee_events
+
+def chapter_sort_key(path):
+    """章番号順に並べるためのキー（main_2_… は main_10_… より前）"""
+    match = re.match(r'main_(\d+)_', path.name)
+    return (int(match.group(1)) if match else float('inf'), path.name)
 
 def get_excel_files():
-    """フォルダ内のすべてのmain_*.xlsxファイルを取得"""
+    """フォルダ内のすべてのmain_*.xlsxファイルを章番号順に取得"""
     current_dir = Path('.')
     excel_files = list(current_dir.glob('main_*.xlsx'))
-    return sorted(excel_files)
+    return sorted(excel_files, key=chapter_sort_key)
 
 def extract_title_from_filename(filename):
     """ファイル名からタイトルを抽出
@@ -39,12 +53,173 @@ def extract_display_title(filename):
         return match.group(1)
     return filename.replace('.xlsx', '')
 
-def process_excel_file(excel_path, skip_ai=False):
+def find_novel_source(title, skip_ai=False):
+    """HTMLの元になるテキストファイルを返す（まだない場合は None）
+    
+    --no-ai の場合は ai_input、それ以外は novel_output を使います。
+    """
+    source = Path('output') / (f'ai_input_{title}.txt' if skip_ai else f'novel_output_{title}.txt')
+    if source.exists() and source.stat().st_size > 0:
+        return source
+    return None
+
+def make_volume_title(display_titles):
+    """複数の章をまとめたときのタイトル（共通部分、なければ最初の章のタイトル）
+    例: 暗黒時代・上, 暗黒時代・下 → 暗黒時代
+    """
+    common = os.path.commonprefix(display_titles).rstrip('・･ 　-_')
+    return common or display_titles[0]
+
+def build_batch_epubs(excel_files, skip_ai=False, use_images=False, volume=False):
+    """HTMLを生成できた章のEPUBを作る（章ごとに並列、または1冊にまとめる）"""
+    from epub_export import build_epubs
+    
+    chapters = []
+    image_maps = {}
+    for excel_file in excel_files:
+        title = extract_title_from_filename(excel_file.name)
+        source = find_novel_source(title, skip_ai=skip_ai)
+        if source is None:
+            continue
+        chapters.append((title, extract_display_title(excel_file.name), source))
+        if use_images:
+            with open(source, 'r', encoding='utf-8') as f:
+                image_maps[title] = prepare_chapter_images(f)
+    
+    if not chapters:
+        print("\n⚠ EPUBにできる章がありません。")
+        return
+    
+    volume_title = make_volume_title([c[1] for c in chapters]) if volume else None
+    print(f"\nEPUBを生成中... ({len(chapters)}章{'、1冊にまとめます' if volume else ''})")
+    for epub_path in build_epubs(chapters, volume_title=volume_title, image_maps=image_maps):
+        print(f"✓ EPUBファイルを生成しました: {epub_path}")
+
+def build_batch_volume(excel_files, skip_ai=False, use_images=False, extras=None):
+    """HTMLを生成できた章を1つのHTML（output/volume.html）にまとめる"""
+    from volume_html import create_volume_html
+    
+    chapters = []
+    display_titles = []
+    for excel_file in excel_files:
+        title = extract_title_from_filename(excel_file.name)
+        source = find_novel_source(title, skip_ai=skip_ai)
+        if source is None:
+            continue
+        image_map = None
+        if use_images:
+            with open(source, 'r', encoding='utf-8') as f:
+                image_map = prepare_chapter_images(f)
+        display_title = extract_display_title(excel_file.name)
+        chapters.append((display_title, source, image_map))
+        display_titles.append(display_title)
+    
+    if not chapters:
+        print("\n⚠ まとめられる章がありません。")
+        return
+    
+    print(f"\n{len(chapters)}章を1つのHTMLにまとめています...")
+    html_path = create_volume_html(chapters, 'volume.html', title=make_volume_title(display_titles), extras=extras)
+    print(f"✓ まとめ読み用HTMLを生成しました: {html_path}")
+
+def prepare_chunks(title):
+    """ai_input を分割し、AIの出力を貼り付ける空のパートファイルを作る"""
+    with open(Path('output') / f'ai_input_{title}.txt', 'r', encoding='utf-8') as f:
+        manifest, stale_outputs = write_chunks(title, f.read())
+    print(f"✓ ai_input を{len(manifest['parts'])}個に分割しました: output/ai_input_{title}.manifest.json")
+    for stale in stale_outputs:
+        print(f"  ⚠ 分割が変わったため、古いAIの出力を {stale.name} に退避しました")
+    for part in manifest['parts']:
+        print(f"  - {part['input']} ({part['chars']:,} 文字, 約{part['estimated_tokens']:,} トークン)")
+        part_output = Path('output') / part['output']
+        if not part_output.exists():
+            part_output.touch()
+
+def export_events(excel_path, title):
+    """抽出済みのワークブックの物語データを events_[タイトル].ndjson に書き出す"""
+    from story_events import export_workbook
+    with open_event_stream(events_path(title)) as write_event:
+        count = export_workbook(excel_path, write_event)
+    print(f"✓ 物語データを書き出しました（{count:,}件）: {events_path(title)}")
+
+def record_converted(excel_path, novel_output_path, journal_state=None):
+    """AIの出力が用意されたことをジョブ記録に残す（前回の記録から変わった場合だけ）
+    
+    Args:
+        journal_state: 一括処理の開始時に読み込んだ load_state() の結果（記録した内容も反映します）。
+            None の場合はジョブ記録を読み込みます
+    """
+    if journal_state is None:
+        journal_state = load_state()
+    signature = file_signature(novel_output_path)
+    stages = journal_state.setdefault(excel_path.name, {})
+    last = stages.get('converted')
+    if last and last['status'] == 'done' and last.get('source_signature') == signature:
+        return
+    stages['converted'] = StageTimer(excel_path.name, 'converted').done(source=str(novel_output_path),
+                                                                        source_signature=signature)
+
+def is_completed(excel_path, journal_state, skip_ai=False, use_images=False, extras=None):
+    """ジョブ記録から、このファイルのHTMLが最新かどうかを判定（ワークブックもファイルも書き換えない）
+    
+    AIの出力のパートがそろってまだつなげていない場合は、完了していないものとして扱います
+    （つなげるのは process_excel_file で行います）。
+    """
+    title = extract_title_from_filename(excel_path.name)
+    if needs_stitch(title):
+        return False
+    source = find_novel_source(title, skip_ai=skip_ai)
+    return is_rendered(journal_state, excel_path, source, render_options(skip_ai, use_images, extras))
+
+def render_options(skip_ai=False, use_images=False, extras=None):
+    """HTMLの内容に影響するオプションと描画処理（ジョブ記録で前回の実行と比べるため）"""
+    from render_cache import renderer_fingerprint
+    extras = extras or {}
+    font = extras.get('font')
+    return {'skip_ai': skip_ai, 'images': use_images, 'font': str(font) if font else None,
+            'offline': bool(extras.get('offline')), 'renderer': renderer_fingerprint()}
+
+def render_chapter(excel_path, source_path, html_file, display_title, skip_ai=False, use_images=False,
+                   extras=None):
+    """HTMLを生成してジョブ記録に残す（失敗した場合もエラー内容を記録して False を返す）
+    
+    テキストファイルは丸ごと読み込まず、段落ごとに読みながら描画します。
+    extras（--font / --offline）で追加するものも、書き出す前にテンプレートに入れます。
+    """
+    timer = StageTimer(excel_path.name, 'rendered')
+    try:
+        image_map = None
+        if use_images:
+            with open(source_path, 'r', encoding='utf-8') as f:
+                image_map = prepare_chapter_images(f)
+        html_path = create_html_from_file(source_path, output_file=html_file, title=display_title,
+                                          image_map=image_map, extras=extras)
+    except Exception as e:
+        timer.failed(e)
+        print(f"エラーが発生しました: {e}")
+        return False
+    timer.done(workbook_signature=file_signature(excel_path), source=str(source_path),
+               source_signature=file_signature(source_path),
+               options=render_options(skip_ai, use_images, extras),
+               output=str(html_path))
+    print(f"✓ HTMLファイルを生成しました: {html_path}")
+    return True
+
+def process_excel_file(excel_path, skip_ai=False, use_images=False, use_chunks=False, chapters=None,
+                       only_changed=False, events=False, journal_state=None, extras=None):
     """1つのExcelファイルを処理
     
     Args:
         excel_path: Excelファイルのパス
         skip_ai: Trueの場合、AI変換をスキップして直接HTML生成
+        use_images: Trueの場合、画像をローカルキャッシュから縮小版で表示
+        use_chunks: Trueの場合、ai_input をAIに送れる大きさに分割して保存
+        chapters: 辞書を渡すと、抽出した行を ChapterRows として {ファイル名: ChapterRows} に追加
+        only_changed: Trueの場合、前回の抽出からExcelが変わっていれば抽出し直し、
+            変わったシーンだけを ai_input_[タイトル]_changed.txt に書き出す
+        events: Trueの場合、抽出しながら物語データを events_[タイトル].ndjson に書き出す
+        journal_state: 一括処理の開始時に読み込んだジョブ記録（load_state() の結果）
+        extras: HTMLに追加するもの（simple_converter.html_additions() を参照）
     """
     print("\n" + "=" * 80)
     print(f"処理中: {excel_path.name}")
@@ -64,106 +239,38 @@ def process_excel_file(excel_path, skip_ai=False):
     # ai_input ファイルが存在するかチェック
     ai_input_path = Path('output') / ai_input_file
     
-    if not ai_input_path.exists():
-        print(f"\n{ai_input_file} が見つかりません。Excelからデータを抽出します...\n")
+    # --changed の場合は、前回の抽出からExcelが変わっていれば抽出し直す
+    reextract = only_changed and ai_input_path.exists() and not is_current(excel_path)
+    if not ai_input_path.exists() or reextract:
+        if reextract:
+            print(f"\n{excel_path.name} が前回の抽出から変わっています。Excelからデータを抽出し直します...\n")
+        else:
+            print(f"\n{ai_input_file} が見つかりません。Excelからデータを抽出します...\n")
         
         # Excelファイル名を一時的に保存
         import simple_converter
         original_excel = getattr(simple_converter, 'EXCEL_FILE', None)
         
         # extract_all_dialogues を直接呼び出す代わりに、Excelを読み込む
+        errors = []
+        scenes = []  # シートごとの指紋（build_manifest.json に記録）
+        timer = StageTimer(excel_path.name, 'extracted')
         try:
-            import openpyxl
-            wb = openpyxl.load_workbook(excel_path)
-            
-            all_text = []
-            decision_count = 0
-            
-            # config から設定を読み込み
-            try:
-                from config import DOCTOR_NAME
-            except ImportError:
-                DOCTOR_NAME = "ドクター"
-            
-            for sheet_name in wb.sheetnames:
-                sheet = wb[sheet_name]
-                
-                all_text.append(f"\n\n{'=' * 60}")
-                all_text.append(f"【シーン: {sheet_name}】")
-                all_text.append(f"{'=' * 60}\n")
-                
-                in_decision = False
-                current_options = []
-                choices_already_displayed = False  # 選択肢を一度表示したかどうか
-                
-                for row in range(1, sheet.max_row + 1):
-                    col2 = sheet.cell(row=row, column=2).value
-                    col3 = sheet.cell(row=row, column=3).value
-                    
-                    if not col3:
-                        continue
-                    
-                    # 分岐システムの処理
-                    if col2 == '--Decision--':
-                        in_decision = True
-                        decision_count += 1
-                        current_options = []
-                        choices_already_displayed = False  # リセット
-                        continue
-                    
-                    if col2 == '--Decision End--':
-                        in_decision = False
-                        # 全ての選択肢を最初の1回だけ表示
-                        if current_options and not choices_already_displayed:
-                            all_text.append('\n【ドクターの選択肢】')
-                            all_text.extend(current_options)
-                            all_text.append('')
-                            choices_already_displayed = True
-                        continue
-                    
-                    if in_decision and col2 and col2.startswith('Option_'):
-                        option_num = col2.replace('Option_', '')
-                        current_options.append(f"  選択肢{option_num}: {col3}")
-                        continue
-                    
-                    if col2 == '--Branch--':
-                        branch_info = col3.strip() if col3 else ''
-                        all_text.append(f'\n【分岐: {branch_info}】')
-                        
-                        # >Options_X または >Options_X&Y&Z から番号を抽出
-                        import re
-                        # >Options_1&2&3 のような複数選択肢にも対応
-                        match = re.search(r'>Options_([0-9&]+)', branch_info)
-                        if match and current_options:
-                            option_nums_str = match.group(1)
-                            # &で分割して複数の番号を取得
-                            option_nums = [int(n) for n in option_nums_str.split('&')]
-                            # 各選択肢を表示
-                            for option_num in option_nums:
-                                if 0 < option_num <= len(current_options):
-                                    all_text.append(current_options[option_num - 1])
-                        continue
-                    
-                    # 画像
-                    if col2 == '--imagetween--':
-                        all_text.append(f'\n[画像]: {col3}')
-                        continue
-                    
-                    if col2 == '--image--':
-                        all_text.append(f'\n[背景]: {col3}')
-                        continue
-                    
-                    # 話者とセリフ
-                    if col2 and col2 not in ['----', '--imagetween--', '--Decision--', '--Decision End--', '--Branch--']:
-                        speaker = col2.strip()
-                        dialogue = col3.strip() if col3 else ''
-                        
-                        # {@nickname} を DOCTOR_NAME に置換
-                        dialogue = dialogue.replace('{@nickname}', DOCTOR_NAME)
-                        
-                        all_text.append(f'【{speaker}】{dialogue}')
-            
-            dialogues = '\n'.join(all_text)
+            if chapters is not None:
+                # 列ごとにまとめて読み込み、コーパスDBへの取り込みにも使い回す
+                chapter = ChapterRows.from_workbook(excel_path)
+                chapters[excel_path.name] = chapter
+                sheets = chapter.iter_sheets()
+            else:
+                sheets = iter_workbook_sheets(excel_path)
+            sheets = fingerprint_sheets(sheets, scenes)
+            with open_event_stream(events_path(title) if events else None) as write_event:
+                dialogues, decision_count = format_ai_input(tee_events(sheets, write_event, excel_path.name),
+                                                            errors)
+            if errors:
+                print(format_row_errors(errors))
+            if events:
+                print(f"✓ 物語データを書き出しました: {events_path(title)}")
             
             print(f"\n検出した分岐数: {decision_count}")
             print(f"総文字数: {len(dialogues):,} 文字")
@@ -171,42 +278,60 @@ def process_excel_file(excel_path, skip_ai=False):
             # 保存
             output_path = save_to_file(dialogues, ai_input_file)
             print(f"\n✓ AIに送信するデータを保存しました: {output_path}")
+            timer.done(workbook_signature=file_signature(excel_path), decisions=decision_count,
+                       chars=len(dialogues), row_errors=[list(error) for error in errors])
+            changes = record_scenes(excel_path, scenes)
+            if changes is not None:
+                print(format_changes(excel_path.name, changes, '（前回の抽出との差分）'))
             
             # --no-ai オプションの場合は直接HTML生成
             if skip_ai:
                 print(f"\n✓ AI変換をスキップして直接HTML生成します...")
-                html_path = create_html(dialogues, output_file=html_file, title=display_title)
-                print(f"✓ HTMLファイルを生成しました: {html_path}")
-                return True
+                return render_chapter(excel_path, output_path, html_file, display_title,
+                                      skip_ai=True, use_images=use_images, extras=extras)
             
             # 空の novel_output ファイルも生成
-            novel_output_path = Path('output') / novel_output_file
-            if not novel_output_path.exists():
-                novel_output_path.touch()
-                print(f"✓ 空の {novel_output_file} を作成しました（AIの出力をここに貼り付けてください）")
+            novel_output_path = ensure_novel_output(title)
+            if reextract and changes and novel_output_path.stat().st_size > 0:
+                # 変わったシーンだけをAIに送り直せるようにする
+                names = write_changed_scenes(title, dialogues, set(changes['added']) | set(changes['changed']))
+                if names:
+                    print(f"✓ 変わったシーン {len(names)}個を output/ai_input_{title}_changed.txt に保存しました")
+                    print(f"  AIの出力を output/novel_output_{title}_changed.txt に保存すると、"
+                          f"{novel_output_file} の同じシーンと置き換えます")
             
         except Exception as e:
+            timer.failed(e)
             print(f"エラーが発生しました: {e}")
             return False
     else:
         print(f"✓ {ai_input_file} が既に存在します。")
         
+        # --events で、まだ物語データを書き出していない場合は書き出す
+        if events and not events_path(title).exists():
+            export_events(excel_path, title)
+        
         # --no-ai オプションの場合は ai_input から直接HTML生成
         if skip_ai:
             ai_input_path = Path('output') / ai_input_file
             if ai_input_path.exists() and ai_input_path.stat().st_size > 0:
                 print(f"\n✓ AI変換をスキップして直接HTML生成します...")
-                with open(ai_input_path, 'r', encoding='utf-8') as f:
-                    dialogues = f.read()
-                html_path = create_html(dialogues, output_file=html_file, title=display_title)
-                print(f"✓ HTMLファイルを生成しました: {html_path}")
-                return True
+                return render_chapter(excel_path, ai_input_path, html_file, display_title,
+                                      skip_ai=True, use_images=use_images, extras=extras)
         
         # 空の novel_output ファイルも生成（存在しない場合のみ）
-        novel_output_path_temp = Path('output') / novel_output_file
-        if not novel_output_path_temp.exists():
-            novel_output_path_temp.touch()
-            print(f"✓ 空の {novel_output_file} を作成しました（AIの出力をここに貼り付けてください）")
+        ensure_novel_output(title)
+    
+    # --chunk オプションの場合は ai_input を分割する
+    if use_chunks:
+        prepare_chunks(title)
+    
+    # 分割した ai_input がある場合は、AIの出力のパートを番号順につなげる
+    if not stitch_chunk_outputs(title):
+        return False
+    
+    # 変わったシーンだけのAIの出力があれば、novel_output に反映する
+    apply_changed_output(title)
     
     # novel_output ファイルが存在するかチェック
     novel_output_path = Path('output') / novel_output_file
@@ -218,13 +343,9 @@ def process_excel_file(excel_path, skip_ai=False):
             return False
         
         print(f"\n✓ {novel_output_file} が見つかりました。HTMLを生成します...")
-        
-        with open(novel_output_path, 'r', encoding='utf-8') as f:
-            novel_text = f.read()
-        
-        html_path = create_html(novel_text, output_file=html_file, title=display_title)
-        print(f"✓ HTMLファイルを生成しました: {html_path}")
-        return True
+        record_converted(excel_path, novel_output_path, journal_state)
+        return render_chapter(excel_path, novel_output_path, html_file, display_title,
+                              use_images=use_images, extras=extras)
     else:
         print(f"\n⚠ {novel_output_file} がまだありません。")
         print(f"1. output/{ai_input_file} をAIに送信")
@@ -232,11 +353,87 @@ def process_excel_file(excel_path, skip_ai=False):
         print(f"3. このスクリプトを再実行")
         return False
 
-def main():
+def ensure_novel_output(title):
+    """空の novel_output_[タイトル].txt を作る（すでにある場合は何もしない）"""
+    novel_output_path = Path('output') / f'novel_output_{title}.txt'
+    if not novel_output_path.exists():
+        novel_output_path.touch()
+        print(f"✓ 空の {novel_output_path.name} を作成しました（AIの出力をここに貼り付けてください）")
+    return novel_output_path
+
+def stitch_chunk_outputs(title):
+    """分割した ai_input がある場合は、AIの出力のパートを番号順につなげる
+    
+    Returns:
+        HTMLの元になるAIの出力があるか（パートがそろわず、つなげたものもない場合は False）
+    """
+    manifest = load_manifest(title)
+    if manifest is None:
+        return True
+    novel_output_file = f'novel_output_{title}.txt'
+    if stitch_outputs(title):
+        print(f"✓ {len(manifest['parts'])}個のパートをつなげました: output/{novel_output_file}")
+    elif not missing_outputs(manifest) and stitch_problems(manifest):
+        print(f"\n⚠ AIの出力のパートをつなげませんでした:")
+        for problem in stitch_problems(manifest):
+            print(f"  - {problem}")
+        if not find_novel_source(title):
+            return False
+    elif not find_novel_source(title):
+        missing = missing_outputs(manifest)
+        print(f"\n⚠ AIの出力のパートがそろっていません（{len(missing)}/{len(manifest['parts'])}個が空です）:")
+        for part_file in missing:
+            print(f"  - output/{part_file}")
+        return False
+    return True
+
+def apply_changed_output(title):
+    """変わったシーンだけのAIの出力（novel_output_[タイトル]_changed.txt）があれば、novel_output に反映する"""
+    merged = merge_changed_output(title)
+    if merged is None:
+        return
+    count, missing = merged
+    if missing:
+        print(f"\n⚠ 変わったシーンのAIの出力にないシーンがあるため、反映しませんでした:")
+        for name in missing:
+            print(f"  - {name}")
+    else:
+        print(f"✓ 変わったシーン {count}個を novel_output_{title}.txt に反映しました")
+
+def main(argv=None):
     import sys
     
-    # コマンドライン引数チェック
-    skip_ai = '--no-ai' in sys.argv or '--direct' in sys.argv
+    # コマンドライン引数チェック（cli.py batch からは argv で渡される）
+    if argv is None:
+        argv = sys.argv[1:]
+    skip_ai = '--no-ai' in argv or '--direct' in argv
+    use_corpus = '--corpus' in argv
+    use_images = '--images' in argv
+    use_chunks = '--chunk' in argv
+    epub_volume = '--epub=volume' in argv
+    make_epub = epub_volume or '--epub' in argv
+    make_volume = '--volume' in argv
+    resume = '--resume' in argv
+    only_changed = '--changed' in argv
+    # --font でフォントのサブセットを追加（--font=パス で config.py の FONT_SUBSET 以外のフォントを使う）
+    font_arg = next((a for a in argv if a == '--font' or a.startswith('--font=')), None)
+    # --offline でオフライン用のサービスワーカー（sw.js と precache-manifest.json）を作る
+    make_offline = '--offline' in argv
+    # --events で物語データを1行1イベントのNDJSON（events_[タイトル].ndjson）で書き出す
+    events = '--events' in argv
+    # --pipeline で読み込み・抽出・描画・書き出しを重ねて処理（--queue-depth=N で段階の間のキューの長さ）
+    use_pipeline = '--pipeline' in argv
+    depth_arg = next((a for a in argv if a.startswith('--queue-depth=')), None)
+    queue_depth = int(depth_arg.partition('=')[2]) if depth_arg else None
+    # --jobs=N / --max-memory=SIZE で複数のファイルを並列に処理（大きいファイルから、メモリの予算内で）
+    jobs_arg = next((a for a in argv if a.startswith('--jobs=')), None)
+    jobs = int(jobs_arg.partition('=')[2]) if jobs_arg else None
+    memory_arg = next((a for a in argv if a.startswith('--max-memory=')), None)
+    max_memory = None
+    if memory_arg:
+        from batch_scheduler import parse_size
+        max_memory = parse_size(memory_arg.partition('=')[2])
+    use_scheduler = (jobs is not None and jobs > 1) or max_memory is not None
     
     print("\n" + "=" * 80)
     if skip_ai:
@@ -257,13 +454,88 @@ def main():
     for f in excel_files:
         print(f"  - {f.name}")
     
+    # --font の場合は章ごとのサブセットの @font-face を、--offline の場合はサービスワーカーの
+    # 登録スクリプトを、HTMLを書き出すときに入れる
+    extras = None
+    if font_arg is not None or make_offline:
+        extras = {'font': None, 'offline': make_offline}
+        if font_arg is not None:
+            from font_subset import usable_font
+            extras['font'] = usable_font(font_arg.partition('=')[2] or None)
+    
     print("\n処理を開始します...\n")
     
-    # 各ファイルを処理
+    # 各ファイルを処理（--corpus の場合は抽出した行をコーパスDBへの取り込みに使い回す）
     results = {}
-    for excel_file in excel_files:
-        success = process_excel_file(excel_file, skip_ai=skip_ai)
-        results[excel_file.name] = success
+    chapters = {} if use_corpus else None
+    # ジョブ記録は最初に1回だけ読み込み、古い記録を詰め直してから各ファイルの処理で使い回す
+    journal_state = load_state()
+    compact(journal_state)
+    resumed = 0
+    if use_pipeline and (use_chunks or only_changed):
+        print("⚠ --chunk / --changed と一緒には --pipeline を使えないため、1ファイルずつ処理します。\n")
+        use_pipeline = False
+    if use_pipeline and use_scheduler:
+        print("⚠ --jobs / --max-memory と一緒には --pipeline を使えないため、--pipeline は無視します。\n")
+        use_pipeline = False
+    pending_files = []
+    # --font の場合、サブセットはプロセスプールで並列に作る（--jobs では章ごとのプロセスの中で作る）
+    font_pool = contextlib.nullcontext()
+    if extras and extras.get('font') and not use_scheduler:
+        from font_subset import subset_pool
+        font_pool = subset_pool()
+    with font_pool:
+        for excel_file in excel_files:
+            # --resume の場合、前回HTMLまで完了していて入力が変わっていないファイルは読み飛ばす
+            if resume and is_completed(excel_file, journal_state, skip_ai=skip_ai, use_images=use_images,
+                                       extras=extras):
+                print(f"✓ {excel_file.name}: 前回の実行で完了済み（スキップ）")
+                results[excel_file.name] = True
+                resumed += 1
+                continue
+            if use_pipeline or use_scheduler:
+                results[excel_file.name] = False  # 結果の表示順をファイル順にそろえる
+                pending_files.append(excel_file)
+                continue
+            success = process_excel_file(excel_file, skip_ai=skip_ai, use_images=use_images,
+                                         use_chunks=use_chunks, chapters=chapters, only_changed=only_changed,
+                                         events=events, journal_state=journal_state, extras=extras)
+            results[excel_file.name] = success
+        if pending_files and use_scheduler:
+            # 別のプロセスで処理するので、コーパスDBへの取り込みではExcelを読み直す
+            from batch_scheduler import format_report, run_scheduled
+            scheduled_results, report, elapsed = run_scheduled(
+                pending_files, jobs=jobs, max_memory=max_memory, skip_ai=skip_ai, use_images=use_images,
+                use_chunks=use_chunks, only_changed=only_changed, events=events, journal_state=journal_state,
+                extras=extras)
+            results.update(scheduled_results)
+            print("\n" + format_report(report, elapsed, jobs=jobs, max_memory=max_memory))
+        elif pending_files:
+            from batch_pipeline import format_metrics, run_pipeline
+            pipeline_results, metrics, elapsed = run_pipeline(
+                pending_files, skip_ai=skip_ai, use_images=use_images, chapters=chapters, queue_depth=queue_depth,
+                events=events, journal_state=journal_state, extras=extras)
+            results.update(pipeline_results)
+            print("\n" + format_metrics(metrics, elapsed))
+        
+        # --volume オプションの場合は全章を1つのHTMLにまとめる
+        if make_volume:
+            build_batch_volume(excel_files, skip_ai=skip_ai, use_images=use_images, extras=extras)
+    
+    # --offline オプションの場合は、公開するHTML（とフォント）をあらかじめキャッシュするサービスワーカーを作る
+    if make_offline:
+        from offline_cache import main as write_offline_files
+        write_offline_files()
+    
+    # --epub オプションの場合はEPUBも生成（--epub=volume で1冊にまとめる）
+    if make_epub:
+        build_batch_epubs(excel_files, skip_ai=skip_ai, use_images=use_images, volume=epub_volume)
+    
+    # --corpus オプションの場合は会話データをSQLiteに取り込む
+    if use_corpus:
+        from corpus_db import connect, ingest_workbooks, DEFAULT_DB_PATH
+        print(f"\nコーパスDBに取り込み中: {DEFAULT_DB_PATH}")
+        ingest_workbooks(connect(), excel_files, chapters=chapters)
     
     # 結果サマリー
     print("\n" + "=" * 80)
@@ -273,8 +545,9 @@ def main():
     completed = sum(1 for v in results.values() if v)
     pending = sum(1 for v in results.values() if not v)
     
-    print(f"✓ HTML生成完了: {completed}個")
-    print(f"⚠ AI変換待ち: {pending}個\n")
+    print(f"✓ HTML生成完了: {completed}個" + (f"（うち前回完了済み {resumed}個）" if resumed else ''))
+    print(f"⚠ AI変換待ち: {pending}個")
+    print(f"{format_write_stats()}\n")
     
     if pending > 0:
         print("AI変換待ちのファイル:")
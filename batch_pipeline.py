@@ -0,0 +1,271 @@
+"""
+一括処理のパイプライン（batch_converter.py --pipeline）
+
+通常の一括処理は1章ずつ「Excelの読み込み → 抽出 → テキストの保存 → 読み直し →
+描画 → HTMLの書き出し」を順番に行います。パイプラインでは次の4つの段階を
+別々のスレッドで動かし、段階の間を長さに上限のあるキューでつなぎます。
+
+    読み込み → 抽出 → 描画 → 書き出し
+
+ある章を描画している間に次の章のExcelを読み込む、というように段階が章をまたいで重なります。
+描画は通常の一括処理と同じく、テキストファイルを段落ごとに読みながら行い、ページは
+一時ファイルにためて書き出しに渡すので、テキスト全体をメモリに載せることはありません。
+キューの長さ（--queue-depth）で、同時に読み込まれているワークブックの数が決まります。
+
+終了時に段階ごとの処理件数・処理時間・入力待ち（前の段階を待った時間）・
+出力待ち（次の段階が空くのを待った時間）を表示するので、どこが詰まっているかがわかります。
+"""
+
+import queue
+import threading
+import time
+from pathlib import Path
+
+from batch_converter import (apply_changed_output, ensure_novel_output, export_events, extract_display_title,
+                             extract_title_from_filename, record_converted, render_options, stitch_chunk_outputs)
+from build_manifest import fingerprint_sheets, format_changes, record_scenes
+from job_journal import StageTimer, file_signature
+from output_writer import write_output_chunks
+from simple_converter import html_additions, iter_html, prepare_chapter_images, render_file_pages, save_to_file
+from story_events import events_path, open_event_stream, tee_events
+from story_rows import ChapterRows, format_ai_input, format_row_errors
+
+try:
+    from config import PIPELINE
+except ImportError:
+    PIPELINE = {"queue_depth": 2}
+
+STAGE_LABELS = {
+    'load': '読み込み',
+    'extract': '抽出',
+    'render': '描画',
+    'write': '書き出し',
+}
+
+
+class ChapterJob:
+    """パイプラインを流れる1章分の状態"""
+
+    def __init__(self, excel_path, skip_ai=False, use_images=False, events=False, journal_state=None,
+                 extras=None):
+        self.excel_path = Path(excel_path)
+        self.title = extract_title_from_filename(self.excel_path.name)
+        self.display_title = extract_display_title(self.excel_path.name)
+        self.skip_ai = skip_ai
+        self.use_images = use_images
+        self.events = events
+        self.journal_state = journal_state
+        self.extras = extras
+        self.ai_input_path = Path('output') / f'ai_input_{self.title}.txt'
+        self.novel_output_path = Path('output') / f'novel_output_{self.title}.txt'
+        self.chapter = None   # 抽出が必要な場合の ChapterRows
+        self.source = None    # HTMLの元になるテキストファイル（描画の段階で段落ごとに読む）
+        self.pages = None     # 描画したページ（RenderedPages）
+        self.timer = None     # 失敗したときに記録する段階
+        self.error = None
+        self.success = False
+
+    def release(self):
+        """描画したページの一時ファイルを閉じる（書き出さずにパイプラインを抜ける場合）"""
+        if self.pages is not None:
+            self.pages.close()
+            self.pages = None
+
+
+class StageMetrics:
+    """1つの段階の処理件数と時間"""
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy = 0.0
+        self.wait_in = 0.0
+        self.wait_out = 0.0
+
+    def throughput(self):
+        return self.items / self.busy if self.busy else 0.0
+
+
+def _has_text(path):
+    return path.exists() and path.stat().st_size > 0
+
+
+def _use_novel_output(job):
+    """AIの出力のパートをつなげ、変わったシーンを反映してから、AIの出力をHTMLの元にする
+
+    process_excel_file と同じ処理です。
+    """
+    ensure_novel_output(job.title)
+    if not stitch_chunk_outputs(job.title):
+        return
+    apply_changed_output(job.title)
+    if _has_text(job.novel_output_path):
+        record_converted(job.excel_path, job.novel_output_path, job.journal_state)
+        job.source = job.novel_output_path
+    else:
+        print(f"⚠ {job.novel_output_path.name} がまだありません（または空です）。")
+
+
+def load_stage(job):
+    """Excelを読み込む（抽出済みの場合は、HTMLの元になるテキストを読み込む）"""
+    if not job.ai_input_path.exists():
+        job.timer = StageTimer(job.excel_path.name, 'extracted')
+        job.chapter = ChapterRows.from_workbook(job.excel_path)
+        return
+    if job.events and not events_path(job.title).exists():
+        export_events(job.excel_path, job.title)
+
+    if job.skip_ai and _has_text(job.ai_input_path):
+        job.source = job.ai_input_path
+        return
+    _use_novel_output(job)
+
+
+def extract_stage(job, chapters=None):
+    """抽出して ai_input を保存する"""
+    if job.chapter is None:
+        return
+    errors = []
+    scenes = []
+    sheets = fingerprint_sheets(job.chapter.iter_sheets(), scenes)
+    with open_event_stream(events_path(job.title) if job.events else None) as write_event:
+        dialogues, decision_count = format_ai_input(tee_events(sheets, write_event, job.excel_path.name), errors)
+    if errors:
+        print(f"{job.excel_path.name}:\n{format_row_errors(errors)}")
+    output_path = save_to_file(dialogues, job.ai_input_path.name)
+    print(f"✓ {job.excel_path.name}: 分岐 {decision_count}個, {len(dialogues):,} 文字 → {output_path}")
+    job.timer.done(workbook_signature=file_signature(job.excel_path), decisions=decision_count,
+                   chars=len(dialogues), row_errors=[list(error) for error in errors])
+    job.timer = None
+    changes = record_scenes(job.excel_path, scenes)
+    if changes is not None:
+        print(format_changes(job.excel_path.name, changes, '（前回の抽出との差分）'))
+
+    # --corpus の場合は抽出した行をコーパスDBへの取り込みに使い回す
+    if chapters is not None:
+        chapters[job.excel_path.name] = job.chapter
+    job.chapter = None
+
+    if job.skip_ai:
+        job.source = output_path
+        return
+    _use_novel_output(job)
+
+
+def render_stage(job):
+    """テキストファイルを段落ごとに読みながらページのHTMLにする（描画キャッシュがあればそこから）"""
+    if job.source is None:
+        return
+    job.timer = StageTimer(job.excel_path.name, 'rendered')
+    image_map = None
+    if job.use_images:
+        with open(job.source, 'r', encoding='utf-8') as f:
+            image_map = prepare_chapter_images(f)
+    job.pages = render_file_pages(job.source, image_map=image_map)
+
+
+def write_stage(job):
+    """HTMLを書き出してジョブ記録に残す"""
+    if job.pages is None:
+        return
+    html_path = Path('output') / f'{job.title}.html'
+    with job.pages as pages:
+        job.pages = None
+        additions = html_additions(html_path, job.display_title, pages, job.extras)
+        write_output_chunks(html_path, iter_html(pages, job.display_title, additions))
+    job.timer.done(workbook_signature=file_signature(job.excel_path), source=str(job.source),
+                   source_signature=file_signature(job.source),
+                   options=render_options(job.skip_ai, job.use_images, job.extras), output=str(html_path))
+    job.timer = None
+    job.success = True
+    print(f"✓ HTMLファイルを生成しました: {html_path}")
+
+
+def _run_stage(metrics, func, inbox, outbox):
+    """inbox から章を受け取り、func で処理して outbox に渡す（None で終了）"""
+    while True:
+        started = time.perf_counter()
+        job = inbox.get()
+        metrics.wait_in += time.perf_counter() - started
+        if job is not None and job.error is None:
+            started = time.perf_counter()
+            try:
+                func(job)
+            except Exception as e:
+                job.error = e
+                job.release()
+                if job.timer is not None:
+                    job.timer.failed(e)
+                print(f"エラーが発生しました（{job.excel_path.name}, {STAGE_LABELS[metrics.name]}）: {e}")
+            metrics.busy += time.perf_counter() - started
+            metrics.items += 1
+        elif job is not None:
+            job.release()
+        started = time.perf_counter()
+        outbox.put(job)
+        metrics.wait_out += time.perf_counter() - started
+        if job is None:
+            return
+
+
+def run_pipeline(excel_files, skip_ai=False, use_images=False, chapters=None, queue_depth=None, events=False,
+                 journal_state=None, extras=None):
+    """excel_files をパイプラインで処理する
+
+    Args:
+        chapters: 辞書を渡すと、抽出した行を ChapterRows として {ファイル名: ChapterRows} に追加
+        queue_depth: 段階の間のキューの長さ（省略時は PIPELINE["queue_depth"]）
+        events: Trueの場合、抽出しながら物語データを events_[タイトル].ndjson に書き出す
+        journal_state: 一括処理の開始時に読み込んだジョブ記録（load_state() の結果）
+        extras: HTMLに追加するもの（simple_converter.html_additions() を参照）
+
+    Returns:
+        ({ファイル名: HTMLを生成できたか}, [StageMetrics], 全体の経過時間)
+    """
+    depth = queue_depth or PIPELINE.get('queue_depth', 2)
+    stages = [
+        ('load', load_stage),
+        ('extract', lambda job: extract_stage(job, chapters)),
+        ('render', render_stage),
+        ('write', write_stage),
+    ]
+    queues = [queue.Queue(maxsize=depth) for _ in range(len(stages))]
+    done = queue.Queue()  # 最後の段階の出力は制限しない
+    queues.append(done)
+
+    metrics = [StageMetrics(name) for name, _ in stages]
+    threads = [
+        threading.Thread(target=_run_stage, args=(m, func, queues[i], queues[i + 1]),
+                         name=f'pipeline-{name}', daemon=True)
+        for i, (m, (name, func)) in enumerate(zip(metrics, stages))
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for excel_file in excel_files:
+        queues[0].put(ChapterJob(excel_file, skip_ai=skip_ai, use_images=use_images, events=events,
+                                 journal_state=journal_state, extras=extras))
+    queues[0].put(None)
+
+    results = {}
+    while True:
+        job = done.get()
+        if job is None:
+            break
+        job.release()  # 書き出しの段階で閉じているはずだが、どの経路でも一時ファイルを残さない
+        results[job.excel_path.name] = job.success
+    for thread in threads:
+        thread.join()
+    return results, metrics, time.perf_counter() - started
+
+
+def format_metrics(metrics, elapsed):
+    """段階ごとの集計を表示用の文字列にする（処理時間が一番長い段階がボトルネック）"""
+    lines = [f"パイプラインの集計（全体 {elapsed:.2f}秒）:",
+             f"  {'件数':>4}  {'処理時間':>8}  {'件/秒':>7}  {'入力待ち':>8}  {'出力待ち':>8}  段階"]
+    for m in metrics:
+        lines.append(f"  {m.items:>6}  {m.busy:>11.2f}s  {m.throughput():>9.1f}  {m.wait_in:>11.2f}s  "
+                     f"{m.wait_out:>11.2f}s  {STAGE_LABELS[m.name]}")
+    bottleneck = max(metrics, key=lambda m: m.busy)
+    lines.append(f"  → 一番時間がかかっている段階: {STAGE_LABELS[bottleneck.name]}")
+    return '\n'.join(lines)
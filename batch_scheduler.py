@@ -0,0 +1,218 @@
+"""
+一括処理の並列実行（batch_converter.py --jobs=N --max-memory=SIZE）
+
+Excelファイルを複数のプロセスで同時に処理します。大きなワークブックが何冊も同時に
+読み込まれるとメモリが足りなくなるので、各ファイルのメモリ使用量を見積もり、
+合計が --max-memory を超えないように順番を決めます。
+
+- 見積もりには、ワークブック（zip）の目次にあるシートのXMLと共有文字列の
+  大きさ（展開後・圧縮後）とシート数を使います。Excelは開かないので一瞬で終わります。
+- 時間のかかる大きなファイルから先に始め、空いた分に小さなファイルを詰めていくと、
+  全体の処理時間が短くなります。
+- 予算を超える1冊は、ほかのファイルが終わるのを待ってから単独で処理します。
+- ファイルごとに新しいプロセスで処理するので、そのプロセスの最大メモリ使用量が
+  そのファイルの実測値になります（Windowsでは実測値は表示されません）。
+  Python 3.11 以降は max_tasks_per_child=1 のプロセスプールを、それより前は
+  ファイルごとにプロセス1つのプールを使います。
+  終了時に見積もりと実測を並べて表示するので、SCHEDULER の係数の調整に使えます。
+"""
+
+import io
+import os
+import re
+import sys
+import time
+import zipfile
+from contextlib import redirect_stdout
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    from config import SCHEDULER
+except ImportError:
+    SCHEDULER = {"jobs": None, "base_mb": 30, "mb_per_xml_mb": 1.2, "mb_per_sheet": 0.2}
+
+MB = 1024 * 1024
+
+_SHEET_PART = re.compile(r'xl/worksheets/sheet\d+\.xml$')
+_SIZE = re.compile(r'(\d+(?:\.\d+)?)\s*([KMGT]?)i?B?$', re.IGNORECASE)
+_UNITS = {'': 1, 'K': 1 / 1024, 'M': 1, 'G': 1024, 'T': 1024 * 1024}
+
+
+def parse_size(text):
+    """'2G' / '800M' / '1.5GB' / '1500'（単位なしはMB）をMB単位の数値にする"""
+    match = _SIZE.match(str(text).strip())
+    if not match:
+        raise ValueError(f"メモリの大きさを読み取れません: {text}（例: 2G, 800M）")
+    return float(match.group(1)) * _UNITS[match.group(2).upper()]
+
+
+def workbook_cost(excel_path, settings=None):
+    """zipの目次だけを読んで、ワークブックの処理に必要なメモリ（MB）を見積もる
+
+    Returns:
+        {'path', 'sheets', 'compressed', 'uncompressed', 'memory_mb'}
+        （compressed / uncompressed はシートと共有文字列のバイト数）
+    """
+    settings = settings or SCHEDULER
+    sheets = compressed = uncompressed = 0
+    with zipfile.ZipFile(excel_path) as archive:
+        for info in archive.infolist():
+            if _SHEET_PART.match(info.filename):
+                sheets += 1
+            elif info.filename != 'xl/sharedStrings.xml':
+                continue
+            compressed += info.compress_size
+            uncompressed += info.file_size
+    memory_mb = (settings.get('base_mb', 30)
+                 + uncompressed / MB * settings.get('mb_per_xml_mb', 1.2)
+                 + sheets * settings.get('mb_per_sheet', 0.2))
+    return {
+        'path': Path(excel_path),
+        'sheets': sheets,
+        'compressed': compressed,
+        'uncompressed': uncompressed,
+        'memory_mb': memory_mb,
+    }
+
+
+def _peak_memory_mb():
+    """このプロセスの最大メモリ使用量（MB、測れない場合は None）"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS ではバイト単位、Linux などでは KB 単位
+    return peak / MB if sys.platform == 'darwin' else peak / 1024
+
+
+class _OneShotPools:
+    """max_tasks_per_child がない Python 3.10 以前用に、1ファイルごとにプロセス1つのプールを作る
+
+    ProcessPoolExecutor と同じく submit() と with で使います。
+    """
+
+    def __init__(self):
+        self.pools = {}  # Future → そのファイル用の ProcessPoolExecutor
+
+    def submit(self, func, *args):
+        from concurrent.futures import ProcessPoolExecutor
+
+        # 終わったファイルのプロセスを片付けてから、新しいプロセスを起動する
+        for future in [f for f in self.pools if f.done()]:
+            self.pools.pop(future).shutdown()
+        pool = ProcessPoolExecutor(max_workers=1)
+        future = pool.submit(func, *args)
+        self.pools[future] = pool
+        return future
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        for pool in self.pools.values():
+            pool.shutdown()
+        self.pools.clear()
+
+
+def _fresh_process_pool(jobs):
+    """1ファイルごとに新しいプロセスで処理するプール（プロセスの最大メモリ使用量をファイルごとに測るため）"""
+    from concurrent.futures import ProcessPoolExecutor
+
+    if sys.version_info >= (3, 11):
+        return ProcessPoolExecutor(max_workers=jobs, max_tasks_per_child=1)
+    return _OneShotPools()
+
+
+def process_in_worker(excel_path, options):
+    """ワーカープロセスで1ファイルを処理する（表示はまとめて親プロセスに返す）
+
+    Returns:
+        (成功したか, 表示内容, 処理時間（秒）, 最大メモリ使用量（MB）, 書き込みの集計)
+    """
+    from batch_converter import process_excel_file
+    from output_writer import WRITE_STATS
+
+    output = io.StringIO()
+    started = time.perf_counter()
+    with redirect_stdout(output):
+        try:
+            success = process_excel_file(Path(excel_path), **options)
+        except Exception as e:
+            print(f"エラーが発生しました: {e}")
+            success = False
+    return success, output.getvalue(), time.perf_counter() - started, _peak_memory_mb(), dict(WRITE_STATS)
+
+
+def run_scheduled(excel_files, jobs=None, max_memory=None, settings=None, **options):
+    """見積もりの大きい順に、メモリの予算内で並列に処理する
+
+    Args:
+        jobs: 同時に処理するファイル数（省略時は SCHEDULER["jobs"]、それもなければCPU数）
+        max_memory: メモリの予算（MB、None なら制限なし）
+        options: process_excel_file に渡すオプション（skip_ai, use_images など）
+
+    Returns:
+        ({ファイル名: 成功したか}, [(見積もり, 成功したか, 処理時間, 実測メモリ)], 全体の経過時間)
+    """
+    from concurrent.futures import FIRST_COMPLETED, wait
+    from output_writer import add_write_stats
+
+    settings = settings or SCHEDULER
+    jobs = jobs or settings.get('jobs') or os.cpu_count() or 1
+    pending = sorted((workbook_cost(f, settings) for f in excel_files),
+                     key=lambda cost: cost['memory_mb'], reverse=True)
+    results = {}
+    report = []
+    running = {}
+    in_use = 0.0
+    started = time.perf_counter()
+    # 1ファイルごとに新しいプロセスを使うので、プロセスの最大メモリ使用量がそのファイルの実測値になる
+    with _fresh_process_pool(jobs) as pool:
+        while pending or running:
+            for cost in list(pending):
+                if len(running) >= jobs:
+                    break
+                fits = max_memory is None or in_use + cost['memory_mb'] <= max_memory
+                if not fits and running:
+                    continue  # 小さいファイルなら予算内に収まるかもしれない
+                pending.remove(cost)
+                in_use += cost['memory_mb']
+                running[pool.submit(process_in_worker, str(cost['path']), options)] = cost
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                cost = running.pop(future)
+                in_use -= cost['memory_mb']
+                try:
+                    success, output, seconds, peak_mb, write_stats = future.result()
+                    add_write_stats(write_stats)
+                except Exception as e:  # ワーカープロセスが落ちた場合など
+                    success, output, seconds, peak_mb = False, f"エラーが発生しました: {e}\n", None, None
+                print(output, end='')
+                results[cost['path'].name] = success
+                report.append((cost, success, seconds, peak_mb))
+    return results, report, time.perf_counter() - started
+
+
+def format_report(report, elapsed, jobs=None, max_memory=None):
+    """ファイルごとの見積もりと実測を表示用の文字列にする（処理を始めた順＝見積もりの大きい順）"""
+    limit = '制限なし' if max_memory is None else f'{max_memory:,.0f} MB'
+    lines = [f"並列処理の結果（全体 {elapsed:.1f}秒, 並列数 {jobs or '-'}, メモリの予算 {limit}）:",
+             f"  {'見積もり':>8}  {'実測':>6}  {'処理時間':>8}  {'シート':>4}  {'圧縮後':>6}  ファイル"]
+    ratios = []
+    for cost, success, seconds, peak_mb in sorted(report, key=lambda r: r[0]['memory_mb'], reverse=True):
+        actual = '-' if peak_mb is None else f'{peak_mb:,.0f} MB'
+        time_text = '-' if seconds is None else f'{seconds:.1f}s'
+        mark = '' if success else '（未完了）'
+        lines.append(f"  {cost['memory_mb']:>9,.0f} MB  {actual:>9}  {time_text:>11}  {cost['sheets']:>7}"
+                     f"  {cost['compressed'] / 1024:>6,.0f} KB  {cost['path'].name}{mark}")
+        if peak_mb:
+            ratios.append(peak_mb / cost['memory_mb'])
+    if ratios:
+        lines.append(f"  → 実測 / 見積もり: 平均 {sum(ratios) / len(ratios):.2f}倍, 最大 {max(ratios):.2f}倍"
+                     "（大きくずれる場合は config.py の SCHEDULER の係数を調整してください）")
+    return '\n'.join(lines)
@@ -0,0 +1,451 @@
+"""
+性能の確認用スクリプト
+
+使い方:
+    python benchmarks.py              # すべて実行
+    python benchmarks.py startup      # 起動時間（import時間）だけ実行
+    python benchmarks.py memory       # 章データのメモリ使用量だけ実行
+    python benchmarks.py normalize    # セルの値の変換にかかる時間だけ実行
+    python benchmarks.py extract      # 1ファイル用の ai_input がもとの形式のままか確認
+    python benchmarks.py load         # アプリとプレビューサーバーに同時にアクセスしたときの応答時間
+
+各項目には予算（上限）があり、超えた項目があると終了コード 1 で終了します。
+"""
+
+import asyncio
+import contextlib
+import datetime
+import io
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+
+BENCHMARKS = {}
+
+# 起動時に読み込まれてはいけない重いモジュール
+HEAVY_MODULES = ('openpyxl', 'PIL', 'streamlit', 'fontTools')
+
+# import時間の予算（ミリ秒）。各エントリーポイントのモジュールを読み込むまでの累計時間
+STARTUP_BUDGET_MS = {
+    'cli': 50,
+    'simple_converter': 100,
+    'batch_converter': 100,
+}
+
+
+def benchmark(name):
+    """ベンチマーク関数を登録するデコレーター
+
+    登録する関数は (項目名, 測定値, 予算, 単位) のリストを返します。
+    """
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+
+def _import_times(module):
+    """python -X importtime で module を読み込み、{モジュール名: 累計マイクロ秒} を返す"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=BASE_DIR, capture_output=True, text=True, check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        parts = line[len('import time:'):].split('|')
+        try:
+            cumulative = int(parts[1])
+        except ValueError:
+            continue  # 見出し行
+        times[parts[2].strip()] = cumulative
+    return times
+
+
+@benchmark('startup')
+def bench_startup(runs=5):
+    """エントリーポイントの import 時間と、重いモジュールが読み込まれていないことを確認"""
+    results = []
+    for module, budget in STARTUP_BUDGET_MS.items():
+        best = None
+        for _ in range(runs):
+            times = _import_times(module)
+            elapsed = times[module] / 1000
+            best = elapsed if best is None else min(best, elapsed)
+        results.append((f'import {module}', best, budget, 'ms'))
+        loaded = [name for name in HEAVY_MODULES if name in times]
+        results.append((f'import {module}: 重いモジュール {loaded or "なし"}', len(loaded), 0, '個'))
+    return results
+
+
+# ChapterRows のメモリ使用量の予算（行タプルのリストに対する割合、%）
+CHAPTER_ROWS_BUDGET_PERCENT = 50
+
+
+def write_sample_workbook(path, sheets=8, rows_per_sheet=2500, speakers=40):
+    """ベンチマーク用のワークブックを作る（話者名が何度も出てくる、本番に近い形）"""
+    import openpyxl
+
+    wb = openpyxl.Workbook(write_only=True)
+    names = [f'話者{i}' for i in range(speakers)]
+    for sheet_number in range(sheets):
+        ws = wb.create_sheet(f'level_main_{sheet_number:02d}_beg')
+        for row in range(rows_per_sheet):
+            if row % 50 == 10:
+                ws.append([None, '--Decision--', 'x'])
+                ws.append([None, 'Option_1', '……'])
+                ws.append([None, 'Option_2', 'どうした？'])
+                ws.append([None, '--Decision End--', 'x'])
+            elif row % 7 == 0:
+                ws.append([None, None, f'地の文 {sheet_number}-{row}。風が吹いている。'])
+            elif row % 50 == 20:
+                ws.append([None, names[row % speakers], None])  # C列が空の行（出力されない）
+            else:
+                ws.append([None, names[(row * 7) % speakers],
+                           f'セリフ {sheet_number}-{row}：{{@nickname}}、こちらの準備はできています。'])
+    wb.save(path)
+
+
+def _retained_bytes(build):
+    """build() の戻り値が保持しているメモリ量（バイト）"""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = build()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del result
+    return after - before
+
+
+def _mismatched_fingerprints(path):
+    """iter_workbook_sheets と ChapterRows から求めたシートの指紋が食い違うシートの数"""
+    from build_manifest import fingerprint_sheets, fingerprint_workbook
+    from story_rows import ChapterRows
+
+    scenes = []
+    for _, rows in fingerprint_sheets(ChapterRows.from_workbook(path).iter_sheets(), scenes):
+        for _ in rows:
+            pass
+    expected = fingerprint_workbook(path)
+    return len(expected) - len(scenes) + sum(1 for a, b in zip(expected, scenes) if a != b)
+
+
+@benchmark('memory')
+def bench_memory():
+    """1章分の行を、行タプルのリストと ChapterRows で持ったときのメモリ使用量を比較
+
+    どちらから読んでもシートの指紋（build_manifest）が同じになることも確かめます。
+    """
+    from story_rows import ChapterRows, iter_workbook_rows
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'main_0_sample.xlsx'
+        write_sample_workbook(path)
+        row_count = sum(1 for _ in iter_workbook_rows(path))
+        as_tuples = _retained_bytes(lambda: list(iter_workbook_rows(path)))
+        as_columns = _retained_bytes(lambda: ChapterRows.from_workbook(path))
+        mismatched = _mismatched_fingerprints(path)
+
+    percent = as_columns * 100 / as_tuples
+    return [
+        (f'行タプルのリスト（{row_count:,}行）', as_tuples // 1024, None, 'KiB'),
+        ('ChapterRows', as_columns // 1024, None, 'KiB'),
+        ('ChapterRows / 行タプルのリスト', percent, CHAPTER_ROWS_BUDGET_PERCENT, '%'),
+        ('指紋が ChapterRows と食い違うシート', mismatched, 0, 'シート'),
+    ]
+
+
+# 1ファイル用の抽出（simple_converter.extract_all_dialogues）の確認に使う行
+EXTRACT_SAMPLE_ROWS = [
+    [None, None, 'ナレーション文です。'],
+    [None, 'アーミヤ', '{@nickname}、おはようございます。'],
+    [None, '--image--', 'https://example.com/a.png'],
+    [None, '--background--', 'https://example.com/bg.png'],
+    [None, '--imagetween--', 'https://example.com/t.png'],
+    [None, '----', 'x'],
+    [None, '--Decision--', 'x'],
+    [None, 'Option_1', '行こう。'],
+    [None, 'Option_2', '待って。'],
+    [None, '--Decision End--', 'x'],
+    [None, '--Branch--', '>Options_1'],
+    [None, 'アーミヤ', 'はい。'],
+    [None, '--Branch--', '>Options_2'],
+    [None, 'アーミヤ', 'わかりました。'],
+    [None, '--Branch--', '>Options_1&2'],
+    [None, 'Option_1', '分岐の外の選択肢'],
+    [None, None, '終わり。'],
+]
+
+# 変更前（最初の版）の extract_all_dialogues が EXTRACT_SAMPLE_ROWS から作った ai_input
+# （DOCTOR_NAME = "ドクター"、BRANCH_MODE = "include_all"、options_format ごと）
+_EXTRACT_HEAD = [
+    '', '', '=' * 60, '【シーン: level_main_00_beg】', '=' * 60, '',
+    'ナレーション文です。',
+    '【アーミヤ】ドクター、おはようございます。',
+    '[画像]: https://example.com/a.png',
+    '[背景]: https://example.com/bg.png',
+    '',
+]
+_EXTRACT_BRANCHES = [
+    '【分岐: >Options_1】', '  選択肢1: 行こう。', '【アーミヤ】はい。', '',
+    '【分岐: >Options_2】', '  選択肢2: 待って。', '【アーミヤ】わかりました。', '',
+    '【分岐: >Options_1&2】', '  選択肢1: 行こう。', '  選択肢2: 待って。',
+    '終わり。',
+]
+EXTRACT_EXPECTED = {
+    'inline': '\n'.join(_EXTRACT_HEAD + ['【ドクターの選択肢】', '  選択肢1: 行こう。', '  選択肢2: 待って。', '', '']
+                        + _EXTRACT_BRANCHES),
+    'separate_page': '\n'.join(_EXTRACT_HEAD + ['【選択肢】', ''] + _EXTRACT_BRANCHES),
+}
+
+
+@benchmark('extract')
+def bench_extract():
+    """1ファイル用の抽出が、変更前と同じ ai_input を作るか確認
+
+    ナレーション・--image--・--background--・選択肢の行を含むワークブックで、
+    options_format ごとに変更前の出力（EXTRACT_EXPECTED）と比べます。
+    """
+    import openpyxl
+    import simple_converter
+
+    saved = (simple_converter.DOCTOR_NAME, simple_converter.BRANCH_MODE, simple_converter.BRANCH_DISPLAY)
+    mismatched = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'main_0_sample.xlsx'
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet('level_main_00_beg')
+        for row in EXTRACT_SAMPLE_ROWS:
+            ws.append(row)
+        wb.save(path)
+        try:
+            simple_converter.DOCTOR_NAME = 'ドクター'
+            simple_converter.BRANCH_MODE = 'include_all'
+            for options_format, expected in EXTRACT_EXPECTED.items():
+                simple_converter.BRANCH_DISPLAY = {'show_options': True, 'options_format': options_format}
+                with contextlib.redirect_stdout(io.StringIO()):
+                    text = simple_converter.extract_all_dialogues(str(path))
+                if text != expected:
+                    mismatched += 1
+                    print(f"  ⚠ {options_format}: 1ファイル用の ai_input が変更前と違います")
+        finally:
+            simple_converter.DOCTOR_NAME, simple_converter.BRANCH_MODE, simple_converter.BRANCH_DISPLAY = saved
+    return [('変更前と違う options_format', mismatched, 0, '件')]
+
+
+# セルの値の変換（normalize_cell）の予算（1行あたりのExcel読み込み時間に対する割合、%）
+NORMALIZE_BUDGET_PERCENT = 2
+
+
+class _SampleSheet:
+    """iter_rows(values_only=True) だけを持つ、メモリ上のシート"""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def iter_rows(self, min_row=1, max_col=None, values_only=False):
+        return iter(self.rows)
+
+
+def _iter_sheet_rows_raw(sheet):
+    """変換なしで (行番号, B列, C列) を返す（比較用）"""
+    for row_number, row in enumerate(sheet.iter_rows(min_row=1, max_col=3, values_only=True), 1):
+        col2 = row[1] if len(row) > 1 else None
+        col3 = row[2] if len(row) > 2 else None
+        yield row_number, col2, col3
+
+
+def _best_time(func, runs=7):
+    best = None
+    for _ in range(runs):
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+@benchmark('normalize')
+def bench_normalize(rows=200_000):
+    """行の読み出し（iter_sheet_rows）でセルの値をそろえる処理の時間を測る
+
+    本番と同じくほとんどが文字列で、1%ほど数値・日付のセルを混ぜたメモリ上のシートで
+    1行あたりの増加分を測り、実際のExcelファイルを1行読む時間と比べます。
+    """
+    from collections import deque
+    from story_rows import iter_sheet_rows, iter_workbook_sheets
+
+    sample = []
+    for row in range(rows):
+        if row % 200 == 0:
+            sample.append((None, 123, datetime.datetime(2020, 1, 2)))
+        elif row % 200 == 100:
+            sample.append((None, 'ケルシー', 3.0))
+        else:
+            sample.append((None, f'話者{row % 40}', f'セリフ {row}'))
+    sheet = _SampleSheet(sample)
+
+    raw = _best_time(lambda: deque(_iter_sheet_rows_raw(sheet), maxlen=0))
+    normalized = _best_time(lambda: deque(iter_sheet_rows(sheet), maxlen=0))
+    overhead_ns = max(normalized - raw, 0.0) * 1e9 / rows
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'main_0_sample.xlsx'
+        write_sample_workbook(path, sheets=2)
+
+        def read_workbook():
+            for _, sheet_rows in iter_workbook_sheets(path):
+                deque(sheet_rows, maxlen=0)
+        row_count = sum(1 for _, sheet_rows in iter_workbook_sheets(path) for _ in sheet_rows)
+        read_ns = _best_time(read_workbook, runs=3) * 1e9 / row_count
+
+    return [
+        ('変換による1行あたりの増加', overhead_ns, None, 'ns'),
+        (f'Excelの読み込み（{row_count:,}行）1行あたり', read_ns, None, 'ns'),
+        ('読み込み時間に対する変換の割合', overhead_ns * 100 / read_ns, NORMALIZE_BUDGET_PERCENT, '%'),
+    ]
+
+
+# 負荷テストの条件（同時に使う人数・1人あたりの繰り返し回数・ワークブックの種類）
+LOAD_USERS = 8
+LOAD_ROUNDS = 3
+LOAD_WORKBOOKS = 4
+
+# 2回目以降（キャッシュから返す場合）の応答時間の予算（p95、ミリ秒）
+LOAD_CACHED_P95_BUDGET_MS = {
+    'アップロード（キャッシュ）': 250,
+    'プレビュー（キャッシュ）': 100,
+}
+
+
+def _percentile(values, percent):
+    """values の percent パーセンタイル（最近傍法）"""
+    ordered = sorted(values)
+    index = max(math.ceil(percent / 100 * len(ordered)) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+def _peak_memory_mb(who):
+    """最大メモリ使用量（MB、測れない環境では None）"""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(who(resource)).ru_maxrss
+    # macOS ではバイト単位、Linux などでは KB 単位
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+async def _simulated_user(user, workbooks, server, latencies):
+    """1人分の操作: ワークブックをアップロードして変換を待ち、プレビューを開く（を繰り返す）"""
+    import urllib.parse
+    import app_jobs
+
+    for round_number in range(LOAD_ROUNDS):
+        name, data = workbooks[(user + round_number) % len(workbooks)]
+
+        # アプリと同じく、バックグラウンドの変換が終わるまで進み具合を確認し続ける
+        started = time.perf_counter()
+        job = app_jobs.submit_uploads([(name, data)])
+        while not job.finished:
+            await asyncio.sleep(0.005)
+        cached = all(task.status == 'cached' for task in job.tasks)
+        label = 'アップロード（キャッシュ）' if cached else 'アップロード（変換）'
+        latencies.setdefault(label, []).append(time.perf_counter() - started)
+
+        title = name[:-len('.xlsx')]
+        started = time.perf_counter()
+        cached = title in server.cache
+        response = await server.handle('GET', f'/chapters/{urllib.parse.quote(title)}.html', {})
+        assert response.status == 200, response.status
+        label = 'プレビュー（キャッシュ）' if cached else 'プレビュー（描画）'
+        latencies.setdefault(label, []).append(time.perf_counter() - started)
+
+
+async def _run_load(workbooks, server):
+    latencies = {}
+    started = time.perf_counter()
+    await asyncio.gather(*(_simulated_user(user, workbooks, server, latencies) for user in range(LOAD_USERS)))
+    return latencies, time.perf_counter() - started
+
+
+@benchmark('load')
+def bench_load():
+    """同時に LOAD_USERS 人がアップロードとプレビューを繰り返したときの応答時間とメモリ
+
+    ネットワークは使わず、app_jobs（app.py の一括変換）と PreviewServer.handle を
+    同じプロセスの中から直接呼び出します。合成したワークブックを使い、
+    1回目（変換・描画あり）と2回目以降（キャッシュ）の応答時間を分けて集計します。
+    """
+    import app_jobs
+    from preview_server import PreviewServer
+    from story_rows import format_ai_input, iter_workbook_sheets
+
+    original_dir = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)  # output/ 以下のキャッシュを空の状態から始める
+        try:
+            workbooks = []
+            for number in range(LOAD_WORKBOOKS):
+                path = Path(f'main_{number}_sample{number}.xlsx')
+                write_sample_workbook(path, sheets=2, rows_per_sheet=400 + 100 * number)
+                workbooks.append((path.name, path.read_bytes()))
+                # プレビューサーバーが表示する ai_input も用意する
+                text, _ = format_ai_input(iter_workbook_sheets(path))
+                Path('output').mkdir(exist_ok=True)
+                Path('output', f'ai_input_{path.stem}.txt').write_text(text, encoding='utf-8')
+
+            latencies, elapsed = asyncio.run(_run_load(workbooks, PreviewServer(Path('output'))))
+            app_jobs.shutdown()
+        finally:
+            os.chdir(original_dir)
+
+    requests = sum(len(values) for values in latencies.values())
+    results = [
+        (f'{LOAD_USERS}人 × {LOAD_ROUNDS}回: スループット', requests / elapsed, None, '件/秒'),
+    ]
+    for label in ('アップロード（変換）', 'アップロード（キャッシュ）', 'プレビュー（描画）', 'プレビュー（キャッシュ）'):
+        values = latencies.get(label)
+        if not values:
+            continue
+        for percent in (50, 95, 99):
+            budget = LOAD_CACHED_P95_BUDGET_MS.get(label) if percent == 95 else None
+            results.append((f'{label} p{percent}（{len(values)}件）', _percentile(values, percent) * 1000,
+                            budget, 'ms'))
+    for label, who in (('このプロセス', lambda r: r.RUSAGE_SELF), ('変換ワーカー（最大）', lambda r: r.RUSAGE_CHILDREN)):
+        peak = _peak_memory_mb(who)
+        if peak is not None:
+            results.append((f'最大メモリ使用量: {label}', peak, None, 'MB'))
+    return results
+
+
+def main(argv=None):
+    names = (argv if argv is not None else sys.argv[1:]) or list(BENCHMARKS)
+    failed = False
+    for name in names:
+        if name not in BENCHMARKS:
+            print(f"エラー: 不明なベンチマーク {name}（{', '.join(BENCHMARKS)}）")
+            return 2
+        print(f"=== {name} ===")
+        for label, value, budget, unit in BENCHMARKS[name]():
+            ok = budget is None or value <= budget
+            failed = failed or not ok
+            limit = '' if budget is None else f" (予算 {budget:,} {unit})"
+            shown = f"{value:,.1f}" if isinstance(value, float) else f"{value:,}"
+            print(f"  {'✓' if ok else '✗'} {label}: {shown} {unit}{limit}")
+        print()
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
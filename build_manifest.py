@@ -0,0 +1,239 @@
+"""
+シーン（シート）ごとの指紋と、エクスポート間の差分
+
+抽出のときに各シートの行を (種類, 話者, テキスト) にそろえてハッシュ化し、
+output/build_manifest.json にワークブックごとに記録します。指紋が変わった場合は
+1つ前の記録も残すので、新しいエクスポートでどのシーンが追加・削除・変更されたかを
+Excelを開かずにすぐ調べられます。
+
+- 行番号は指紋に含めないので、空行の追加などでは変わりません。
+- 空のシート（見出しだけのシーン）も記録します。
+- 差分は `python cli.py diff` で確認できます。一括処理の `--changed` では、
+  変わったシーンだけをAIに送り直せます（chunked_export.py）。
+"""
+
+import hashlib
+import json
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from job_journal import file_signature
+from output_writer import write_output
+from story_rows import classify_row
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+MANIFEST_PATH = Path('output') / 'build_manifest.json'
+
+
+def new_fingerprint():
+    return hashlib.blake2b(digest_size=16)
+
+
+def update_fingerprint(digest, values):
+    """1行分の値（文字列・数値・None）を指紋に加える"""
+    digest.update(('\x1f'.join('' if v is None else str(v) for v in values) + '\x1e').encode('utf-8'))
+
+
+def fingerprint_rows(rows):
+    """行（値のタプル）の並びの指紋"""
+    digest = new_fingerprint()
+    for values in rows:
+        update_fingerprint(digest, values)
+    return digest.hexdigest()
+
+
+def normalize_row(col2, col3):
+    """B列・C列を指紋用の (種類, 話者, テキスト) にする（C列が空なら None）
+
+    C列が空の行は ai_input に出力されず、ChapterRows にも入らないので指紋にも含めません
+    （iter_workbook_sheets と ChapterRows.iter_sheets のどちらから読んでも同じ指紋になります）。
+    """
+    if not col3:
+        return None
+    speaker = col2.strip() if isinstance(col2, str) else col2
+    text = col3.strip() if isinstance(col3, str) else col3
+    return classify_row(col2), speaker, text
+
+
+def _hashing_rows(rows, digest):
+    for row in rows:
+        values = normalize_row(row[1], row[2])
+        if values is not None:
+            update_fingerprint(digest, values)
+        yield row
+
+
+def fingerprint_sheets(sheets, scenes):
+    """(シート名, 行イテレータ) をそのまま返しながら、各シートの指紋を scenes に追加する
+
+    抽出処理（format_ai_input など）に渡すシートの並びを包んで使います。
+    シートの行を最後まで読み終えたときに [シート名, 指紋] が追加されます。
+    """
+    for sheet_name, rows in sheets:
+        digest = new_fingerprint()
+        yield sheet_name, _hashing_rows(rows, digest)
+        scenes.append([sheet_name, digest.hexdigest()])
+
+
+def fingerprint_workbook(excel_file):
+    """ワークブックを読んで [[シート名, 指紋]] を返す"""
+    from story_rows import iter_workbook_sheets
+
+    scenes = []
+    for _, rows in fingerprint_sheets(iter_workbook_sheets(excel_file), scenes):
+        for _ in rows:
+            pass
+    return scenes
+
+
+def load_manifest(path=MANIFEST_PATH):
+    path = Path(path)
+    if not path.exists():
+        return {'workbooks': {}}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, path=MANIFEST_PATH):
+    write_output(path, json.dumps(manifest, ensure_ascii=False, indent=2) + '\n')
+
+
+def diff_scenes(old_scenes, new_scenes):
+    """2つの記録 [[シート名, 指紋]] を比べる
+
+    Returns:
+        {'added': [...], 'removed': [...], 'changed': [...], 'unchanged': 件数}
+        シート名は新しい記録（削除は古い記録）の順番です
+    """
+    old = dict(old_scenes or [])
+    new = dict(new_scenes)
+    return {
+        'added': [name for name, _ in new_scenes if name not in old],
+        'removed': [name for name, _ in old_scenes or [] if name not in new],
+        'changed': [name for name, fp in new_scenes if name in old and old[name] != fp],
+        'unchanged': sum(1 for name, fp in new_scenes if old.get(name) == fp),
+    }
+
+
+@contextmanager
+def _locked(path):
+    """記録の読み書きをロックする（一括処理の --jobs では複数のプロセスが同時に記録するため）
+
+    OSのファイルロック（flock / Windows では msvcrt.locking）を使うので、ロックを持った
+    プロセスが強制終了してもロックは自動で外れ、処理中のプロセスのロックを奪うこともありません。
+    ロック用のファイル（build_manifest.json.lock）は消さずに使い回します（消すと、待っている
+    プロセスと新しく作ったプロセスが別々のファイルをロックしてしまうため）。
+    """
+    lock_path = Path(f'{path}.lock')
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)  # 約10秒待っても取れなければ OSError
+                    break
+                except OSError:
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def record_scenes(excel_path, scenes, path=MANIFEST_PATH):
+    """抽出したワークブックの指紋を記録し、前回の抽出との差分を返す（初回は None）
+
+    指紋が変わった場合は前回の記録を 'previous' に残します（変わらなければ前の 'previous' のまま）。
+    """
+    excel_path = Path(excel_path)
+    with _locked(path):
+        manifest = load_manifest(path)
+        entry = manifest['workbooks'].get(excel_path.name)
+        if entry is not None and entry['scenes'] != scenes:
+            previous = {key: entry[key] for key in ('workbook_signature', 'extracted', 'scenes')}
+        else:
+            previous = entry.get('previous') if entry else None
+        manifest['workbooks'][excel_path.name] = {
+            'workbook_signature': file_signature(excel_path),
+            'extracted': datetime.now().isoformat(timespec='seconds'),
+            'scenes': scenes,
+            'previous': previous,
+        }
+        save_manifest(manifest, path)
+    return diff_scenes(entry['scenes'], scenes) if entry else None
+
+
+def changed_scenes(excel_name, manifest=None):
+    """最後の抽出で追加・変更されたシート名（前回の記録がなければ None = すべて）"""
+    manifest = manifest or load_manifest()
+    entry = manifest['workbooks'].get(Path(excel_name).name)
+    if entry is None or not entry.get('previous'):
+        return None
+    changes = diff_scenes(entry['previous']['scenes'], entry['scenes'])
+    return set(changes['added']) | set(changes['changed'])
+
+
+def is_current(excel_path, manifest=None):
+    """ワークブックが最後に抽出したときから変わっていないかどうか"""
+    manifest = manifest or load_manifest()
+    entry = manifest['workbooks'].get(Path(excel_path).name)
+    return entry is not None and entry['workbook_signature'] == file_signature(excel_path)
+
+
+def format_changes(name, changes, label=''):
+    """差分を表示用の文字列にする"""
+    lines = [f"{name}: 追加 {len(changes['added'])} / 削除 {len(changes['removed'])} / "
+             f"変更 {len(changes['changed'])} / 変更なし {changes['unchanged']}{label}"]
+    for mark, key in (('+', 'added'), ('-', 'removed'), ('~', 'changed')):
+        for scene in changes[key]:
+            lines.append(f"  {mark} {scene}")
+    return '\n'.join(lines)
+
+
+def main(files=None, path=MANIFEST_PATH):
+    """各ワークブックのシーンの差分を表示
+
+    ワークブックが最後の抽出から変わっていなければ、記録どうしを比べるだけです
+    （Excelは開きません）。新しいエクスポートに置き換わっている場合は、
+    そのワークブックだけ読んで最後の抽出と比べます。
+    """
+    manifest = load_manifest(path)
+    if files:
+        excel_files = [Path(f) for f in files]
+    else:
+        from batch_converter import get_excel_files
+        excel_files = get_excel_files()
+    if not excel_files:
+        print("エラー: main_*.xlsx ファイルが見つかりません。")
+        return 1
+
+    for excel_file in excel_files:
+        entry = manifest['workbooks'].get(excel_file.name)
+        if entry is None:
+            print(f"{excel_file.name}: 記録がありません（一括処理で抽出すると記録されます）")
+        elif is_current(excel_file, manifest):
+            previous = entry.get('previous')
+            if previous is None:
+                print(f"{excel_file.name}: 変更なし（{entry['extracted']} の初回の抽出から）")
+            else:
+                changes = diff_scenes(previous['scenes'], entry['scenes'])
+                print(format_changes(excel_file.name, changes, f"（{entry['extracted']} の抽出での変更）"))
+        elif not excel_file.exists():
+            print(f"{excel_file.name}: ファイルがありません")
+        else:
+            changes = diff_scenes(entry['scenes'], fingerprint_workbook(excel_file))
+            print(format_changes(excel_file.name, changes, '（まだ抽出していない変更）'))
+    return 0
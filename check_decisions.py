@@ -1,14 +1,16 @@
-import openpyxl
-
-# Excelファイルを開く
-wb = openpyxl.load_workbook('main_0_暗黒時代・上.xlsx')
-sheet = wb['level_main_00-01_end']
-
-print("=== Decision分岐の例（level_main_00-01_end シート）===\n")
-for i in range(20, 35):
-    col1 = sheet.cell(row=i, column=1).value
-    col2 = sheet.cell(row=i, column=2).value
-    col3 = sheet.cell(row=i, column=3).value
-    
-    if col1 or col2 or col3:
-        print(f"行{i:3d}: A={col1:4} | B={col2:20} | C={col3}")
+import sys
+
+from corpus_db import decision_blocks, decision_counts, open_corpus
+
+# 分岐（--Decision-- / Option_* / --Branch--）をコーパスDBから表示
+# 使い方: python check_decisions.py [ワークブック名]
+workbook = sys.argv[1] if len(sys.argv) > 1 else None
+conn = open_corpus()
+
+print("=== シートごとの分岐数 ===\n")
+for name, sheet, count in decision_counts(conn, workbook):
+    print(f"{count:4d}  {name} / {sheet}")
+
+print("\n=== 分岐の行 ===\n")
+for name, sheet, row, speaker, text, kind in decision_blocks(conn, workbook):
+    print(f"{sheet} 行{row:4d}: B={speaker:20} | C={text}")
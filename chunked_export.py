@@ -0,0 +1,350 @@
+"""
+ai_input の分割出力（AIの入力サイズに合わせる）
+
+ai_input_[タイトル].txt が長すぎてAIに一度に送れない場合に、
+`【シーン: …】` の区切りで（長いシーンはさらに `【ドクターの選択肢】` の区切りで）
+ai_input_[タイトル]_part01.txt, _part02.txt, … に分割します。
+選択肢と分岐のまとまりの途中では分割しません。
+
+分割の内容は ai_input_[タイトル].manifest.json に記録されます。
+AIの出力を novel_output_[タイトル]_part01.txt, … として保存すると、
+一括処理（batch_converter.py）のときに番号順につなげて novel_output_[タイトル].txt を作ります。
+ai_input や各パートが分割したときから変わっている場合はつなげません。
+分割し直してパートの内容が変わった場合、そのパートのAIの出力は
+novel_output_[タイトル]_partNN.txt.stale に名前を変えて退避します（新しいパートの出力とは混ぜません）。
+
+上限の文字数・トークン数は config.py の CHUNK_SETTINGS で設定できます。
+
+新しいエクスポートで一部のシーンだけが変わった場合は（build_manifest.py の指紋で判定）、
+変わったシーンだけを ai_input_[タイトル]_changed.txt に書き出します。そのAIの出力を
+novel_output_[タイトル]_changed.txt に保存すると、既存の novel_output の同じシーンと
+置き換えます（追加されたシーンは ai_input の順番の位置に入り、削除されたシーンは除きます）。
+"""
+
+import hashlib
+import json
+import math
+import os
+import re
+from pathlib import Path
+
+from output_writer import write_output
+
+try:
+    from config import CHUNK_SETTINGS
+except ImportError:
+    CHUNK_SETTINGS = {"max_chars": 30000, "max_tokens": 0, "tokens_per_char": 1.0}
+
+OUTPUT_DIR = Path('output')
+
+# 分割したファイル名の末尾（ai_input_xxx_part01 など）
+PART_SUFFIX = re.compile(r'_part\d+$')
+# 変わったシーンだけのファイル名の末尾（ai_input_xxx_changed）
+CHANGED_SUFFIX = '_changed'
+
+_SCENE_START = re.compile(r'^={60}\n【シーン: ?(.*?)】', re.MULTILINE)
+_DECISION_START = re.compile(r'^【ドクターの選択肢】', re.MULTILINE)
+
+
+def is_part_file(stem):
+    """ai_input_xxx_part01 や ai_input_xxx_changed のような、章の一部だけのファイルかどうか"""
+    return PART_SUFFIX.search(stem) is not None or stem.endswith(CHANGED_SUFFIX)
+
+
+def estimate_tokens(text, settings=None):
+    """おおよそのトークン数（文字数 × tokens_per_char）"""
+    settings = settings or CHUNK_SETTINGS
+    return math.ceil(len(text) * settings.get('tokens_per_char', 1.0))
+
+
+def _measure(settings):
+    """(文字列の大きさを測る関数, 上限) を返す。max_tokens が指定されていればトークン数で測る"""
+    if settings.get('max_tokens'):
+        return (lambda text: estimate_tokens(text, settings)), settings['max_tokens']
+    return len, settings['max_chars']
+
+
+def split_scenes(text):
+    """テキストをシーンごとに分ける [(シーン名, テキスト)]
+
+    最初のシーンより前の部分（空行など）は最初のシーンに含めます。
+    """
+    starts = [(m.start(), m.group(1).strip()) for m in _SCENE_START.finditer(text)]
+    if not starts:
+        return [(None, text)]
+    scenes = []
+    for index, (start, name) in enumerate(starts):
+        begin = 0 if index == 0 else start
+        end = starts[index + 1][0] if index + 1 < len(starts) else len(text)
+        scenes.append((name, text[begin:end]))
+    return scenes
+
+
+def split_decisions(scene_text):
+    """シーンを `【ドクターの選択肢】` の前で分ける（選択肢と分岐は同じまとまりに残る）"""
+    starts = [m.start() for m in _DECISION_START.finditer(scene_text)]
+    bounds = [0] + [s for s in starts if s > 0] + [len(scene_text)]
+    return [scene_text[a:b] for a, b in zip(bounds, bounds[1:]) if b > a]
+
+
+def plan_chunks(text, settings=None):
+    """テキストを上限以下のまとまりに分ける
+
+    Returns:
+        [{'text': 分割したテキスト, 'scenes': [含まれるシーン名], 'continued': 前のパートのシーンの続きか}]
+        分割できないまとまり（1つの選択肢ブロックなど）が上限を超える場合は、そのまま1パートにします。
+    """
+    measure, limit = _measure(settings or CHUNK_SETTINGS)
+    limit = limit or math.inf  # 0 なら分割しない
+    chunks = []
+    current = None
+
+    def start_chunk(continued):
+        nonlocal current
+        current = {'pieces': [], 'size': 0, 'scenes': [], 'continued': continued}
+        chunks.append(current)
+
+    for name, scene_text in split_scenes(text):
+        size = measure(scene_text)
+        if current is None or (current['pieces'] and current['size'] + size > limit):
+            start_chunk(False)
+        if size <= limit:
+            current['pieces'].append(scene_text)
+            current['size'] += size
+            current['scenes'].append(name)
+            continue
+        # 長いシーンは選択肢ブロックの区切りで分ける
+        for index, piece in enumerate(split_decisions(scene_text)):
+            piece_size = measure(piece)
+            if current['pieces'] and current['size'] + piece_size > limit:
+                start_chunk(index > 0)
+            current['pieces'].append(piece)
+            current['size'] += piece_size
+            if not current['scenes'] or current['scenes'][-1] != name:
+                current['scenes'].append(name)
+
+    return [
+        {'text': ''.join(chunk['pieces']), 'scenes': chunk['scenes'], 'continued': chunk['continued']}
+        for chunk in chunks
+    ]
+
+
+def manifest_path(title, output_dir=OUTPUT_DIR):
+    return Path(output_dir) / f'ai_input_{title}.manifest.json'
+
+
+def _sha256(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def _has_text(path):
+    return path.exists() and path.stat().st_size > 0
+
+
+def _set_aside(path):
+    """古い分割のAIの出力を .stale に名前を変えて退避する（つなげる対象から外す）"""
+    stale = path.with_name(path.name + '.stale')
+    os.replace(path, stale)
+    return stale
+
+
+def write_chunks(title, text, settings=None, output_dir=OUTPUT_DIR):
+    """ai_input を分割して保存し、マニフェストを返す
+
+    分割が不要な長さの場合も part01 として1ファイルを作ります。
+    前回より分割数が減った場合、残った古いパートは削除します。
+    前回の分割から入力の内容が変わったパート（と、なくなったパート）のAIの出力は
+    .stale に名前を変えて退避します。
+
+    Returns:
+        (マニフェスト, 退避したAIの出力のパスのリスト)
+    """
+    settings = settings or CHUNK_SETTINGS
+    output_dir = Path(output_dir)
+    output_dir.mkdir(exist_ok=True)
+    chunks = plan_chunks(text, settings)
+    previous = load_manifest(title, output_dir)
+    previous_hashes = {part['output']: part.get('input_sha256') for part in previous['parts']} if previous else {}
+
+    parts = []
+    stale_outputs = []
+    for number, chunk in enumerate(chunks, 1):
+        part_file = f'ai_input_{title}_part{number:02d}.txt'
+        output_file = f'novel_output_{title}_part{number:02d}.txt'
+        input_sha256 = _sha256(chunk['text'])
+        old_sha256 = previous_hashes.get(output_file)
+        if old_sha256 is None and (output_dir / part_file).exists():
+            old_sha256 = _sha256(_read(output_dir / part_file))  # ハッシュを記録していない古いマニフェスト
+        if old_sha256 != input_sha256 and _has_text(output_dir / output_file):
+            stale_outputs.append(_set_aside(output_dir / output_file))
+        write_output(output_dir / part_file, chunk['text'])
+        parts.append({
+            'input': part_file,
+            'output': output_file,
+            'chars': len(chunk['text']),
+            'estimated_tokens': estimate_tokens(chunk['text'], settings),
+            'input_sha256': input_sha256,
+            'scenes': chunk['scenes'],
+            'continued': chunk['continued'],
+        })
+
+    for pattern in (f'ai_input_{title}_part*.txt', f'novel_output_{title}_part*.txt'):
+        for stale in output_dir.glob(pattern):
+            match = PART_SUFFIX.search(stale.stem)
+            if not match or int(match.group(0)[len('_part'):]) <= len(parts):
+                continue
+            if stale.name.startswith('ai_input_'):
+                stale.unlink()
+            elif _has_text(stale):
+                stale_outputs.append(_set_aside(stale))
+
+    manifest = {
+        'title': title,
+        'source': f'ai_input_{title}.txt',
+        'source_sha256': _sha256(text),
+        'settings': dict(settings),
+        'parts': parts,
+    }
+    write_output(manifest_path(title, output_dir),
+                 json.dumps(manifest, ensure_ascii=False, indent=2) + '\n')
+    return manifest, stale_outputs
+
+
+def load_manifest(title, output_dir=OUTPUT_DIR):
+    """マニフェストを読み込む（ない場合は None）"""
+    path = manifest_path(title, output_dir)
+    if not path.exists():
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def missing_outputs(manifest, output_dir=OUTPUT_DIR):
+    """まだ中身のない novel_output のパートのファイル名"""
+    missing = []
+    for part in manifest['parts']:
+        path = Path(output_dir) / part['output']
+        if not path.exists() or path.stat().st_size == 0:
+            missing.append(part['output'])
+    return missing
+
+
+def stitch_problems(manifest, output_dir=OUTPUT_DIR):
+    """ai_input と入力のパートが、分割したときの内容から変わっていないかを確認する
+
+    Returns:
+        問題の説明のリスト（空ならつなげてよい）
+    """
+    output_dir = Path(output_dir)
+    problems = []
+    source = output_dir / manifest['source']
+    if not source.exists() or _sha256(_read(source)) != manifest.get('source_sha256'):
+        problems.append(f"{manifest['source']} が分割したときから変わっています（--chunk で分割し直してください）")
+    for part in manifest['parts']:
+        path = output_dir / part['input']
+        if 'input_sha256' in part and (not path.exists() or _sha256(_read(path)) != part['input_sha256']):
+            problems.append(f"{part['input']} が分割したときから変わっています（--chunk で分割し直してください）")
+    return problems
+
+
+def _is_stitched(manifest, output_dir):
+    """つなげたファイルが、すべてのパートより新しいかどうか"""
+    target = output_dir / f"novel_output_{manifest['title']}.txt"
+    if not target.exists() or target.stat().st_size == 0:
+        return False
+    newest_part = max((output_dir / part['output']).stat().st_mtime_ns for part in manifest['parts'])
+    return target.stat().st_mtime_ns >= newest_part
+
+
+def needs_stitch(title, output_dir=OUTPUT_DIR):
+    """stitch_outputs() が novel_output を作り直すかどうか（ファイルには書き込まない）"""
+    output_dir = Path(output_dir)
+    manifest = load_manifest(title, output_dir)
+    if manifest is None or missing_outputs(manifest, output_dir) or _is_stitched(manifest, output_dir):
+        return False
+    return not stitch_problems(manifest, output_dir)
+
+
+def stitch_outputs(title, output_dir=OUTPUT_DIR):
+    """novel_output のパートを番号順につなげて novel_output_[タイトル].txt を作る
+
+    すべてのパートがそろっていて、つなげたファイルがパートより古い（または空の）場合だけ作ります。
+    ai_input やパートが分割したときから変わっている場合（stitch_problems）はつなげません。
+
+    Returns:
+        作成した（または最新の）ファイルのパス。パートがそろっていない・分割が古い場合は None
+    """
+    output_dir = Path(output_dir)
+    manifest = load_manifest(title, output_dir)
+    if manifest is None or missing_outputs(manifest, output_dir):
+        return None
+
+    part_paths = [output_dir / part['output'] for part in manifest['parts']]
+    target = output_dir / f'novel_output_{title}.txt'
+    if _is_stitched(manifest, output_dir):
+        return target
+    if stitch_problems(manifest, output_dir):
+        return None
+
+    texts = []
+    for path in part_paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            texts.append(f.read().strip('\n'))
+    write_output(target, '\n\n'.join(texts) + '\n')
+    return target
+
+
+def _read(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def write_changed_scenes(title, text, scene_names, output_dir=OUTPUT_DIR):
+    """ai_input のうち scene_names のシーンだけを ai_input_[タイトル]_changed.txt に保存する
+
+    AIの出力を貼り付ける novel_output_[タイトル]_changed.txt は空にしておきます
+    （前回の変更分の出力が残っていると、古い内容で置き換えてしまうため）。
+
+    Returns:
+        書き出したシーン名のリスト
+    """
+    output_dir = Path(output_dir)
+    scenes = [(name, scene_text) for name, scene_text in split_scenes(text) if name in scene_names]
+    write_output(output_dir / f'ai_input_{title}{CHANGED_SUFFIX}.txt',
+                 '\n\n'.join(scene_text.strip('\n') for _, scene_text in scenes) + '\n')
+    write_output(output_dir / f'novel_output_{title}{CHANGED_SUFFIX}.txt', '')
+    return [name for name, _ in scenes]
+
+
+def merge_changed_output(title, output_dir=OUTPUT_DIR):
+    """novel_output_[タイトル]_changed.txt のシーンを novel_output_[タイトル].txt に反映する
+
+    変更分の出力が novel_output より新しい場合だけ反映します。シーンの順番は今の ai_input に
+    合わせ、変わっていないシーンは既存の novel_output のものを使います。
+
+    Returns:
+        (反映したシーンの数, 見つからなかったシーン名のリスト)。反映するものがなければ None
+    """
+    output_dir = Path(output_dir)
+    changed_input = output_dir / f'ai_input_{title}{CHANGED_SUFFIX}.txt'
+    changed_output = output_dir / f'novel_output_{title}{CHANGED_SUFFIX}.txt'
+    target = output_dir / f'novel_output_{title}.txt'
+    if not changed_input.exists() or not changed_output.exists() or changed_output.stat().st_size == 0:
+        return None
+    if target.exists() and target.stat().st_mtime_ns >= changed_output.stat().st_mtime_ns:
+        return None
+
+    expected = [name for name, _ in split_scenes(_read(changed_input))]
+    new_scenes = dict(split_scenes(_read(changed_output)))
+    old_scenes = dict(split_scenes(_read(target))) if target.exists() else {}
+    order = [name for name, _ in split_scenes(_read(output_dir / f'ai_input_{title}.txt'))]
+
+    missing = [name for name in expected if name not in new_scenes]
+    missing += [name for name in order if name not in new_scenes and name not in old_scenes
+                and name not in missing]
+    if missing:
+        return 0, missing
+
+    texts = [(new_scenes[name] if name in new_scenes else old_scenes[name]).strip('\n') for name in order]
+    write_output(target, '\n\n'.join(texts) + '\n')
+    return len(expected), []
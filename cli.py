@@ -0,0 +1,178 @@
+"""
+Excel → 小説HTML 変換ツールのコマンドライン
+
+使い方:
+    python cli.py extract [Excelファイル ...]   # Excelから ai_input_[タイトル].txt を作成
+    python cli.py render テキスト [-o 出力]     # 小説テキストからHTMLを作成
+    python cli.py batch [--no-ai] [--images] …  # batch_converter.py と同じ一括処理
+    python cli.py check [タイトル ...]          # ai_input と novel_output の対応をチェック
+    python cli.py status                       # 一括処理の進み具合を表示
+    python cli.py diff [Excelファイル ...]      # 前回の抽出から変わったシーンを表示
+    python cli.py export [Excelファイル ...]    # 物語データをNDJSONで書き出す（-o - で標準出力）
+    python cli.py inspect [Excelファイル ...]   # ワークブックの構造を確認
+    python cli.py serve [--port 8000]          # プレビュー用のローカルサーバー
+
+起動を速くするため、openpyxl や画像処理などの重いモジュールは
+そのサブコマンドで必要になったときに初めて読み込みます。
+"""
+
+import argparse
+
+
+def cmd_extract(args):
+    from pathlib import Path
+    from build_manifest import format_changes, record_scenes
+    from simple_converter import extract_all_dialogues, extract_title_from_filename, save_to_file
+
+    files = [Path(f) for f in args.files] or sorted(Path('.').glob('main_*.xlsx'))
+    if not files:
+        print("エラー: main_*.xlsx ファイルが見つかりません。")
+        return 1
+    for excel_file in files:
+        scenes = []
+        dialogues = extract_all_dialogues(str(excel_file), scenes=scenes)
+        if dialogues is None:
+            return 1
+        title = extract_title_from_filename(excel_file.name)
+        output_path = save_to_file(dialogues, f'ai_input_{title}.txt')
+        print(f"✓ AIに送信するデータを保存しました: {output_path}")
+        changes = record_scenes(excel_file, scenes)
+        if changes is not None:
+            print(format_changes(excel_file.name, changes, '（前回の抽出との差分）'))
+        print()
+    return 0
+
+
+def cmd_render(args):
+    from pathlib import Path
+    from simple_converter import create_html_from_file, prepare_chapter_images
+
+    source = Path(args.source)
+    title = args.title or source.stem.replace('novel_output_', '').replace('ai_input_', '')
+    output_file = args.output or f'{title}.html'
+    image_map = None
+    if args.images:
+        with open(source, 'r', encoding='utf-8') as f:
+            image_map = prepare_chapter_images(f)
+    extras = None
+    if args.font is not None:
+        from font_subset import usable_font
+        extras = {'font': usable_font(args.font or None)}
+        if not extras['font']:
+            return 1
+    html_path = create_html_from_file(source, output_file=output_file, title=title, image_map=image_map,
+                                      extras=extras)
+    print(f"✓ HTMLファイルを生成しました: {html_path}")
+    return 0
+
+
+def cmd_batch(args):
+    from batch_converter import main
+    main(args.extra)
+    return 0
+
+
+def cmd_check(args):
+    from alignment_check import main
+    return main(args.titles, verbose=args.verbose, jobs=args.jobs)
+
+
+def cmd_status(args):
+    from job_journal import main
+    return main()
+
+
+def cmd_diff(args):
+    from build_manifest import main
+    return main(args.files)
+
+
+def cmd_export(args):
+    from pathlib import Path
+    from story_events import main
+
+    files = [Path(f) for f in args.files] or sorted(Path('.').glob('main_*.xlsx'))
+    if not files:
+        print("エラー: main_*.xlsx ファイルが見つかりません。")
+        return 1
+    return main(files, args.output)
+
+
+def cmd_inspect(args):
+    from workbook_inspector import main
+    main(args.files, head=args.head, top=args.top, jobs=args.jobs)
+    return 0
+
+
+def cmd_serve(args):
+    from preview_server import main
+    main(args.host, args.port)
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Excel → 小説風HTML 変換ツール')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    extract = sub.add_parser('extract', help='Excelから ai_input_[タイトル].txt を作成')
+    extract.add_argument('files', nargs='*', help='Excelファイル（省略時は main_*.xlsx）')
+    extract.set_defaults(func=cmd_extract)
+
+    render = sub.add_parser('render', help='小説テキストからHTMLを作成')
+    render.add_argument('source', help='小説テキスト（novel_output_*.txt など）')
+    render.add_argument('-o', '--output', help='output/ 以下の出力ファイル名（省略時は [タイトル].html）')
+    render.add_argument('--title', help='HTMLのタイトル')
+    render.add_argument('--images', action='store_true', help='画像をローカルキャッシュから表示')
+    render.add_argument('--font', nargs='?', const='', metavar='フォント',
+                        help='使っている文字だけのWebフォントを追加（省略時は config.py の FONT_SUBSET）')
+    render.set_defaults(func=cmd_render)
+
+    batch = sub.add_parser('batch', help='main_*.xlsx を一括処理（batch_converter.py と同じオプション）')
+    batch.set_defaults(func=cmd_batch, passthrough=True)
+
+    check = sub.add_parser('check', help='ai_input と novel_output の対応をチェック')
+    check.add_argument('titles', nargs='*', help='タイトル（例: main_0_暗黒時代・上、省略時は全章）')
+    check.add_argument('--verbose', action='store_true', help='抜けているセリフも1行ずつ表示')
+    check.add_argument('--jobs', type=int, default=None, help='並列数（省略時はCPU数）')
+    check.set_defaults(func=cmd_check)
+
+    status = sub.add_parser('status', help='一括処理の進み具合を表示（ワークブックは開きません）')
+    status.set_defaults(func=cmd_status)
+
+    diff = sub.add_parser('diff', help='前回の抽出から追加・削除・変更されたシーンを表示')
+    diff.add_argument('files', nargs='*', help='Excelファイル（省略時は main_*.xlsx）')
+    diff.set_defaults(func=cmd_diff)
+
+    export = sub.add_parser('export', help='物語データを1行1イベントのNDJSONで書き出す')
+    export.add_argument('files', nargs='*', help='Excelファイル（省略時は main_*.xlsx）')
+    export.add_argument('-o', '--output', help="出力先（'-' で標準出力、省略時は output/events_[タイトル].ndjson）")
+    export.set_defaults(func=cmd_export)
+
+    inspect = sub.add_parser('inspect', help='ワークブックの構造を確認')
+    inspect.add_argument('files', nargs='*', help='Excelファイル（省略時は main_*.xlsx）')
+    inspect.add_argument('--head', type=int, default=0, help='各シートの先頭から表示する行数')
+    inspect.add_argument('--top', type=int, default=10, help='表示する話者の人数')
+    inspect.add_argument('--jobs', type=int, default=None, help='並列数（省略時はCPU数）')
+    inspect.set_defaults(func=cmd_inspect)
+
+    serve = sub.add_parser('serve', help='プレビュー用のローカルサーバーを起動')
+    serve.add_argument('--host', default='127.0.0.1', help='待ち受けるアドレス')
+    serve.add_argument('--port', type=int, default=8000, help='ポート番号')
+    serve.set_defaults(func=cmd_serve)
+
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args, extra = parser.parse_known_args(argv)
+    # batch のオプションはそのまま batch_converter.py に渡す
+    if getattr(args, 'passthrough', False):
+        args.extra = extra
+    elif extra:
+        parser.error('不明な引数: ' + ' '.join(extra))
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -32,3 +32,81 @@ BRANCH_DISPLAY = {
     # - "inline": 地の文に自然に組み込む
     # - "separate_page": 独立したページとして表示
 }
+
+# 画像の設定（--images オプション使用時）
+IMAGE_SETTINGS = {
+    "source_dir": "images",        # 画像を探すローカルフォルダ（URLのファイル名で探します）
+    "allow_remote": False,         # ローカルにない画像をURLからダウンロードするか
+    "widths": [480, 960, 1440],    # 生成する縮小画像の幅（px）
+    "formats": ["webp", "jpeg"],   # 生成する画像形式
+    "quality": 80,                 # 画質（1〜100）
+}
+
+# Webフォントの設定（--font オプション使用時）
+# 明朝体のないスマホでも同じ字形で表示できるよう、手元のフォントから
+# 章で使っている文字だけを取り出した小さなWOFF2を作ってHTMLに埋め込みます
+FONT_SUBSET = {
+    "font_path": "fonts/NotoSerifJP-Regular.otf",  # 元にするフォント（.ttf / .otf）
+    "family": "NovelMincho",                       # CSSで使うフォント名
+    "max_workers": None,                           # 一括変換でサブセットを並列に作るプロセス数（None でCPU数）
+}
+
+# テキストページの分割
+# 1ページに入れる上限を超えた段落は次のページに送ります（セリフの途中では分割しません）
+PAGINATION = {
+    "max_chars": 500,   # 1ページの最大文字数（0で分割しない）
+    "max_lines": 16,    # 1ページの最大行数（話者付きのセリフは2行と数えます）
+}
+
+# ai_input の分割（--chunk オプション使用時）
+# シーンの区切り（長いシーンは選択肢ブロックの区切り）で、上限以下のファイルに分けます
+CHUNK_SETTINGS = {
+    "max_chars": 30000,      # 1ファイルの最大文字数
+    "max_tokens": 0,         # 1ファイルの最大トークン数（0以外を指定すると文字数の代わりにこちらを使います）
+    "tokens_per_char": 1.0,  # 1文字あたりのおおよそのトークン数（トークン数の見積もりに使用）
+}
+
+# 1つの章の描画を複数プロセスで行う設定（create_html 使用時）
+# 文字数が min_chars 以上の章だけ、シーンの区切りで分けて並列に描画します
+# （短い章はプロセスの起動の方が時間がかかるので1プロセスで描画します）
+RENDER_PARALLEL = {
+    "min_chars": 1000000,  # 並列に描画する章の最小文字数
+    "max_workers": None,   # プロセス数（None でCPU数）
+    "group_chars": 200000, # ファイルから少しずつ読んで描画するとき、1プロセスに渡すまとまりの文字数
+}
+
+# 描画キャッシュ（output/cache/render/）の上限
+# 上限を超えたら、最後に使ってから時間のたったものから削除します
+RENDER_CACHE = {
+    "max_mb": 500,        # キャッシュ全体の最大サイズ（MB）
+    "max_age_days": 30,   # この日数のあいだ使われなかったキャッシュは削除（0 で削除しない）
+}
+
+# 一括処理のパイプライン（batch_converter.py --pipeline）の設定
+# 読み込み・抽出・描画・書き出しを別々のスレッドで並行に進めます
+PIPELINE = {
+    "queue_depth": 2,  # 各段階の間で待たせておける章の数（大きいほど速いことがありますが、メモリを使います）
+}
+
+# 一括処理の並列実行（batch_converter.py --jobs=N --max-memory=SIZE）の設定
+# 1ファイルのメモリ使用量の見積もり = base_mb + シートと共有文字列のXML（展開後、MB）× mb_per_xml_mb + シート数 × mb_per_sheet
+SCHEDULER = {
+    "jobs": None,  # --max-memory だけを指定したときの並列数（None でCPU数）
+    "base_mb": 30,         # 1ファイルの処理に必ず使う分（Pythonとopenpyxlなど）
+    "mb_per_xml_mb": 1.2,
+    "mb_per_sheet": 0.2,
+}
+
+# オフライン用のサービスワーカー（batch_converter.py --offline）の設定
+OFFLINE_CACHE = {
+    "cache_name": "novel",         # ブラウザのキャッシュの名前（同じサイトに複数の作品を置く場合は作品ごとに変える）
+    "runtime_max_entries": 200,    # 表示時にキャッシュする画像・ページの最大数（古いものから削除）
+}
+
+# アプリ（app.py）の複数ファイルの一括変換の設定
+APP_JOBS = {
+    "max_workers": None,   # 同時に変換するファイル数（None でCPU数）
+    "max_file_mb": 200,    # 1ファイルの大きさの上限（MB、zipの中のファイルは展開後）
+    "keep_jobs": 20,       # 残しておく変換済みのジョブ（zip）の数
+    "max_cache_mb": 500,   # 変換結果（output/uploads/）の合計の上限（MB、最後に使ったのが古いものから削除）
+}
@@ -0,0 +1,258 @@
+"""
+抽出した会話データをSQLiteに保存して検索するツール
+
+Excelを毎回開き直さずに、話者ごとのセリフ数や分岐数、画像一覧を
+すぐに調べられるようにします。内容が変わっていないExcelは
+ハッシュ値で判定して再取り込みをスキップします。変わったExcelも、
+シートごとの指紋（build_manifest.py と同じ方法）を比べて、変わったシートの行だけを入れ替えます。
+
+使い方:
+    python corpus_db.py ingest main_0_暗黒時代・上.xlsx   # 取り込み（省略時は main_*.xlsx 全部）
+    python corpus_db.py speakers [ワークブック名]          # 話者ごとのセリフ数
+    python corpus_db.py decisions [ワークブック名]         # シートごとの分岐数
+    python corpus_db.py images [ワークブック名]            # 画像・背景の一覧
+"""
+
+import hashlib
+import sqlite3
+from datetime import datetime
+from itertools import groupby
+from operator import itemgetter
+from pathlib import Path
+
+from build_manifest import fingerprint_rows
+from story_rows import iter_workbook_rows
+
+DEFAULT_DB_PATH = Path('output') / 'corpus.sqlite3'
+
+IMAGE_KINDS = ('image', 'imagetween', 'background')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS workbooks (
+    workbook TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    row_count INTEGER NOT NULL,
+    ingested_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rows (
+    workbook TEXT NOT NULL,
+    sheet TEXT NOT NULL,
+    row INTEGER NOT NULL,
+    speaker TEXT,
+    text TEXT,
+    kind TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sheets (
+    workbook TEXT NOT NULL,
+    sheet TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    PRIMARY KEY (workbook, sheet)
+);
+CREATE INDEX IF NOT EXISTS idx_rows_speaker ON rows (speaker);
+CREATE INDEX IF NOT EXISTS idx_rows_sheet ON rows (workbook, sheet);
+CREATE INDEX IF NOT EXISTS idx_rows_kind ON rows (kind);
+"""
+
+
+def connect(db_path=DEFAULT_DB_PATH):
+    """データベースを開く（なければ作成）"""
+    db_path = Path(db_path)
+    db_path.parent.mkdir(exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def file_sha256(path):
+    """ファイルのSHA-256を計算"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def ingest_workbook(conn, excel_file, force=False, chapter=None):
+    """ワークブックの行をデータベースに取り込む
+
+    シートごとの指紋が前回の取り込みと同じシートはそのまま残し、
+    変わったシートの行だけを入れ替えます（なくなったシートの行は削除します）。
+
+    Args:
+        conn: connect() で開いた接続
+        excel_file: Excelファイルのパス
+        force: Trueの場合、内容が同じでも全シートを取り込み直す
+        chapter: 読み込み済みの story_rows.ChapterRows（指定するとExcelを開き直さない）
+
+    Returns:
+        (行数, 入れ替えたシートの数)。内容が変わっていなくてスキップした場合は None
+    """
+    excel_file = Path(excel_file)
+    workbook = excel_file.name
+    sha256 = file_sha256(excel_file)
+
+    if not force:
+        stored = conn.execute(
+            'SELECT sha256 FROM workbooks WHERE workbook = ?', (workbook,)
+        ).fetchone()
+        if stored and stored[0] == sha256:
+            return None
+
+    source = chapter.iter_rows() if chapter is not None else iter_workbook_rows(excel_file)
+    row_count = 0
+    changed_sheets = 0
+    with conn:
+        if force:
+            conn.execute('DELETE FROM rows WHERE workbook = ?', (workbook,))
+            conn.execute('DELETE FROM sheets WHERE workbook = ?', (workbook,))
+        stored_sheets = dict(conn.execute(
+            'SELECT sheet, fingerprint FROM sheets WHERE workbook = ?', (workbook,)))
+        seen = set()
+        # 1シートずつ読み、指紋が変わったシートだけ書き込む
+        for sheet, sheet_rows in groupby(source, key=itemgetter(0)):
+            rows = [(workbook, sheet, row, speaker, text, kind) for _, row, speaker, text, kind in sheet_rows]
+            fingerprint = fingerprint_rows(r[2:] for r in rows)
+            seen.add(sheet)
+            row_count += len(rows)
+            if stored_sheets.get(sheet) == fingerprint:
+                continue
+            conn.execute('DELETE FROM rows WHERE workbook = ? AND sheet = ?', (workbook, sheet))
+            conn.executemany('INSERT INTO rows VALUES (?, ?, ?, ?, ?, ?)', rows)
+            conn.execute('INSERT OR REPLACE INTO sheets VALUES (?, ?, ?)', (workbook, sheet, fingerprint))
+            changed_sheets += 1
+
+        # なくなったシート（以前の取り込みで行があったシートを含む）を削除
+        old_sheets = set(stored_sheets) | {sheet for (sheet,) in conn.execute(
+            'SELECT DISTINCT sheet FROM rows WHERE workbook = ?', (workbook,))}
+        for sheet in old_sheets - seen:
+            conn.execute('DELETE FROM rows WHERE workbook = ? AND sheet = ?', (workbook, sheet))
+            conn.execute('DELETE FROM sheets WHERE workbook = ? AND sheet = ?', (workbook, sheet))
+            changed_sheets += 1
+
+        conn.execute(
+            'INSERT OR REPLACE INTO workbooks VALUES (?, ?, ?, ?)',
+            (workbook, sha256, row_count, datetime.now().isoformat(timespec='seconds')),
+        )
+    return row_count, changed_sheets
+
+
+def ingest_workbooks(conn, excel_files, force=False, chapters=None):
+    """複数のワークブックを取り込み、結果を表示
+
+    chapters: {ファイル名: ChapterRows}。含まれるファイルはExcelを開き直さずに取り込みます
+    """
+    chapters = chapters or {}
+    for excel_file in excel_files:
+        result = ingest_workbook(conn, excel_file, force=force, chapter=chapters.get(Path(excel_file).name))
+        if result is None:
+            print(f"  - {Path(excel_file).name}: 変更なし（スキップ）")
+        else:
+            count, changed_sheets = result
+            print(f"  ✓ {Path(excel_file).name}: {count:,} 行を取り込みました（入れ替えたシート {changed_sheets}個）")
+
+
+def _workbook_filter(workbook):
+    if workbook is None:
+        return '', ()
+    return ' AND workbook = ?', (workbook,)
+
+
+def speaker_counts(conn, workbook=None):
+    """話者ごとのセリフ数 [(話者, 行数), ...] を多い順に返す"""
+    where, params = _workbook_filter(workbook)
+    return conn.execute(
+        f"SELECT speaker, COUNT(*) FROM rows WHERE kind = 'line'{where} "
+        "GROUP BY speaker ORDER BY COUNT(*) DESC, speaker",
+        params,
+    ).fetchall()
+
+
+def decision_counts(conn, workbook=None):
+    """シートごとの分岐数 [(ワークブック, シート, 分岐数), ...] を返す"""
+    where, params = _workbook_filter(workbook)
+    return conn.execute(
+        f"SELECT workbook, sheet, COUNT(*) FROM rows WHERE kind = 'decision'{where} "
+        "GROUP BY workbook, sheet ORDER BY MIN(rowid)",
+        params,
+    ).fetchall()
+
+
+def image_list(conn, workbook=None):
+    """画像・背景の一覧 [(ワークブック, シート, 行番号, 種類, URL), ...] を返す"""
+    where, params = _workbook_filter(workbook)
+    placeholders = ', '.join('?' for _ in IMAGE_KINDS)
+    return conn.execute(
+        f"SELECT workbook, sheet, row, kind, text FROM rows WHERE kind IN ({placeholders}){where} "
+        "ORDER BY rowid",
+        IMAGE_KINDS + params,
+    ).fetchall()
+
+
+def decision_blocks(conn, workbook=None):
+    """分岐ブロック（--Decision-- から --Branch-- までの行）を返す
+
+    Returns:
+        [(ワークブック, シート, 行番号, 話者, テキスト, 種類), ...]
+    """
+    where, params = _workbook_filter(workbook)
+    return conn.execute(
+        "SELECT workbook, sheet, row, speaker, text, kind FROM rows "
+        f"WHERE kind IN ('decision', 'option', 'decision_end', 'branch'){where} ORDER BY rowid",
+        params,
+    ).fetchall()
+
+
+def default_excel_files():
+    """フォルダ内の main_*.xlsx を返す"""
+    return sorted(Path('.').glob('main_*.xlsx'))
+
+
+def open_corpus(excel_files=None, db_path=DEFAULT_DB_PATH):
+    """データベースを開き、変更のあったワークブックだけ取り込んでから返す"""
+    conn = connect(db_path)
+    if excel_files is None:
+        excel_files = default_excel_files()
+    for excel_file in excel_files:
+        ingest_workbook(conn, excel_file)
+    return conn
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description='会話データのSQLiteコーパス')
+    parser.add_argument('--db', default=str(DEFAULT_DB_PATH), help='データベースファイル')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    ingest = sub.add_parser('ingest', help='Excelを取り込む')
+    ingest.add_argument('files', nargs='*', help='Excelファイル（省略時は main_*.xlsx）')
+    ingest.add_argument('--force', action='store_true', help='変更がなくても取り込み直す')
+
+    for name, help_text in (('speakers', '話者ごとのセリフ数'),
+                            ('decisions', 'シートごとの分岐数'),
+                            ('images', '画像・背景の一覧')):
+        query = sub.add_parser(name, help=help_text)
+        query.add_argument('workbook', nargs='?', help='ワークブック名（例: main_0_暗黒時代・上.xlsx）')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'ingest':
+        conn = connect(args.db)
+        files = [Path(f) for f in args.files] or default_excel_files()
+        ingest_workbooks(conn, files, force=args.force)
+        return
+
+    conn = open_corpus(db_path=args.db)
+    if args.command == 'speakers':
+        for speaker, count in speaker_counts(conn, args.workbook):
+            print(f"{count:6,d}  {speaker}")
+    elif args.command == 'decisions':
+        for workbook, sheet, count in decision_counts(conn, args.workbook):
+            print(f"{count:4d}  {workbook} / {sheet}")
+    elif args.command == 'images':
+        for workbook, sheet, row, kind, url in image_list(conn, args.workbook):
+            print(f"{workbook} / {sheet} 行{row:4d} [{kind}] {url}")
+
+
+if __name__ == '__main__':
+    main()
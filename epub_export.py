@@ -0,0 +1,357 @@
+"""
+EPUB 3 形式で出力
+
+縦書き（vertical-rl）・右から左へのページ送り（page-progression-direction="rtl"）の
+EPUBを作ります。【シーン: …】ごとに1つのXHTMLファイルに分け、各ページは
+create_html と同じ render_pages() で作ります。ZIPはシーンごとにディスクへ
+書き出すので、本全体をメモリ上に組み立てません。描画結果はシーンごとに
+描画キャッシュ（render_cache.py）に入るので、新しいエクスポートで変わったシーンだけを描画し直します。
+
+--images で作ったローカル画像（image_cache.py）があれば、EPUBの中に同梱します。
+"""
+
+import html
+import re
+import shutil
+import uuid
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+from output_writer import atomic_stream
+from simple_converter import render_pages_cached
+
+# 同じ内容なら同じバイト列になるように、ZIP内の日時は固定する
+ZIP_DATE = (1980, 1, 1, 0, 0, 0)
+
+MEDIA_TYPES = {
+    '.webp': 'image/webp',
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.gif': 'image/gif',
+}
+
+CONTAINER_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+    <rootfiles>
+        <rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>
+    </rootfiles>
+</container>
+"""
+
+EPUB_CSS = """@charset "UTF-8";
+html {
+    writing-mode: vertical-rl;
+    -webkit-writing-mode: vertical-rl;
+    -epub-writing-mode: vertical-rl;
+}
+body {
+    margin: 0;
+    font-family: serif;
+    line-height: 1.8;
+    text-align: justify;
+}
+.page {
+    margin: 0 0 1em 0;
+}
+h1, h2, h3 {
+    text-align: center;
+    page-break-after: always;
+    break-after: page;
+}
+h1 { font-size: 2em; }
+h2 { font-size: 1.5em; }
+.speaker {
+    font-weight: bold;
+    color: #2C5F2D;
+}
+.branch-marker {
+    font-weight: bold;
+    color: #8B4513;
+}
+.choice-text {
+    font-weight: bold;
+    color: #1565C0;
+}
+img.illustration {
+    display: block;
+    max-width: 100%;
+    max-height: 100%;
+    margin: auto;
+    page-break-before: always;
+    page-break-after: always;
+}
+.tcy {
+    text-combine-upright: all;
+    -webkit-text-combine: horizontal;
+    -epub-text-combine: horizontal;
+}
+p {
+    margin: 0;
+}
+"""
+
+XHTML_HEAD = """<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE html>
+<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops" xml:lang="ja" lang="ja">
+<head>
+    <meta charset="UTF-8" />
+    <title>{title}</title>
+    <link rel="stylesheet" type="text/css" href="style.css" />
+</head>
+<body>
+"""
+
+XHTML_TAIL = """
+</body>
+</html>
+"""
+
+_VOID_TAG = re.compile(r'<(br|img|source)\b([^>]*?)\s*/?>')
+_BARE_AMP = re.compile(r'&(?!(?:[A-Za-z][A-Za-z0-9]*|#[0-9]+|#x[0-9A-Fa-f]+);)')
+# 描画処理（simple_converter / image_cache）が出力するタグと文字参照。これ以外はすべて本文のテキスト
+_MARKUP = re.compile(r'(</?(?:br|div|h1|h2|img|p|picture|source|span)\b[^<>]*>'
+                     r'|&(?:[A-Za-z][A-Za-z0-9]*|#[0-9]+|#x[0-9A-Fa-f]+);)')
+_LOCAL_IMG_SRC = re.compile(r'<img [^>]*src="(images/[^"]+)"')
+
+
+def to_xhtml(fragment):
+    """HTMLの断片をXHTMLとして正しい形にする
+
+    描画処理はセリフの文字をエスケープしないので、タグと文字参照以外の部分（本文のテキスト）の
+    < > & をエスケープします。タグは空要素を閉じ、属性（画像のURLなど）の & をエスケープします。
+    """
+    parts = _MARKUP.split(fragment)
+    for i, part in enumerate(parts):
+        if i % 2 == 0:
+            parts[i] = html.escape(part, quote=False)
+        elif part.startswith('<'):
+            parts[i] = _VOID_TAG.sub(r'<\1\2 />', _BARE_AMP.sub('&amp;', part))
+    return ''.join(parts)
+
+
+def _escape(text):
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;')
+
+
+def split_scenes(novel_text):
+    """【シーン: …】の行で区切り、(シーン名, テキスト) を順に返す
+
+    最初のシーンより前にテキストがある場合は、シーン名 None で返します。
+    """
+    scene_title = None
+    lines = []
+    for line in novel_text.split('\n'):
+        stripped = line.strip()
+        if stripped.startswith('【シーン:') and '】' in stripped:
+            if scene_title is not None or ''.join(lines).strip(' \n='):
+                yield scene_title, '\n'.join(lines)
+            scene_title = stripped.replace('【シーン:', '').replace('】', '').strip()
+            lines = [line]
+        else:
+            lines.append(line)
+    if scene_title is not None or ''.join(lines).strip(' \n='):
+        yield scene_title, '\n'.join(lines)
+
+
+def _epub_image_map(image_map):
+    """EPUB用に、一番大きいJPEG（なければ元の src）1枚だけを使う画像情報にする"""
+    epub_map = {}
+    for url, info in (image_map or {}).items():
+        epub_map[url] = dict(info, srcset={})
+    return epub_map
+
+
+def _zip_info(name, compress=True):
+    info = zipfile.ZipInfo(name, ZIP_DATE)
+    info.compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+    info.external_attr = 0o644 << 16
+    return info
+
+
+def _write_entry(zf, name, text, compress=True):
+    zf.writestr(_zip_info(name, compress), text.encode('utf-8'))
+
+
+def _write_document(zf, href, title, pages):
+    """XHTMLを1つ、ページごとにZIPへ書き出す"""
+    with zf.open(_zip_info(f'OEBPS/{href}'), 'w') as entry:
+        entry.write(XHTML_HEAD.replace('{title}', _escape(title)).encode('utf-8'))
+        for page in pages:
+            entry.write(page.encode('utf-8'))
+            entry.write(b'\n\n')
+        entry.write(XHTML_TAIL.encode('utf-8'))
+
+
+def _nav_document(title, toc):
+    items = []
+    for chapter_title, chapter_href, scenes in toc:
+        scene_items = ''.join(
+            f'\n                <li><a href="{href}">{_escape(scene_title)}</a></li>'
+            for scene_title, href in scenes
+        )
+        if chapter_title is None:
+            items.append(scene_items)
+            continue
+        items.append(f'\n        <li><a href="{chapter_href}">{_escape(chapter_title)}</a>'
+                     + (f'\n            <ol>{scene_items}\n            </ol>' if scene_items else '')
+                     + '\n        </li>')
+    return (XHTML_HEAD.replace('{title}', _escape(title))
+            + '    <nav epub:type="toc" id="toc">\n'
+            + f'        <h1>{_escape(title)}</h1>\n'
+            + '        <ol>' + ''.join(items) + '\n        </ol>\n'
+            + '    </nav>' + XHTML_TAIL)
+
+
+def _package_document(title, modified, documents, images):
+    book_id = uuid.uuid5(uuid.NAMESPACE_URL, f'excel-to-novel-html:{title}')
+    manifest = [
+        '        <item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>',
+        '        <item id="css" href="style.css" media-type="text/css"/>',
+    ]
+    for doc_id, href, properties in documents:
+        props = f' properties="{properties}"' if properties else ''
+        manifest.append(f'        <item id="{doc_id}" href="{href}" media-type="application/xhtml+xml"{props}/>')
+    for number, src in enumerate(images, 1):
+        media_type = MEDIA_TYPES.get(Path(src).suffix.lower(), 'application/octet-stream')
+        manifest.append(f'        <item id="img{number:04d}" href="{src}" media-type="{media_type}"/>')
+    spine = '\n'.join(f'        <itemref idref="{doc_id}"/>' for doc_id, _, _ in documents)
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="bookid" xml:lang="ja">
+    <metadata xmlns:dc="http://purl.org/dc/elements/1.1/">
+        <dc:identifier id="bookid">urn:uuid:{book_id}</dc:identifier>
+        <dc:title>{_escape(title)}</dc:title>
+        <dc:language>ja</dc:language>
+        <meta property="dcterms:modified">{modified.strftime('%Y-%m-%dT%H:%M:%SZ')}</meta>
+    </metadata>
+    <manifest>
+{chr(10).join(manifest)}
+    </manifest>
+    <spine page-progression-direction="rtl">
+{spine}
+    </spine>
+</package>
+"""
+
+
+def create_volume_epub(chapters, output_file, title, image_map=None, modified=None):
+    """複数の章をまとめて1冊のEPUBを作る
+
+    Args:
+        chapters: (章タイトル, 小説テキスト) のイテラブル。1章ずつ読み込む
+            ジェネレーターを渡すと、同時にメモリに載るのは1章分だけです。
+            章タイトルが None の場合は章の扉ページを作りません
+        output_file: output/ 以下のファイル名
+        title: 本のタイトル
+        image_map: image_cache.prepare_images() の結果（ローカル画像を同梱）
+        modified: 更新日時（省略時は現在時刻）
+    """
+    output_path = Path('output') / output_file
+    modified = (modified or datetime.now(timezone.utc)).astimezone(timezone.utc)
+    epub_map = _epub_image_map(image_map)
+
+    documents = [('title', 'title.xhtml', '')]
+    toc = []
+    images = set()
+
+    with atomic_stream(output_path) as f, zipfile.ZipFile(f, 'w') as zf:
+        # mimetype は無圧縮で先頭に置く決まり
+        _write_entry(zf, 'mimetype', 'application/epub+zip', compress=False)
+        _write_entry(zf, 'META-INF/container.xml', CONTAINER_XML)
+        _write_entry(zf, 'OEBPS/style.css', EPUB_CSS)
+        _write_document(zf, 'title.xhtml', title,
+                        [f'<div class="page">\n        <h1>{_escape(title)}</h1>\n    </div>'])
+
+        for chapter_number, (chapter_title, novel_text) in enumerate(chapters, 1):
+            chapter_href = None
+            if chapter_title is not None:
+                chapter_href = f'chapter_{chapter_number:03d}.xhtml'
+                _write_document(zf, chapter_href, chapter_title,
+                                [f'<div class="page">\n        <h1>{_escape(chapter_title)}</h1>\n    </div>'])
+                documents.append((f'chapter_{chapter_number:03d}', chapter_href, ''))
+
+            scenes = []
+            for scene_number, (scene_title, scene_text) in enumerate(split_scenes(novel_text), 1):
+                pages = [to_xhtml(page) for page in render_pages_cached(scene_text, image_map=epub_map)]
+                if not pages:
+                    continue
+                doc_id = f'c{chapter_number:03d}_s{scene_number:03d}'
+                href = f'{doc_id}.xhtml'
+                label = scene_title or chapter_title or title
+                _write_document(zf, href, label, pages)
+
+                remote = any('src="https://' in page for page in pages)
+                documents.append((doc_id, href, 'remote-resources' if remote else ''))
+                for page in pages:
+                    images.update(_LOCAL_IMG_SRC.findall(page))
+                if scene_title is not None:
+                    scenes.append((scene_title, href))
+            toc.append((chapter_title, chapter_href or (scenes[0][1] if scenes else None), scenes))
+
+        # ローカル画像を同梱（ファイルから少しずつコピー）
+        images = sorted(images)
+        for src in images:
+            with open(Path('output') / src, 'rb') as source, \
+                    zf.open(_zip_info(f'OEBPS/{src}', compress=False), 'w') as entry:
+                shutil.copyfileobj(source, entry)
+
+        _write_entry(zf, 'OEBPS/nav.xhtml', _nav_document(title, toc))
+        _write_entry(zf, 'OEBPS/content.opf', _package_document(title, modified, documents, images))
+
+    return output_path
+
+
+def create_epub(novel_text, output_file, title='小説', image_map=None, modified=None):
+    """小説テキストから1冊のEPUBを作る（create_html のEPUB版）"""
+    return create_volume_epub([(None, novel_text)], output_file, title,
+                              image_map=image_map, modified=modified)
+
+
+def _read_text(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def _modified_time(paths):
+    newest = max(Path(p).stat().st_mtime for p in paths)
+    return datetime.fromtimestamp(newest, timezone.utc)
+
+
+def build_chapter_epub(source_path, output_file, title, image_map=None):
+    """テキストファイルからEPUBを作る（プロセスプールから呼ばれる）"""
+    return create_epub(_read_text(source_path), output_file, title=title,
+                       image_map=image_map, modified=_modified_time([source_path]))
+
+
+def build_epubs(chapters, volume_title=None, image_maps=None, max_workers=None):
+    """章ごとのEPUB（または1冊にまとめたEPUB）を作る
+
+    Args:
+        chapters: (ファイル名用タイトル, 表示タイトル, テキストファイルのパス) のリスト
+        volume_title: 指定した場合は全章を1冊にまとめる（ファイル名は volume.epub）
+        image_maps: {ファイル名用タイトル: image_map}
+
+    Returns:
+        作成したEPUBのパスのリスト
+    """
+    image_maps = image_maps or {}
+    if not chapters:
+        return []
+
+    if volume_title is not None:
+        merged_map = {}
+        for chapter_map in image_maps.values():
+            merged_map.update(chapter_map or {})
+        chapter_texts = ((display_title, _read_text(source_path))
+                         for _, display_title, source_path in chapters)
+        return [create_volume_epub(chapter_texts, 'volume.epub', volume_title, image_map=merged_map,
+                                   modified=_modified_time([p for _, _, p in chapters]))]
+
+    args = [(source_path, f'{title}.epub', display_title, image_maps.get(title))
+            for title, display_title, source_path in chapters]
+    if len(args) == 1:
+        return [build_chapter_epub(*args[0])]
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(build_chapter_epub, *zip(*args)))
@@ -0,0 +1,208 @@
+"""
+章ごとのWebフォント（サブセット）の作成
+
+縦書きHTMLのCSSは 'Hiragino Mincho ProN', 'Yu Mincho', 'MS Mincho' を指定していますが、
+Androidなどこれらのフォントがない環境では字形がそろいません。かといって日本語の
+明朝体をそのまま配ると数MBになります。
+
+ここでは描画したページから実際に表示される文字を集め、手元のフォント
+（FONT_SUBSET["font_path"]）からその文字だけを取り出した WOFF2 を output/fonts/ に作り、
+HTMLの <head> に @font-face を入れます。@font-face はHTMLを書き出すときに
+テンプレートに入れるので、HTMLを書き出した後に書き換えることはありません。
+
+- 作ったフォントはフォントと文字の集合のハッシュをファイル名にするので、
+  同じ文字しか使っていない章や、前回から文字が変わっていない章は作り直しません。
+- 一括変換では subset_pool() の中で呼び出し、サブセットの作成をプロセスプール
+  （FONT_SUBSET["max_workers"]）に任せて、待たずに次の章の描画に進みます。
+- サブセットの作成には fontTools を使います（pip install fonttools brotli）。
+"""
+
+import contextlib
+import functools
+import hashlib
+import html
+import importlib.util
+import io
+import os
+import re
+from pathlib import Path
+
+from output_writer import write_output
+
+try:
+    from config import FONT_SUBSET
+except ImportError:
+    FONT_SUBSET = {"font_path": "fonts/NotoSerifJP-Regular.otf", "family": "NovelMincho", "max_workers": None}
+
+FONTS_DIR = Path('output') / 'fonts'
+
+HAS_FONTTOOLS = importlib.util.find_spec('fontTools') is not None
+
+# 数字や英字は縦中横などで使われやすいので、常にすべて含める
+ASCII_CHARS = ''.join(chr(code) for code in range(0x20, 0x7f))
+
+# テンプレートの <style> と区別できるように、@font-face の <style> には id を付ける
+STYLE_START = '    <style id="font-subset">\n'
+STYLE_END = '    </style>\n'
+
+_TAG = re.compile(r'<[^>]*>')
+
+# subset_pool() の中で使うプロセスプールと、作成中のサブセット {パス: Future}
+_pool = None
+_pending = {}
+
+
+def collect_charset(texts):
+    """表示される文字（タグとCSSを除いた部分）を、並べた文字列で返す
+
+    Args:
+        texts: ページのHTMLやタイトルなど、HTMLの断片の並び（1行ずつでもページごとでもよい）
+    """
+    chars = set(ASCII_CHARS)
+    in_style = False
+    for text in texts:
+        if in_style:
+            in_style = '</style>' not in text
+            continue
+        if text.lstrip().startswith('<style'):
+            in_style = '</style>' not in text
+            continue
+        chars.update(html.unescape(_TAG.sub('', text)))
+    return ''.join(sorted(c for c in chars if c == ' ' or not c.isspace()))
+
+
+@functools.lru_cache(maxsize=4)
+def _font_digest(font_path, mtime_ns, size):
+    digest = hashlib.sha256()
+    with open(font_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def font_digest(font_path):
+    """元のフォントファイルの内容のハッシュ（章ごとに読み直さないように、更新日時と大きさで覚えておく）"""
+    stat = os.stat(font_path)
+    return _font_digest(str(font_path), stat.st_mtime_ns, stat.st_size)
+
+
+def subset_path(font_hash, charset):
+    """フォントと文字の集合から、サブセットの保存先を決める"""
+    digest = hashlib.sha256(font_hash.encode('ascii'))
+    digest.update(charset.encode('utf-8'))
+    return FONTS_DIR / f'{digest.hexdigest()[:20]}.woff2'
+
+
+def subset_font(font_path, charset, output_path):
+    """フォントから charset の文字だけを取り出して WOFF2 で保存"""
+    from fontTools import subset
+
+    options = subset.Options()
+    options.flavor = 'woff2'
+    options.layout_features = ['*']  # 縦書き用の字形（vert / vrt2）などを残す
+    font = subset.load_font(str(font_path), options)
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(text=charset)
+    subsetter.subset(font)
+    buffer = io.BytesIO()
+    subset.save_font(font, buffer, options)
+    font.close()
+    write_output(output_path, buffer.getvalue())
+
+
+def prepare_subset(charset, font_path, font_hash):
+    """文字の集合のサブセットを用意する
+
+    Returns:
+        (サブセットのパス, 作り直さずに済んだか)
+    """
+    output_path = subset_path(font_hash, charset)
+    cached = output_path.exists()
+    if not cached:
+        subset_font(font_path, charset, output_path)
+    return output_path, cached
+
+
+@contextlib.contextmanager
+def subset_pool(max_workers=None, settings=None):
+    """この中で呼んだ font_style() は、サブセットの作成をプロセスプールに任せて待たずに返す
+
+    @font-face で指定するファイル名は文字の集合だけで決まるので、HTMLは先に書き出せます。
+    抜けるときにすべてのサブセットができるのを待ちます（オフライン用の一覧を作る前に抜けること）。
+    """
+    global _pool
+    from concurrent.futures import ProcessPoolExecutor
+
+    settings = settings or FONT_SUBSET
+    _pool = ProcessPoolExecutor(max_workers=max_workers or settings.get('max_workers'))
+    try:
+        yield
+    finally:
+        pending = list(_pending.items())
+        _pending.clear()
+        try:
+            for output_path, (names, length, future) in pending:
+                try:
+                    future.result()
+                except Exception as e:  # フォントがなくても、HTMLは CSS の次のフォントで表示される
+                    print(f"⚠ フォントのサブセットを作れませんでした: {output_path.name}: {type(e).__name__}: {e}")
+                    continue
+                for name in names:
+                    _report(name, length, output_path, cached=False)
+        finally:
+            _pool.shutdown()
+            _pool = None
+
+
+def _report(name, length, output_path, cached):
+    note = '（キャッシュ）' if cached else ''
+    print(f"✓ フォントのサブセット: {name}: {length:,}文字 → {output_path.name} "
+          f"({output_path.stat().st_size / 1024:,.1f} KB){note}")
+
+
+def font_face_css(font_file, family):
+    """HTMLの <head> に追加する <style>（本文のフォントの先頭にサブセットを指定）"""
+    return (STYLE_START
+            + f"        @font-face {{ font-family: '{family}'; src: url('{font_file}') format('woff2'); }}\n"
+            + f"        .page {{ font-family: '{family}', 'Hiragino Mincho ProN', 'Yu Mincho', 'MS Mincho', serif; }}\n"
+            + STYLE_END)
+
+
+def font_style(html_path, texts, font_path=None, settings=None):
+    """HTMLの <head> に入れる @font-face の <style> を返す（サブセットがなければ作る）
+
+    HTMLを書き出す前に、描画したページから文字を集めて呼び出します
+    （simple_converter.html_additions から呼ばれる）。subset_pool() の中では
+    サブセットの作成を待たずに返します。
+
+    Args:
+        html_path: 書き出すHTMLのパス（フォントへの相対パスを決めるため）
+        texts: HTMLで表示するページやタイトル（collect_charset を参照）
+    """
+    settings = settings or FONT_SUBSET
+    font_path = Path(font_path or settings['font_path'])
+    charset = collect_charset(texts)
+    font_hash = font_digest(font_path)
+    output_path = subset_path(font_hash, charset)
+    if output_path in _pending:  # 同じ文字の集合の章がすでに作成中
+        _pending[output_path][0].append(Path(html_path).name)
+    elif _pool is not None and not output_path.exists():
+        future = _pool.submit(subset_font, font_path, charset, output_path)
+        _pending[output_path] = ([Path(html_path).name], len(charset), future)
+    else:
+        output_path, cached = prepare_subset(charset, font_path, font_hash)
+        _report(Path(html_path).name, len(charset), output_path, cached)
+    font_file = Path(os.path.relpath(output_path, Path(html_path).parent)).as_posix()
+    return font_face_css(font_file, settings.get('family', 'NovelMincho'))
+
+
+def usable_font(font_path=None):
+    """サブセットを作れる場合はフォントのパスを返す（作れない場合は理由を表示して None）"""
+    font_path = Path(font_path or FONT_SUBSET['font_path'])
+    if not HAS_FONTTOOLS:
+        print("⚠ fontTools がないため、フォントのサブセットは作成しません（pip install fonttools brotli）")
+        return None
+    if not font_path.exists():
+        print(f"⚠ フォントが見つかりません: {font_path}（config.py の FONT_SUBSET で指定してください）")
+        return None
+    return font_path
@@ -0,0 +1,298 @@
+"""
+イラスト・背景画像のローカルキャッシュとレスポンシブ画像の生成
+
+[画像] / [背景] のURLを取得関数（fetcher）で読み込み、内容のハッシュで
+output/cache/images/ に保存します。そこから幅ごとに縮小した
+WebP / JPEG を output/images/ に作り、srcset・width/height・遅延読み込み
+付きの <img> タグを出力します。
+
+- 取得関数は url を受け取って bytes（見つからなければ None）を返す関数です。
+  既定ではローカルフォルダ（IMAGE_SETTINGS["source_dir"]）から探すので、オフラインでも動きます。
+- 縮小には Pillow を使います（pip install pillow）。ない場合は元画像をそのままコピーします。
+- キャッシュの画像が壊れていて読めない場合は、キャッシュから削除して1回だけ取得し直します。
+  それでも読めない画像は、元のURLの <img> のまま表示します（一括処理は止めません）。
+"""
+
+import hashlib
+import json
+import re
+import urllib.parse
+from pathlib import Path
+
+from output_writer import atomic_stream, count_unchanged, write_output
+
+try:
+    from config import IMAGE_SETTINGS
+except ImportError:
+    IMAGE_SETTINGS = {
+        "source_dir": "images",
+        "allow_remote": False,
+        "widths": [480, 960, 1440],
+        "formats": ["webp", "jpeg"],
+        "quality": 80,
+    }
+
+CACHE_DIR = Path('output') / 'cache' / 'images'
+IMAGES_DIR = Path('output') / 'images'
+
+# 画像行の判定（create_html と同じ条件）
+IMAGE_MARKERS = ('[画像]', '[背景]', '【--background--】', '【--imagetween--】')
+URL_PATTERN = re.compile(r'https://[^\s\)\]]+')
+
+MIME_TYPES = {'webp': 'image/webp', 'jpeg': 'image/jpeg'}
+
+
+def find_image_urls(text):
+    """テキスト中の画像URLを出現順に（重複なしで）返す
+
+    text は文字列か、開いたファイルなど行のイテラブル（大きなファイルを少しずつ読む場合）
+    """
+    urls = {}
+    lines = text.split('\n') if isinstance(text, str) else text
+    for line in lines:
+        if 'https://' in line and any(marker in line for marker in IMAGE_MARKERS):
+            match = URL_PATTERN.search(line)
+            if match:
+                urls.setdefault(match.group(0))
+    return list(urls)
+
+
+def local_dir_fetcher(source_dir):
+    """ローカルフォルダから画像を探す取得関数を返す
+
+    URLのパス（例: images/bg/xxx.png）→ ファイル名（xxx.png）の順に探します。
+    """
+    source_dir = Path(source_dir)
+
+    def fetch(url):
+        path = urllib.parse.unquote(urllib.parse.urlparse(url).path).lstrip('/')
+        for candidate in (source_dir / path, source_dir / Path(path).name):
+            if candidate.is_file():
+                return candidate.read_bytes()
+        return None
+
+    return fetch
+
+
+def http_fetcher(timeout=30):
+    """URLから画像をダウンロードする取得関数を返す"""
+
+    import urllib.request
+
+    def fetch(url):
+        try:
+            with urllib.request.urlopen(url, timeout=timeout) as response:
+                return response.read()
+        except OSError:
+            return None
+
+    return fetch
+
+
+def chain_fetchers(*fetchers):
+    """前から順に試して、最初に見つかった画像を返す取得関数"""
+
+    def fetch(url):
+        for fetcher in fetchers:
+            data = fetcher(url)
+            if data is not None:
+                return data
+        return None
+
+    return fetch
+
+
+def default_fetcher(settings=None):
+    """設定に従った取得関数（ローカルフォルダ、必要ならURLからも取得）"""
+    settings = settings or IMAGE_SETTINGS
+    fetchers = [local_dir_fetcher(settings.get('source_dir', 'images'))]
+    if settings.get('allow_remote'):
+        fetchers.append(http_fetcher())
+    return chain_fetchers(*fetchers)
+
+
+def _load_index():
+    index_path = CACHE_DIR / 'index.json'
+    if index_path.exists():
+        with open(index_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {}
+
+
+def _save_index(index):
+    write_output(CACHE_DIR / 'index.json', json.dumps(index, ensure_ascii=False, indent=1, sort_keys=True))
+
+
+def cache_image(url, fetcher, index):
+    """画像をキャッシュに保存し、キャッシュ内のパスを返す（取得できなければ None）"""
+    cached = index.get(url)
+    if cached and (CACHE_DIR / cached).exists():
+        return CACHE_DIR / cached
+
+    data = fetcher(url)
+    if data is None:
+        return None
+    suffix = Path(urllib.parse.urlparse(url).path).suffix.lower() or '.img'
+    name = hashlib.sha256(data).hexdigest() + suffix
+    path = CACHE_DIR / name
+    if not path.exists():
+        write_output(path, data)
+    index[url] = name
+    return path
+
+
+def make_variants(cache_path, widths, formats, quality):
+    """縮小画像を作り、画像情報の辞書を返す（プロセスプールから呼ばれる）
+
+    ファイル名は内容のハッシュから決まるので、既にあるものは作り直しません。
+    キャッシュの画像が壊れていて読めない場合は None を返します。
+    """
+    cache_path = Path(cache_path)
+    key = cache_path.stem[:16]
+    try:
+        from PIL import Image
+    except ImportError:
+        # Pillowがない場合は元画像をそのまま使う
+        target = IMAGES_DIR / f'{key}{cache_path.suffix}'
+        write_output(target, cache_path.read_bytes())
+        return {'src': f'images/{target.name}', 'width': None, 'height': None, 'srcset': {}}
+
+    try:
+        image = Image.open(cache_path)
+        image.load()  # 途中で切れた画像などはここで OSError になる
+    except OSError:  # UnidentifiedImageError も OSError
+        return None
+    with image:
+        width, height = image.size
+        sizes = sorted({min(w, width) for w in widths}) or [width]
+        srcset = {}
+        for fmt in formats:
+            entries = []
+            for w in sizes:
+                target = IMAGES_DIR / f'{key}-{w}.{"jpg" if fmt == "jpeg" else fmt}'
+                if target.exists():
+                    # ファイル名が元画像のハッシュと幅で決まるので、縮小し直さなくても内容は同じ
+                    count_unchanged(target)
+                else:
+                    resized = image if w == width else image.resize((w, round(height * w / width)), Image.LANCZOS)
+                    if fmt == 'jpeg' and resized.mode not in ('RGB', 'L'):
+                        resized = resized.convert('RGB')
+                    with atomic_stream(target) as f:
+                        resized.save(f, fmt.upper(), quality=quality)
+                entries.append((f'images/{target.name}', w))
+            srcset[fmt] = entries
+
+    fallback_fmt = 'jpeg' if 'jpeg' in srcset else formats[-1]
+    # width/height は一番大きい縮小画像のサイズ（縦横比の確保用）
+    return {
+        'src': srcset[fallback_fmt][-1][0],
+        'width': sizes[-1],
+        'height': round(height * sizes[-1] / width),
+        'srcset': srcset,
+    }
+
+
+def _make_variants_in_worker(*args):
+    """make_variants をワーカープロセスで実行し、書き込みの集計も親プロセスに返す"""
+    from output_writer import WRITE_STATS
+
+    before = dict(WRITE_STATS)
+    info = make_variants(*args)
+    return info, {key: WRITE_STATS[key] - before[key] for key in before}
+
+
+def prepare_images(urls, fetcher=None, settings=None, max_workers=None):
+    """画像をキャッシュ・縮小して {URL: 画像情報} を返す
+
+    取得できなかった画像は含まれません（元のURLのまま表示されます）。
+    """
+    settings = settings or IMAGE_SETTINGS
+    fetcher = fetcher or default_fetcher(settings)
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    IMAGES_DIR.mkdir(parents=True, exist_ok=True)
+
+    index = _load_index()
+    cached = {}
+    for url in urls:
+        path = cache_image(url, fetcher, index)
+        if path is not None:
+            cached[url] = path
+
+    image_map = {}
+    if cached:
+        image_map, broken = _make_all_variants(cached, settings, max_workers)
+        if broken:
+            # 壊れたキャッシュを削除して取得し直し、もう1回だけ縮小してみる
+            retry = {}
+            for url in broken:
+                cached[url].unlink(missing_ok=True)
+                index.pop(url, None)
+                path = cache_image(url, fetcher, index)
+                if path is not None:
+                    retry[url] = path
+            retried, still_broken = _make_all_variants(retry, settings, max_workers) if retry else ({}, [])
+            image_map.update(retried)
+            for url in still_broken:
+                retry[url].unlink(missing_ok=True)
+                index.pop(url, None)
+            for url in sorted(set(broken) - set(retried)):
+                print(f"⚠ 画像を読み込めないため、元のURLのまま表示します: {url}")
+    _save_index(index)
+    return image_map
+
+
+def _make_all_variants(cached, settings, max_workers=None):
+    """{URL: キャッシュのパス} の縮小画像を作る
+
+    Returns:
+        ({URL: 画像情報}, [読み込めなかった画像のURL])
+    """
+    widths = settings.get('widths', [960])
+    formats = settings.get('formats', ['jpeg'])
+    quality = settings.get('quality', 80)
+    # 同じ内容の画像は1回だけ処理する
+    unique_paths = sorted(set(cached.values()))
+    args = ([str(p) for p in unique_paths], [widths] * len(unique_paths),
+            [formats] * len(unique_paths), [quality] * len(unique_paths))
+    if len(unique_paths) == 1:
+        results = [make_variants(*a) for a in zip(*args)]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        from output_writer import add_write_stats
+
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            results = []
+            for info, write_stats in pool.map(_make_variants_in_worker, *args):
+                add_write_stats(write_stats)
+                results.append(info)
+    info_by_path = dict(zip(unique_paths, results))
+    image_map = {url: info_by_path[path] for url, path in cached.items() if info_by_path[path] is not None}
+    return image_map, [url for url, path in cached.items() if info_by_path[path] is None]
+
+
+def illustration_html(url, alt_text, image_map=None):
+    """イラストの <img>（srcset がある場合は <picture>）タグを返す"""
+    info = (image_map or {}).get(url)
+    if info is None:
+        return f'<img class="illustration" src="{url}" alt="{alt_text}" loading="lazy" decoding="async">'
+
+    size_attrs = ''
+    if info['width'] and info['height']:
+        size_attrs = f' width="{info["width"]}" height="{info["height"]}"'
+
+    srcset = info['srcset']
+    fallback = srcset.get('jpeg') or next(iter(srcset.values()), None)
+    img_srcset = ''
+    if fallback:
+        img_srcset = ' srcset="' + ', '.join(f'{src} {w}w' for src, w in fallback) + '" sizes="100vw"'
+    img = (f'<img class="illustration" src="{info["src"]}"{img_srcset}{size_attrs} '
+           f'alt="{alt_text}" loading="lazy" decoding="async">')
+
+    sources = [
+        f'<source type="{MIME_TYPES.get(fmt, "image/" + fmt)}" srcset="'
+        + ', '.join(f'{src} {w}w' for src, w in entries) + '" sizes="100vw">'
+        for fmt, entries in srcset.items() if entries is not fallback
+    ]
+    if not sources:
+        return img
+    return '<picture>' + ''.join(sources) + img + '</picture>'
@@ -0,0 +1,229 @@
+"""
+一括処理のジョブ記録（中断したところから再開するため）
+
+batch_converter.py の各ワークブックについて、段階ごとの完了・失敗を
+output/job_journal.jsonl に1行ずつ追記します（途中で止まっても記録は壊れません）。
+
+段階:
+- extracted: Excelから ai_input を作成
+- converted: AIの出力（novel_output）が用意された
+- rendered:  HTMLを生成
+
+各記録には処理時間とエラー内容、入力ファイルの署名（サイズと更新日時）が入るので、
+`--resume` では入力が変わっていない完了済みのワークブックをすぐに読み飛ばせます。
+`python cli.py status` でワークブックを開かずに進み具合を確認できます。
+記録は一括処理の開始時に、ワークブック・段階ごとの最新の記録だけに詰め直します（compact）。
+"""
+
+import json
+import os
+import re
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+JOURNAL_PATH = Path('output') / 'job_journal.jsonl'
+
+STAGES = ('extracted', 'converted', 'rendered')
+
+STAGE_LABELS = {
+    'extracted': '抽出',
+    'converted': 'AI変換',
+    'rendered': 'HTML',
+}
+
+
+def file_signature(path):
+    """ファイルの署名 [サイズ, 更新日時(ns)]（ない場合は None）"""
+    try:
+        stat = Path(path).stat()
+    except FileNotFoundError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def record(workbook, stage, status='done', seconds=None, error=None, path=JOURNAL_PATH, **details):
+    """1件の記録を追記する
+
+    Args:
+        workbook: ワークブックのファイル名
+        stage: STAGES のいずれか
+        status: 'done' または 'error'
+        seconds: 処理時間（秒）
+        error: エラーの内容
+        details: 入力ファイルの署名など、再開の判定に使う情報
+
+    Returns:
+        追記した記録
+    """
+    entry = {
+        'time': datetime.now().isoformat(timespec='seconds'),
+        'workbook': workbook,
+        'stage': stage,
+        'status': status,
+    }
+    if seconds is not None:
+        entry['seconds'] = round(seconds, 3)
+    if error is not None:
+        entry['error'] = error
+    entry.update(details)
+    path = Path(path)
+    path.parent.mkdir(exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+    return entry
+
+
+class StageTimer:
+    """段階の処理時間を測って記録する
+
+    使い方:
+        timer = StageTimer(workbook, 'extracted')
+        ...
+        timer.done(source_signature=...)   # または timer.failed(e)
+    """
+
+    def __init__(self, workbook, stage, path=JOURNAL_PATH):
+        self.workbook = workbook
+        self.stage = stage
+        self.path = path
+        self.started = time.perf_counter()
+
+    def done(self, **details):
+        return record(self.workbook, self.stage, 'done', time.perf_counter() - self.started,
+                      path=self.path, **details)
+
+    def failed(self, error, **details):
+        message = error if isinstance(error, str) else f'{type(error).__name__}: {error}'
+        return record(self.workbook, self.stage, 'error', time.perf_counter() - self.started,
+                      error=message, path=self.path, **details)
+
+
+def load_state(path=JOURNAL_PATH):
+    """記録を読み、ワークブックごと・段階ごとの最新の記録 {ワークブック: {段階: 記録}} を返す
+
+    書きかけの最終行（強制終了した場合など）は読み飛ばします。
+    """
+    state = {}
+    path = Path(path)
+    if not path.exists():
+        return state
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            state.setdefault(entry['workbook'], {})[entry['stage']] = entry
+    return state
+
+
+def compact(state, path=JOURNAL_PATH):
+    """記録を state（load_state() の結果）の最新の記録だけに詰め直す
+
+    追記だけでは記録が増え続け、読み込みに時間がかかるようになるので、
+    一括処理の開始時（ほかに書き込むプロセスがないとき）に呼びます。
+    古い記録がない場合は何もしません。
+
+    Returns:
+        削除した記録の数
+    """
+    path = Path(path)
+    if not path.exists():
+        return 0
+    entries = sorted((entry for stages in state.values() for entry in stages.values()),
+                     key=lambda entry: entry['time'])
+    with open(path, 'rb') as f:
+        line_count = sum(1 for _ in f)
+    if line_count <= len(entries):
+        return 0
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    return line_count - len(entries)
+
+
+def is_rendered(state, excel_path, source_path, options):
+    """前回の実行でHTMLまで完了していて、その後ファイルが変わっていないかどうか
+
+    Args:
+        state: load_state() の結果
+        excel_path: ワークブックのパス
+        source_path: HTMLの元になったテキストファイル（ai_input または novel_output）
+        options: HTMLの内容に影響するオプション（--images など）の辞書
+    """
+    entry = state.get(Path(excel_path).name, {}).get('rendered')
+    if not entry or entry['status'] != 'done':
+        return False
+    if source_path is None or not Path(entry.get('output', '')).exists():
+        return False
+    return (entry.get('workbook_signature') == file_signature(excel_path)
+            and entry.get('source') == str(source_path)
+            and entry.get('source_signature') == file_signature(source_path)
+            and entry.get('options') == options)
+
+
+def _chapter_key(name):
+    match = re.match(r'main_(\d+)_', name)
+    return (int(match.group(1)) if match else float('inf'), name)
+
+
+def format_status(state, workbooks=()):
+    """進み具合の一覧を表示用の文字列にする
+
+    Args:
+        state: load_state() の結果
+        workbooks: 記録がなくても一覧に含めるワークブックのファイル名
+    """
+    names = sorted(set(state) | set(workbooks), key=_chapter_key)
+    if not names:
+        return "記録がありません（まだ一括処理を実行していません）。"
+
+    lines = []
+    pending = []
+    for name in names:
+        stages = state.get(name, {})
+        marks = []
+        for stage in STAGES:
+            entry = stages.get(stage)
+            if entry is None:
+                mark = '－'
+            elif entry['status'] == 'done':
+                seconds = entry.get('seconds')
+                mark = '✓' if seconds is None else f"✓ {seconds:.1f}s"
+                if entry.get('options', {}).get('skip_ai'):
+                    mark += '（AI変換なし）'
+            else:
+                mark = '✗'
+            marks.append(f"{STAGE_LABELS[stage]} {mark}")
+        lines.append(f"{name}: " + ' / '.join(marks))
+        for stage in STAGES:
+            entry = stages.get(stage)
+            if entry and entry['status'] == 'error':
+                lines.append(f"  ⚠ {STAGE_LABELS[stage]}のエラー（{entry['time']}）: {entry.get('error', '')}")
+        rendered = stages.get('rendered')
+        if not rendered or rendered['status'] != 'done':
+            pending.append(name)
+
+    lines.append('')
+    lines.append(f"完了: {len(names) - len(pending)}個 / 未完了: {len(pending)}個")
+    for name in pending:
+        lines.append(f"  - {name}")
+    return '\n'.join(lines)
+
+
+def main(path=JOURNAL_PATH):
+    """記録と、フォルダ内の main_*.xlsx（ファイル名だけ）から進み具合を表示"""
+    workbooks = [p.name for p in Path('.').glob('main_*.xlsx')]
+    print(format_status(load_state(path), workbooks))
+    return 0
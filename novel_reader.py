@@ -0,0 +1,45 @@
+"""
+大きな小説テキストを少しずつ読む
+
+novel_output_*.txt を f.read() で丸ごと読んでから split('\n\n') すると、
+ファイル全体と段落のコピーの両方が同時にメモリに載ります。
+ここではファイルを一定の大きさずつ読み、段落を1つずつ返します。
+結果は open(...).read().split('\n\n') とまったく同じです（改行コードの変換も同じ）。
+"""
+
+# 1回に読み込む文字数
+CHUNK_SIZE = 1 << 16
+
+
+def iter_text_chunks(path, chunk_size=CHUNK_SIZE, encoding='utf-8'):
+    """ファイルの内容を chunk_size 文字ずつ返す"""
+    with open(path, 'r', encoding=encoding) as f:
+        for chunk in iter(lambda: f.read(chunk_size), ''):
+            yield chunk
+
+
+def split_paragraphs(chunks, separator='\n\n'):
+    """文字列の断片を順につなげながら、separator で区切った段落を1つずつ返す
+
+    ''.join(chunks).split(separator) と同じ結果になります。
+    手元に残すのは、まだ区切りが見つかっていない最後の段落だけです。
+    """
+    buffer = ''
+    for chunk in chunks:
+        # 前の断片の末尾と今回の先頭にまたがる区切りも見つかるように、少し手前から探す
+        search_from = max(len(buffer) - len(separator) + 1, 0)
+        buffer += chunk
+        start = 0
+        while True:
+            end = buffer.find(separator, max(start, search_from))
+            if end < 0:
+                break
+            yield buffer[start:end]
+            start = end + len(separator)
+        buffer = buffer[start:]
+    yield buffer
+
+
+def iter_paragraphs(path, chunk_size=CHUNK_SIZE, encoding='utf-8'):
+    """ファイルを段落（空行区切り）ごとに返す"""
+    return split_paragraphs(iter_text_chunks(path, chunk_size, encoding))
@@ -0,0 +1,260 @@
+"""
+オフラインで読むためのサービスワーカー（batch_converter.py --offline）
+
+公開した章をWebサーバーに置くと、読者は章を開くたびにHTMLとリモートの挿絵を
+取得し直します。地下鉄など電波の届かない場所では続きが読めません。
+
+ここでは output/ に次の2つを作ります。サービスワーカーの登録スクリプトは、HTMLを
+書き出すときにテンプレートに入れます（simple_converter.html_additions）。
+
+- precache-manifest.json: 登録スクリプトの入った output/ のHTML（今回の実行で作り直さなかった
+  章も含む）と、そこから参照するWebフォント（--font）のURLと内容のハッシュ（revision）の一覧。
+  一覧全体のハッシュを version とします。
+- sw.js: インストール時に一覧のファイルをキャッシュし（前回から revision が
+  変わっていないものは取得し直さない）、有効になったときに古い revision を削除します。
+  一覧にないページ・画像（リモートの挿絵を含む）は、表示時にキャッシュから返しつつ
+  裏で取得し直します（stale-while-revalidate）。
+
+章を作り直すと version が変わり、sw.js の内容も変わるので、ブラウザが自動で
+新しいサービスワーカーに切り替えます。登録は http(s) で開いた場合だけ行います
+（file:// で開いた場合は何もしません）。
+"""
+
+import hashlib
+import json
+import os
+import re
+import urllib.parse
+from pathlib import Path
+
+from output_writer import write_output
+
+try:
+    from config import OFFLINE_CACHE
+except ImportError:
+    OFFLINE_CACHE = {"cache_name": "novel", "runtime_max_entries": 200}
+
+OUTPUT_DIR = Path('output')
+SW_FILE = 'sw.js'
+MANIFEST_FILE = 'precache-manifest.json'
+
+# 登録スクリプトの入ったHTMLを見分けられるように、<script> には id を付ける
+SCRIPT_START = '    <script id="sw-register">\n'
+SCRIPT_END = '    </script>\n'
+
+_FONT_URL = re.compile(r"url\('([^']+\.woff2)'\)")
+
+SERVICE_WORKER_TEMPLATE = """// batch_converter.py --offline が生成（手で編集しないでください）
+const VERSION = '{version}';
+const PRECACHE = '{cache_name}-precache';
+const RUNTIME = '{cache_name}-runtime';
+const RUNTIME_MAX_ENTRIES = {runtime_max_entries};
+const MANIFEST_URL = new URL('{manifest_file}', self.registration.scope).href;
+
+// 同じURLの古い内容と区別するため、キャッシュのキーには revision を付ける
+function cacheKey(entry) {{
+    return new URL(entry.url, self.registration.scope).href + '?__rev=' + entry.revision;
+}}
+
+function manifestKey(version) {{
+    return MANIFEST_URL + '?__version=' + version;
+}}
+
+function withoutSearch(url) {{
+    const u = new URL(url);
+    return u.origin + u.pathname;
+}}
+
+let precached = null;  // URL → キャッシュのキー
+
+async function loadPrecached() {{
+    if (precached === null) {{
+        const cache = await caches.open(PRECACHE);
+        const response = await cache.match(manifestKey(VERSION));
+        const manifest = response ? await response.json() : {{entries: []}};
+        precached = new Map(manifest.entries.map(entry => [
+            withoutSearch(new URL(entry.url, self.registration.scope).href), cacheKey(entry)]));
+    }}
+    return precached;
+}}
+
+self.addEventListener('install', event => {{
+    event.waitUntil((async () => {{
+        const cache = await caches.open(PRECACHE);
+        const response = await fetch(MANIFEST_URL, {{cache: 'no-cache'}});
+        if (!response.ok) throw new Error('precache manifest: ' + response.status);
+        const manifest = await response.clone().json();
+        if (manifest.version !== VERSION) throw new Error('precache manifest is out of date');
+        for (const entry of manifest.entries) {{
+            const key = cacheKey(entry);
+            if (await cache.match(key)) continue;  // 前回から変わっていない
+            const fresh = await fetch(new URL(entry.url, self.registration.scope), {{cache: 'no-cache'}});
+            if (!fresh.ok) throw new Error(entry.url + ': ' + fresh.status);
+            await cache.put(key, fresh);
+        }}
+        await cache.put(manifestKey(VERSION), response);
+        await self.skipWaiting();
+    }})());
+}});
+
+self.addEventListener('activate', event => {{
+    event.waitUntil((async () => {{
+        // 古い revision と古い一覧を削除する
+        const keep = new Set((await loadPrecached()).values());
+        keep.add(manifestKey(VERSION));
+        const cache = await caches.open(PRECACHE);
+        for (const request of await cache.keys()) {{
+            if (!keep.has(request.url)) await cache.delete(request);
+        }}
+        // 一覧に入ったURLは実行時のキャッシュからは消す
+        const runtime = await caches.open(RUNTIME);
+        for (const request of await runtime.keys()) {{
+            if (precached.has(withoutSearch(request.url))) await runtime.delete(request);
+        }}
+        await self.clients.claim();
+    }})());
+}});
+
+async function trimRuntime(cache) {{
+    const keys = await cache.keys();
+    for (const request of keys.slice(0, Math.max(keys.length - RUNTIME_MAX_ENTRIES, 0))) {{
+        await cache.delete(request);
+    }}
+}}
+
+async function staleWhileRevalidate(event) {{
+    const cache = await caches.open(RUNTIME);
+    const cached = await cache.match(event.request);
+    const update = fetch(event.request).then(async response => {{
+        // リモートの挿絵は中身の見えない応答（opaque）になるが、そのまま表示に使える
+        if (response.ok || response.type === 'opaque') {{
+            await cache.put(event.request, response.clone());
+            await trimRuntime(cache);
+        }}
+        return response;
+    }});
+    if (cached) {{
+        event.waitUntil(update.catch(() => null));
+        return cached;
+    }}
+    return update;
+}}
+
+self.addEventListener('fetch', event => {{
+    const request = event.request;
+    if (request.method !== 'GET') return;
+    const url = withoutSearch(request.url);
+    if (url === withoutSearch(MANIFEST_URL) || url === withoutSearch(self.location.href)) return;
+    const sameScope = request.url.startsWith(self.registration.scope);
+    const runtime = request.destination === 'image'
+        || (sameScope && ['document', 'font', 'style'].includes(request.destination));
+    event.respondWith((async () => {{
+        const key = (await loadPrecached()).get(url);
+        if (key) {{
+            const cached = await caches.match(key);
+            if (cached) return cached;
+        }}
+        return runtime ? staleWhileRevalidate(event) : fetch(request);
+    }})());
+}});
+"""
+
+
+def register_script(html_path):
+    """HTMLの </body> の前に入れるサービスワーカーの登録スクリプト"""
+    sw_url = Path(os.path.relpath(OUTPUT_DIR / SW_FILE, Path(html_path).parent)).as_posix()
+    return (SCRIPT_START
+            + "    if ('serviceWorker' in navigator && /^https?:$/.test(location.protocol)) {\n"
+            + f"        navigator.serviceWorker.register('{sw_url}');\n"
+            + "    }\n"
+            + SCRIPT_END)
+
+
+def has_register_script(html_path):
+    """HTMLにサービスワーカーの登録スクリプトが入っているか"""
+    with open(html_path, 'r', encoding='utf-8') as f:
+        return any(line == SCRIPT_START for line in f)
+
+
+def published_html_files(output_dir=OUTPUT_DIR):
+    """あらかじめキャッシュするHTML（output/ のうち、--offline で作ったもの）
+
+    今回の実行で作り直した章だけでなく、--resume で読み飛ばした章や前回作った章も含めます。
+    """
+    return [path for path in sorted(Path(output_dir).glob('*.html')) if has_register_script(path)]
+
+
+def referenced_fonts(html_path):
+    """HTMLの <head> から参照しているWebフォント（--font で追加したもの）のパス"""
+    fonts = []
+    with open(html_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.startswith('</head>'):
+                break
+            for url in _FONT_URL.findall(line):
+                fonts.append(Path(html_path).parent / url)
+    return fonts
+
+
+def content_revision(path):
+    """ファイルの内容のハッシュ（先頭16文字）"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def build_manifest(html_paths, output_dir=OUTPUT_DIR):
+    """HTMLと参照しているフォントの一覧 {'version', 'entries': [{'url', 'revision', 'size'}]} を作る"""
+    paths = []
+    for html_path in html_paths:
+        for path in [Path(html_path)] + referenced_fonts(html_path):
+            if path.exists() and path not in paths:
+                paths.append(path)
+    root = Path(output_dir).resolve()
+    entries = [
+        {
+            'url': urllib.parse.quote(path.resolve().relative_to(root).as_posix()),
+            'revision': content_revision(path),
+            'size': path.stat().st_size,
+        }
+        for path in paths
+    ]
+    version = hashlib.sha256(json.dumps(entries, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+    return {'version': version, 'entries': entries}
+
+
+def service_worker_js(version, settings=None):
+    settings = settings or OFFLINE_CACHE
+    return SERVICE_WORKER_TEMPLATE.format(
+        version=version,
+        cache_name=settings.get('cache_name', 'novel'),
+        runtime_max_entries=int(settings.get('runtime_max_entries', 200)),
+        manifest_file=MANIFEST_FILE,
+    )
+
+
+def write_offline_files(html_paths, output_dir=OUTPUT_DIR, settings=None):
+    """HTMLの一覧（published_html_files() の結果）から precache-manifest.json と sw.js を書き出す
+
+    Returns:
+        build_manifest() の結果
+    """
+    manifest = build_manifest(html_paths, output_dir)
+    write_output(Path(output_dir) / MANIFEST_FILE, json.dumps(manifest, ensure_ascii=False, indent=2) + '\n')
+    write_output(Path(output_dir) / SW_FILE, service_worker_js(manifest['version'], settings))
+    return manifest
+
+
+def main():
+    """サービスワーカーを作って結果を表示（batch_converter から呼ばれる）"""
+    html_paths = published_html_files()
+    if not html_paths:
+        print("\n⚠ サービスワーカーの登録スクリプトの入ったHTMLがないため、sw.js は作成しません")
+        return
+    manifest = write_offline_files(html_paths)
+    total = sum(entry['size'] for entry in manifest['entries'])
+    print(f"\n✓ オフライン用のサービスワーカーを作成しました: output/{SW_FILE}, output/{MANIFEST_FILE}")
+    print(f"  バージョン {manifest['version']}: {len(manifest['entries'])}ファイル "
+          f"({total / 1024:,.1f} KB) をあらかじめキャッシュします")
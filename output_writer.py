@@ -0,0 +1,181 @@
+"""
+出力ファイルの書き込み
+
+output/ 以下への書き込みはすべてここを通します。
+- 内容が前回と同じ場合は書き込まない（更新日時が変わらないので、rsyncやCDNの無効化が走りません）
+- 一時ファイルに書いてから置き換えるので、途中で止まっても書きかけのファイルが残りません
+- 書き込んだ／スキップしたファイル数とバイト数を WRITE_STATS に記録します
+  （一括処理のパイプラインでは複数のスレッドから書き込むので、集計はロックして行います）
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+# 新しく作るファイルの権限（open() で作った場合と同じにする）
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+NEW_FILE_MODE = 0o666 & ~_UMASK
+
+WRITE_STATS = {
+    'written_files': 0,
+    'written_bytes': 0,
+    'skipped_files': 0,
+    'skipped_bytes': 0,
+}
+_stats_lock = threading.Lock()
+
+
+def _count(kind, size):
+    """WRITE_STATS に1ファイル分を加える（kind は 'written' または 'skipped'）"""
+    with _stats_lock:
+        WRITE_STATS[f'{kind}_files'] += 1
+        WRITE_STATS[f'{kind}_bytes'] += size
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def _same_content(path, data):
+    """既存ファイルの内容が data と同じかどうか（サイズが違えば読まずに判定）"""
+    try:
+        if path.stat().st_size != len(data):
+            return False
+    except FileNotFoundError:
+        return False
+    return _file_sha256(path) == hashlib.sha256(data).digest()
+
+
+def _replace_atomically(path, data):
+    try:
+        mode = path.stat().st_mode & 0o777
+    except FileNotFoundError:
+        mode = NEW_FILE_MODE
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.', suffix='.tmp')
+    try:
+        os.chmod(tmp_path, mode)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def write_output(path, content, encoding='utf-8'):
+    """ファイルを書き込む（内容が同じならスキップ）
+
+    Args:
+        path: 書き込み先
+        content: 文字列またはバイト列。文字列は open(..., 'w') と同じく
+            改行をOSの改行コードに変換して書き込みます
+        encoding: 文字列の場合のエンコーディング
+
+    Returns:
+        書き込んだ場合は True、内容が同じでスキップした場合は False
+    """
+    path = Path(path)
+    if isinstance(content, str):
+        if os.linesep != '\n':
+            content = content.replace('\n', os.linesep)
+        data = content.encode(encoding)
+    else:
+        data = content
+
+    if _same_content(path, data):
+        _count('skipped', len(data))
+        return False
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    _replace_atomically(path, data)
+    _count('written', len(data))
+    return True
+
+
+@contextmanager
+def atomic_stream(path):
+    """大きな出力（EPUBなど）を少しずつ書き込むためのバイナリファイルを返す
+
+    with ブロックの中で一時ファイルに書き込み、終了時に既存ファイルと
+    内容を比較して、変わっていれば置き換えます（write_output と同じ集計）。
+    例外で抜けた場合は一時ファイルを削除し、既存ファイルはそのまま残ります。
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w+b') as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+            size = os.fstat(f.fileno()).st_size
+
+        same = False
+        try:
+            same = path.stat().st_size == size and _file_sha256(path) == _file_sha256(tmp_path)
+        except FileNotFoundError:
+            pass
+        if same:
+            os.remove(tmp_path)
+            _count('skipped', size)
+            return
+
+        try:
+            mode = path.stat().st_mode & 0o777
+        except FileNotFoundError:
+            mode = NEW_FILE_MODE
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+        _count('written', size)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def count_unchanged(path):
+    """既存のファイルを書き込まずにそのまま使った場合に、スキップとして集計する
+
+    内容がファイル名から決まる出力（画像の縮小版など）で、作り直しを省いたときに使います。
+    """
+    _count('skipped', Path(path).stat().st_size)
+
+
+def add_write_stats(stats):
+    """別のプロセスで集計した WRITE_STATS を加える（一括処理の --jobs で使う）"""
+    with _stats_lock:
+        for key, value in stats.items():
+            WRITE_STATS[key] += value
+
+
+def format_write_stats():
+    """書き込み結果の集計を表示用の文字列にする"""
+    return (f"出力ファイル: 書き込み {WRITE_STATS['written_files']}個 ({WRITE_STATS['written_bytes']:,} バイト) / "
+            f"変更なしでスキップ {WRITE_STATS['skipped_files']}個 ({WRITE_STATS['skipped_bytes']:,} バイト)")
+
+
+def write_output_chunks(path, chunks, encoding='utf-8'):
+    """文字列を少しずつ書き込む（write_output の分割版。改行の変換や集計も同じ）
+
+    大きなHTMLを1つの文字列にまとめずに書き出すときに使います。
+    """
+    with atomic_stream(path) as f:
+        for chunk in chunks:
+            if os.linesep != '\n':
+                chunk = chunk.replace('\n', os.linesep)
+            f.write(chunk.encode(encoding))
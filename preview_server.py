@@ -0,0 +1,366 @@
+"""
+プレビュー用のローカルHTTPサーバー
+
+output/ の novel_output_*.txt（空なら ai_input_*.txt）から、アクセスされた章だけを
+その場でHTMLにして返します。一括変換をしなくても、全章をブラウザで確認できます。
+
+- 描画結果は描画キャッシュ（render_cache.py）を使います
+- ETag を付けて返し、変更がなければ 304 Not Modified を返します
+- gzip圧縮版をあらかじめ作っておき、対応ブラウザにはそちらを返します
+- 章と静的ファイルのレスポンスは、それぞれ上限のバイト数まで最近使ったものをメモリに残します
+- テキストファイルが変更されると、開いているページを自動で再読み込みします
+
+使い方: python cli.py serve [--port 8000]
+"""
+
+import asyncio
+import gzip
+import hashlib
+import json
+import mimetypes
+import re
+import urllib.parse
+from collections import OrderedDict
+from pathlib import Path
+
+from chunked_export import is_part_file
+from simple_converter import build_html, render_pages_cached
+
+OUTPUT_DIR = Path('output')
+
+# ソースファイルの変更を確認する間隔（秒）
+WATCH_INTERVAL = 1.0
+
+# output/ 以下で配信するファイルの拡張子（データベースやジョブ記録などは返さない）
+STATIC_EXTENSIONS = {
+    '.html',
+    '.png', '.jpg', '.jpeg', '.gif', '.webp', '.avif', '.svg',
+    '.woff2', '.woff', '.ttf', '.otf',
+}
+
+# レスポンスをメモリに残しておく上限（バイト、gzip版を含む。古く使ったものから捨てる）
+CHAPTER_CACHE_BYTES = 128 * 1024 * 1024
+STATIC_CACHE_BYTES = 64 * 1024 * 1024
+
+RELOAD_SCRIPT = """    <script>
+    new EventSource('/events').addEventListener('reload', function (event) {
+        if (event.data === TITLE) location.reload();
+    });
+    </script>
+"""
+
+STATUS_TEXT = {
+    200: 'OK',
+    304: 'Not Modified',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    500: 'Internal Server Error',
+}
+
+
+def find_chapters(output_dir=OUTPUT_DIR):
+    """プレビューできる章 {タイトル: テキストファイルのパス} を返す
+
+    novel_output_*.txt に内容があればそちらを、なければ ai_input_*.txt を使います。
+    分割したパート（*_part01.txt など）は含めません。
+    """
+    chapters = {}
+    for path in sorted(Path(output_dir).glob('ai_input_*.txt')):
+        if not is_part_file(path.stem):
+            chapters[path.stem[len('ai_input_'):]] = path
+    for path in sorted(Path(output_dir).glob('novel_output_*.txt')):
+        try:
+            size = path.stat().st_size
+        except FileNotFoundError:  # 一覧を作っている間に削除された
+            continue
+        if size > 0 and not is_part_file(path.stem):
+            chapters[path.stem[len('novel_output_'):]] = path
+    return dict(sorted(chapters.items()))
+
+
+def display_title(title):
+    """main_0_暗黒時代・上 → 暗黒時代・上"""
+    match = re.match(r'main_\d+_(.+)', title)
+    return match.group(1) if match else title
+
+
+def _signature(path):
+    stat = path.stat()
+    return (str(path), stat.st_mtime_ns, stat.st_size)
+
+
+class Response:
+    """レスポンス（本文はgzip版と一緒に持つ）"""
+
+    def __init__(self, body, content_type, status=200, etag=None, gzip_body=None):
+        self.body = body
+        self.content_type = content_type
+        self.status = status
+        self.etag = etag
+        self.gzip_body = gzip_body
+
+
+def _response_size(response):
+    return len(response.body) + len(response.gzip_body or b'')
+
+
+class ResponseCache:
+    """キー → (署名, Response) を合計 max_bytes まで残すキャッシュ（古く使ったものから捨てる）"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key, signature):
+        """署名が同じならレスポンスを返す（違えば捨てて None）"""
+        cached = self.entries.get(key)
+        if cached is None:
+            return None
+        if cached[0] != signature:
+            self.pop(key)
+            return None
+        self.entries.move_to_end(key)  # 最近使ったものとして末尾に移す
+        return cached[1]
+
+    def put(self, key, signature, response):
+        self.pop(key)
+        self.entries[key] = (signature, response)
+        self.size += _response_size(response)
+        while self.size > self.max_bytes and len(self.entries) > 1:
+            _, (_, old) = self.entries.popitem(last=False)
+            self.size -= _response_size(old)
+
+    def pop(self, key):
+        cached = self.entries.pop(key, None)
+        if cached is not None:
+            self.size -= _response_size(cached[1])
+
+
+def make_response(body, content_type):
+    """ETag とgzip版を付けたレスポンスを作る"""
+    etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+    gzip_body = gzip.compress(body, mtime=0) if len(body) > 1024 else None
+    return Response(body, content_type, etag=etag, gzip_body=gzip_body)
+
+
+class PreviewServer:
+    def __init__(self, output_dir=OUTPUT_DIR):
+        self.output_dir = Path(output_dir)
+        self.cache = ResponseCache(CHAPTER_CACHE_BYTES)  # タイトル → (ソースの署名, Response)
+        self.static_cache = ResponseCache(STATIC_CACHE_BYTES)  # ファイルのパス → (署名, Response)
+        self.listeners = set()  # 再読み込み通知を待っている asyncio.Queue
+
+    # --- ページの生成 ---------------------------------------------------
+
+    def _render_chapter(self, title, source_path):
+        with open(source_path, 'r', encoding='utf-8') as f:
+            novel_text = f.read()
+        page_title = display_title(title)
+        html = build_html(render_pages_cached(novel_text), page_title)
+        html = html.replace('</body>', RELOAD_SCRIPT.replace('TITLE', json.dumps(title)) + '</body>')
+        return make_response(html.encode('utf-8'), 'text/html; charset=utf-8')
+
+    async def chapter_response(self, title):
+        source_path = find_chapters(self.output_dir).get(title)
+        if source_path is None:
+            return None
+        try:
+            signature = _signature(source_path)
+        except FileNotFoundError:  # 一覧を作った後に削除された
+            return None
+        cached = self.cache.get(title, signature)
+        if cached is not None:
+            return cached
+        # 描画は時間がかかるので別スレッドで行い、他のリクエストを止めない
+        loop = asyncio.get_running_loop()
+        try:
+            response = await loop.run_in_executor(None, self._render_chapter, title, source_path)
+        except FileNotFoundError:
+            return None
+        except Exception as e:  # 読めないテキスト（文字コードの誤りなど）でも応答は返す
+            print(f"エラーが発生しました（{source_path.name}）: {type(e).__name__}: {e}")
+            return Response(f'{source_path.name} をHTMLにできませんでした: {type(e).__name__}: {e}'.encode('utf-8'),
+                            'text/plain; charset=utf-8', status=500)
+        self.cache.put(title, signature, response)
+        return response
+
+    def index_response(self):
+        items = '\n'.join(
+            f'        <li><a href="/chapters/{urllib.parse.quote(title)}.html">{display_title(title)}</a>'
+            f' <small>({path.name})</small></li>'
+            for title, path in find_chapters(self.output_dir).items()
+        )
+        html = f"""<!DOCTYPE html>
+<html lang="ja">
+<head>
+    <meta charset="UTF-8">
+    <title>プレビュー</title>
+</head>
+<body>
+    <h1>プレビュー</h1>
+    <ul>
+{items}
+    </ul>
+</body>
+</html>
+"""
+        return make_response(html.encode('utf-8'), 'text/html; charset=utf-8')
+
+    def static_response(self, relative_path):
+        """output/ 以下のファイル（HTML・画像・フォント）を返す"""
+        root = self.output_dir.resolve()
+        path = (root / relative_path).resolve()
+        if root not in path.parents or path.suffix.lower() not in STATIC_EXTENSIONS or not path.is_file():
+            return None
+        try:
+            signature = _signature(path)
+            cached = self.static_cache.get(path, signature)
+            if cached is not None:
+                return cached
+            content_type = mimetypes.guess_type(path.name)[0] or 'application/octet-stream'
+            response = make_response(path.read_bytes(), content_type)
+        except FileNotFoundError:
+            return None
+        self.static_cache.put(path, signature, response)
+        return response
+
+    async def handle(self, method, target, headers):
+        """リクエストを処理して Response を返す（ソケットを使わずに呼び出せます）"""
+        if method not in ('GET', 'HEAD'):
+            return Response(b'', 'text/plain', status=405)
+        path = urllib.parse.unquote(urllib.parse.urlsplit(target).path)
+
+        if path == '/':
+            response = self.index_response()
+        elif path.startswith('/chapters/') and path.endswith('.html'):
+            response = await self.chapter_response(path[len('/chapters/'):-len('.html')])
+        else:
+            response = self.static_response(path.lstrip('/'))
+        if response is None:
+            return Response('見つかりません'.encode('utf-8'), 'text/plain; charset=utf-8', status=404)
+        return response
+
+    # --- 変更の監視 -----------------------------------------------------
+
+    async def watch_sources(self):
+        """テキストファイルの変更を監視して、開いているページに再読み込みを通知"""
+        known = {}
+        while True:
+            current = {}
+            for title, path in find_chapters(self.output_dir).items():
+                try:
+                    current[title] = _signature(path)
+                except FileNotFoundError:  # 一覧を作った後に削除された
+                    continue
+            for title, signature in current.items():
+                if title in known and known[title] != signature:
+                    self.cache.pop(title)
+                    for queue in list(self.listeners):
+                        queue.put_nowait(title)
+            known = current
+            await asyncio.sleep(WATCH_INTERVAL)
+
+    # --- HTTP -----------------------------------------------------------
+
+    async def _send_events(self, writer):
+        writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n'
+                     b'Cache-Control: no-cache\r\nConnection: keep-alive\r\n\r\n')
+        await writer.drain()
+        queue = asyncio.Queue()
+        self.listeners.add(queue)
+        try:
+            while True:
+                title = await queue.get()
+                writer.write(f'event: reload\ndata: {title}\n\n'.encode('utf-8'))
+                await writer.drain()
+        finally:
+            self.listeners.discard(queue)
+
+    async def handle_connection(self, reader, writer):
+        try:
+            try:
+                request = await reader.readuntil(b'\r\n\r\n')
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                return
+            lines = request.decode('latin-1').split('\r\n')
+            parts = lines[0].split(' ')
+            if len(parts) != 3:
+                writer.write(b'HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+                return
+            method, target, _ = parts
+            headers = {}
+            for line in lines[1:]:
+                if ':' in line:
+                    name, value = line.split(':', 1)
+                    headers[name.strip().lower()] = value.strip()
+
+            if target == '/events':
+                await self._send_events(writer)
+                return
+
+            response = await self.handle(method, target, headers)
+            writer.write(self.encode_response(response, method, headers))
+            await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def encode_response(response, method, headers):
+        """Response をHTTPのバイト列にする（ETag・gzipの判定もここで行う）"""
+        body = response.body
+        etag = response.etag
+        extra = []
+        if response.gzip_body is not None:
+            extra.append('Vary: Accept-Encoding')
+            if 'gzip' in headers.get('accept-encoding', ''):
+                body = response.gzip_body
+                etag = etag[:-1] + '-gz"'
+                extra.append('Content-Encoding: gzip')
+
+        status = response.status
+        if etag:
+            extra.append(f'ETag: {etag}')
+            extra.append('Cache-Control: no-cache')
+            if_none_match = headers.get('if-none-match', '')
+            if etag in [tag.strip() for tag in if_none_match.split(',')]:
+                status = 304
+        if status == 304 or method == 'HEAD':
+            payload = b''
+        else:
+            payload = body
+
+        head = [f'HTTP/1.1 {status} {STATUS_TEXT[status]}',
+                f'Content-Type: {response.content_type}']
+        if status != 304:
+            head.append(f'Content-Length: {len(body)}')
+        head += extra
+        head.append('Connection: close')
+        return ('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + payload
+
+
+async def serve(host='127.0.0.1', port=8000, output_dir=OUTPUT_DIR):
+    """サーバーを起動して、止められるまで待つ"""
+    server = PreviewServer(output_dir)
+    tcp_server = await asyncio.start_server(server.handle_connection, host, port)
+    watcher = asyncio.create_task(server.watch_sources())
+    print(f"プレビューサーバーを起動しました: http://{host}:{port}/")
+    print("終了するには Ctrl+C を押してください")
+    try:
+        async with tcp_server:
+            await tcp_server.serve_forever()
+    finally:
+        watcher.cancel()
+
+
+def main(host='127.0.0.1', port=8000):
+    try:
+        asyncio.run(serve(host, port))
+    except KeyboardInterrupt:
+        print("\nプレビューサーバーを終了しました")
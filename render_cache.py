@@ -0,0 +1,214 @@
+"""
+章ごとのページ描画結果のキャッシュ
+
+render_pages() の結果（ページのHTMLのリスト）を、入力テキストと描画設定の
+ハッシュをキーにして output/cache/render/ に保存します。テキストも設定も
+変わっていない章は描画し直さずに済みます（まとめ読み用HTMLの作成など）。
+同じ内容のページ（よくある「……」だけの分岐の回答など）は1回だけ保存し、
+ページの並びは番号で持ちます。
+
+描画処理（simple_converter.py / image_cache.py）や保存形式自体が変わった場合も
+キーが変わるので、古いキャッシュが使われることはありません。
+使われなくなったキャッシュは、RENDER_CACHE の大きさ・日数を超えたら古いものから削除します。
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from output_writer import write_output, write_output_chunks
+
+try:
+    from config import RENDER_CACHE
+except ImportError:
+    RENDER_CACHE = {"max_mb": 500, "max_age_days": 30}
+
+CACHE_DIR = Path('output') / 'cache' / 'render'
+
+# キャッシュの整理の間隔（秒）。保存のたびにフォルダ全体を調べないようにする
+PRUNE_INTERVAL = 60
+
+_last_prune = None
+
+# この中のファイルが変わったらキャッシュを作り直す
+RENDERER_FILES = ('simple_converter.py', 'image_cache.py', 'config.py', 'render_cache.py', 'novel_reader.py')
+
+_renderer_digest = None
+
+
+def renderer_fingerprint():
+    """描画処理（RENDERER_FILES）のハッシュ"""
+    global _renderer_digest
+    if _renderer_digest is None:
+        digest = hashlib.sha256()
+        base = Path(__file__).parent
+        for name in RENDERER_FILES:
+            path = base / name
+            if path.exists():
+                digest.update(path.read_bytes())
+        _renderer_digest = digest.hexdigest()
+    return _renderer_digest
+
+
+def _key_digest(image_map):
+    digest = hashlib.sha256()
+    digest.update(renderer_fingerprint().encode('ascii'))
+    digest.update(json.dumps(image_map or {}, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+    return digest
+
+
+def cache_key(novel_text, image_map=None):
+    """テキスト・画像情報・描画処理からキャッシュのキーを作る"""
+    digest = _key_digest(image_map)
+    digest.update(novel_text.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def file_cache_key(path, image_map=None):
+    """cache_key() と同じキーを、テキストファイルを少しずつ読みながら作る"""
+    from novel_reader import iter_text_chunks
+
+    digest = _key_digest(image_map)
+    for chunk in iter_text_chunks(path):
+        digest.update(chunk.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def cache_path(key):
+    return CACHE_DIR / f'{key}.json'
+
+
+def intern_pages(pages):
+    """同じ内容のページをまとめる
+
+    Returns:
+        (重複のないページのリスト, 各ページが何番目かのリスト)
+    """
+    fragments = []
+    ids = {}
+    order = []
+    for page in pages:
+        fragment_id = ids.get(page)
+        if fragment_id is None:
+            fragment_id = ids[page] = len(fragments)
+            fragments.append(page)
+        order.append(fragment_id)
+    return fragments, order
+
+
+def expand_pages(data):
+    """intern_pages() の結果 {'fragments': [...], 'pages': [...]} をページのリストに戻す"""
+    fragments = data['fragments']
+    return [fragments[fragment_id] for fragment_id in data['pages']]
+
+
+def load_pages(key):
+    """キャッシュからページのリストを返す（なければ None）"""
+    path = cache_path(key)
+    try:
+        # 更新日時を「最後に使った日時」として整理に使う
+        os.utime(path)
+        with open(path, 'r', encoding='utf-8') as f:
+            return expand_pages(json.load(f))
+    except FileNotFoundError:  # ない（または別のプロセスが整理で削除した）
+        return None
+
+
+def store_pages(key, pages):
+    """ページのリストをキャッシュに保存"""
+    fragments, order = intern_pages(pages)
+    write_output(cache_path(key), json.dumps({'fragments': fragments, 'pages': order}, ensure_ascii=False))
+    _maybe_prune()
+
+
+def prune_cache(settings=None):
+    """最後に使ってから max_age_days を過ぎたキャッシュと、max_mb を超えた分の古いキャッシュを削除する
+
+    Returns:
+        (削除したファイル数, 削除したバイト数)
+    """
+    settings = settings or RENDER_CACHE
+    max_bytes = settings.get('max_mb', 500) * 1024 * 1024
+    max_age = settings.get('max_age_days', 30) * 24 * 60 * 60
+    entries = []
+    for path in CACHE_DIR.glob('*.json'):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    entries.sort(reverse=True)  # 最近使ったものから
+
+    now = time.time()
+    total = 0
+    removed = removed_bytes = 0
+    for mtime, size, path in entries:
+        total += size
+        if total <= max_bytes and not (max_age and now - mtime > max_age):
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            continue
+        removed += 1
+        removed_bytes += size
+    return removed, removed_bytes
+
+
+def _maybe_prune():
+    """前回の整理から PRUNE_INTERVAL 秒たっていればキャッシュを整理する"""
+    global _last_prune
+    now = time.monotonic()
+    if _last_prune is not None and now - _last_prune < PRUNE_INTERVAL:
+        return
+    _last_prune = now
+    prune_cache()
+
+
+class PageCacheWriter:
+    """ページを1つずつ受け取り、store_pages() と同じ内容のキャッシュを保存する
+
+    ページのHTMLはメモリにためずに一時ファイルに書いておき、重複の判定には
+    ページのハッシュだけを使います（ファイルから少しずつ描画する場合用）。
+
+    使い方:
+        with PageCacheWriter(key) as cache:
+            for page in pages:
+                cache.add(page)
+        # 途中で例外が起きた場合は保存しない
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self._ids = {}
+        self._order = []
+        self._spool = tempfile.TemporaryFile('w+', encoding='utf-8', newline='')
+
+    def add(self, page):
+        page_digest = hashlib.blake2b(page.encode('utf-8'), digest_size=16).digest()
+        fragment_id = self._ids.get(page_digest)
+        if fragment_id is None:
+            fragment_id = self._ids[page_digest] = len(self._ids)
+            self._spool.write((', ' if fragment_id else '') + json.dumps(page, ensure_ascii=False))
+        self._order.append(fragment_id)
+
+    def _iter_json(self):
+        self._spool.seek(0)
+        yield '{"fragments": ['
+        for chunk in iter(lambda: self._spool.read(1 << 16), ''):
+            yield chunk
+        yield '], "pages": ' + json.dumps(self._order) + '}'
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                write_output_chunks(cache_path(self.key), self._iter_json())
+                _maybe_prune()
+        finally:
+            self._spool.close()
@@ -11,18 +11,21 @@ Excelデータを一気にHTMLに変換するシンプル版
 使い方: python simple_converter.py
 """
 
+import importlib.util
+import itertools
 import re
 from pathlib import Path
 
+from image_cache import illustration_html
+from output_writer import format_write_stats, write_output, write_output_chunks
+import render_cache
+from story_rows import branch_options, format_row_errors, iter_workbook_sheets
+
 # デフォルトのExcelファイル名
 DEFAULT_EXCEL_FILE = 'main_0_暗黒時代・上.xlsx'
 
-# openpyxlはExcel抽出時のみ必要
-try:
-    import openpyxl
-    HAS_OPENPYXL = True
-except ImportError:
-    HAS_OPENPYXL = False
+# openpyxlはExcel抽出時のみ必要（読み込みに時間がかかるので、ここでは有無だけ確認）
+HAS_OPENPYXL = importlib.util.find_spec('openpyxl') is not None
 
 # 設定ファイルを読み込み（存在する場合）
 try:
@@ -33,6 +36,16 @@ except ImportError:
     BRANCH_MODE = "include_all"
     BRANCH_DISPLAY = {"show_options": True, "options_format": "inline"}
 
+try:
+    from config import PAGINATION
+except ImportError:
+    PAGINATION = {"max_chars": 500, "max_lines": 16}
+
+try:
+    from config import RENDER_PARALLEL
+except ImportError:
+    RENDER_PARALLEL = {"min_chars": 1000000, "max_workers": None, "group_chars": 200000}
+
 def extract_title_from_filename(filename):
     """ファイル名からタイトルを抽出
     例: main_0_暗黒時代・上.xlsx → main_0_暗黒時代・上
@@ -43,8 +56,12 @@ def extract_title_from_filename(filename):
     # マッチしない場合は拡張子を除去
     return filename.replace('.xlsx', '')
 
-def extract_all_dialogues(excel_file=None):
-    """Excelから全てのシートの会話を抽出（話者情報込み）"""
+def extract_all_dialogues(excel_file=None, scenes=None):
+    """Excelから全てのシートの会話を抽出（話者情報込み）
+    
+    Args:
+        scenes: リストを渡すと、シートごとの指紋 [シート名, 指紋] を追加する（build_manifest.py）
+    """
     if not HAS_OPENPYXL:
         print("エラー: openpyxlがインストールされていません")
         print("インストール方法: pip install openpyxl")
@@ -53,105 +70,118 @@ def extract_all_dialogues(excel_file=None):
     if excel_file is None:
         excel_file = DEFAULT_EXCEL_FILE
     
-    wb = openpyxl.load_workbook(excel_file)
-    
     print("=" * 80)
     print(f"エクセルから会話データを抽出中: {excel_file}")
     print("=" * 80)
     
+    errors = []
+    sheets = iter_workbook_sheets(excel_file)
+    if scenes is not None:
+        from build_manifest import fingerprint_sheets
+        sheets = fingerprint_sheets(sheets, scenes)
+    result, decision_count = format_dialogues(sheets, errors)
+    if errors:
+        print(format_row_errors(errors))
+    print(f"\n検出した分岐数: {decision_count}")
+    print(f"ドクターの名前: {DOCTOR_NAME}")
+    print(f"分岐モード: {BRANCH_MODE}")
+    
+    return result
+
+def format_dialogues(sheets, errors=None):
+    """シートごとの行から ai_input のテキストを作る（1ファイル用の形式）
+    
+    一括変換（story_rows.format_ai_input）とは次の点が違います:
+    話者のない行（ナレーション）も出力する、--image-- は [画像]・--background-- は [背景]、
+    --imagetween-- は出力しない、BRANCH_DISPLAY の separate_page で【選択肢】を出す。
+    
+    Args:
+        sheets: (シート名, (行番号, B列, C列) のイテレータ) のイテレータ
+            （story_rows.iter_workbook_sheets() または ChapterRows.iter_sheets()）
+        errors: リストを渡すと、処理できなかった行を (シート名, 行番号, 内容) で追加して
+            残りの行の処理を続けます（None の場合は例外をそのまま送出）
+    
+    Returns:
+        (テキスト, 分岐の数)
+    """
     all_text = []
     decision_count = 0
     
-    for sheet_name in wb.sheetnames:
-        sheet = wb[sheet_name]
-        
+    for sheet_name, rows in sheets:
         all_text.append(f"\n\n{'=' * 60}")
         all_text.append(f"【シーン: {sheet_name}】")
         all_text.append(f"{'=' * 60}\n")
         
         in_decision = False
-        in_branch = False
         current_options = []
         choices_already_displayed = False  # 選択肢を一度表示したかどうか
         
-        for row in range(1, sheet.max_row + 1):
-            col2 = sheet.cell(row=row, column=2).value  # 話者
-            col3 = sheet.cell(row=row, column=3).value  # セリフ/内容
-            
-            if not col3:
-                continue
-                
-            # 分岐システムの処理
-            if col2 == '--Decision--':
-                in_decision = True
-                decision_count += 1
-                if BRANCH_DISPLAY["show_options"] and BRANCH_DISPLAY["options_format"] == "separate_page":
-                    all_text.append("\n【選択肢】")
-                current_options = []
-                choices_already_displayed = False  # リセット
-                continue
-                
-            elif col2 == '--Decision End--':
-                in_decision = False
-                if current_options and BRANCH_MODE == "include_all" and not choices_already_displayed:
-                    # 全ての選択肢をインラインで表示（最初の1回だけ）
-                    if BRANCH_DISPLAY["show_options"] and BRANCH_DISPLAY["options_format"] == "inline":
-                        all_text.append("\n【ドクターの選択肢】")
-                        for i, opt in enumerate(current_options, 1):
-                            all_text.append(f"  選択肢{i}: {opt}")
-                        all_text.append("")
-                        choices_already_displayed = True
-                continue
-                
-            elif col2 and col2.startswith('Option_'):
-                # 選択肢
-                if in_decision:
-                    current_options.append(col3.strip())
-                continue
-                
-            elif col2 == '--Branch--':
-                # 分岐点
-                branch_info = col3.strip() if col3 else ""
-                if BRANCH_MODE == "include_all":
-                    # 分岐マーカーの後に選択肢番号を表示
-                    all_text.append(f"\n【分岐: {branch_info}】")
+        for row, col2, col3 in rows:  # col2: 話者, col3: セリフ/内容
+            try:
+                if not col3:
+                    continue
                     
-                    # >Options_X または >Options_X&Y&Z から番号を抽出
-                    import re as re_module
-                    # >Options_1&2&3 のような複数選択肢にも対応
-                    match = re_module.search(r'>Options_([0-9&]+)', branch_info)
-                    if match and current_options:
-                        option_nums_str = match.group(1)
-                        # &で分割して複数の番号を取得
-                        option_nums = [int(n) for n in option_nums_str.split('&')]
-                        # 各選択肢を表示
-                        for option_num in option_nums:
-                            if option_num <= len(current_options):
+                # 分岐システムの処理
+                if col2 == '--Decision--':
+                    in_decision = True
+                    decision_count += 1
+                    if BRANCH_DISPLAY["show_options"] and BRANCH_DISPLAY["options_format"] == "separate_page":
+                        all_text.append("\n【選択肢】")
+                    current_options = []
+                    choices_already_displayed = False  # リセット
+                    continue
+                    
+                elif col2 == '--Decision End--':
+                    in_decision = False
+                    if current_options and BRANCH_MODE == "include_all" and not choices_already_displayed:
+                        # 全ての選択肢をインラインで表示（最初の1回だけ）
+                        if BRANCH_DISPLAY["show_options"] and BRANCH_DISPLAY["options_format"] == "inline":
+                            all_text.append("\n【ドクターの選択肢】")
+                            for i, opt in enumerate(current_options, 1):
+                                all_text.append(f"  選択肢{i}: {opt}")
+                            all_text.append("")
+                            choices_already_displayed = True
+                    continue
+                    
+                elif col2 and col2.startswith('Option_'):
+                    # 選択肢
+                    if in_decision:
+                        current_options.append(col3.strip())
+                    continue
+                    
+                elif col2 == '--Branch--':
+                    # 分岐点
+                    branch_info = col3.strip()
+                    if BRANCH_MODE == "include_all":
+                        # 分岐マーカーの後に選択肢番号を表示（>Options_1&2&3 のような複数選択肢にも対応）
+                        all_text.append(f"\n【分岐: {branch_info}】")
+                        for option_num in branch_options(branch_info):
+                            if 0 < option_num <= len(current_options):
                                 all_text.append(f"  選択肢{option_num}: {current_options[option_num-1]}")
-                continue
-            
-            # 通常の処理
-            if col2 == '--image--':
-                all_text.append(f"[画像]: {col3}")
-            elif col2 == '--background--':
-                all_text.append(f"[背景]: {col3}")
-            elif col2 in ['----', '--imagetween--']:
-                continue
-            elif col2 and col2 not in ['Option_1', 'Option_2', 'Option_3']:
-                # {@nickname}を置き換え
-                text = col3.strip().replace('{@nickname}', DOCTOR_NAME)
-                all_text.append(f"【{col2}】{text}")
-            else:
-                # 話者情報がない場合
-                text = col3.strip().replace('{@nickname}', DOCTOR_NAME)
-                all_text.append(text)
-    
-    result = '\n'.join(all_text)
-    print(f"\n検出した分岐数: {decision_count}")
-    print(f"ドクターの名前: {DOCTOR_NAME}")
-    print(f"分岐モード: {BRANCH_MODE}")
+                    continue
+                
+                # 通常の処理
+                if col2 == '--image--':
+                    all_text.append(f"[画像]: {col3}")
+                elif col2 == '--background--':
+                    all_text.append(f"[背景]: {col3}")
+                elif col2 in ['----', '--imagetween--']:
+                    continue
+                elif col2:
+                    # {@nickname}を置き換え
+                    text = col3.strip().replace('{@nickname}', DOCTOR_NAME)
+                    all_text.append(f"【{col2}】{text}")
+                else:
+                    # 話者情報がない場合
+                    text = col3.strip().replace('{@nickname}', DOCTOR_NAME)
+                    all_text.append(text)
+            except Exception as e:
+                # 1行の問題でワークブック全体を止めず、行ごとに記録して続ける
+                if errors is None:
+                    raise
+                errors.append((sheet_name, row, f'{type(e).__name__}: {e}'))
     
-    return result
+    return '\n'.join(all_text), decision_count
 
 def save_to_file(content, filename):
     """ファイルに保存"""
@@ -159,16 +189,13 @@ def save_to_file(content, filename):
     output_dir.mkdir(exist_ok=True)
     
     filepath = output_dir / filename
-    with open(filepath, 'w', encoding='utf-8') as f:
-        f.write(content)
+    write_output(filepath, content)
     
     return filepath
 
-def create_html(novel_text, output_file='generated_novel.html', title='小説'):
-    """小説テキストからHTMLを生成"""
-    
-    # HTMLテンプレート
-    html_template = """<!DOCTYPE html>
+
+# HTMLテンプレート
+HTML_TEMPLATE = """<!DOCTYPE html>
 <html lang="ja">
 <head>
     <meta charset="UTF-8">
@@ -327,7 +354,7 @@ def create_html(novel_text, output_file='generated_novel.html', title='小説'):
     </style>
 </head>
 
-<body>
+<body data-page-count="{page_count}">
     <div class="page">
         <h1>{title}</h1>
     </div>
@@ -335,39 +362,355 @@ def create_html(novel_text, output_file='generated_novel.html', title='小説'):
 {pages}
 </body>
 </html>"""
+
+
+def create_html(novel_text, output_file='generated_novel.html', title='小説', image_map=None, extras=None):
+    """小説テキストからHTMLを生成
+    
+    Args:
+        image_map: image_cache.prepare_images() の結果。指定した画像はローカルの
+            縮小画像（srcset付き）で表示します
+        extras: HTMLに追加するもの（html_additions() を参照）
+    """
+    pages_html = render_pages_cached(novel_text, image_map=image_map, parallel=True)
+    
+    # ファイルに保存（1つの大きな文字列にまとめず、ページごとに書き出す）
+    output_dir = Path('output')
+    output_dir.mkdir(exist_ok=True)
+    output_path = output_dir / output_file
+    additions = html_additions(output_path, title, pages_html, extras)
+    write_output_chunks(output_path, iter_html(pages_html, title, additions))
+    
+    return output_path
+
+
+def create_html_from_file(source_path, output_file='generated_novel.html', title='小説', image_map=None,
+                          extras=None):
+    """小説テキストのファイルから、create_html() と同じHTMLを生成（大きなファイル向け）
+    
+    ファイルを段落ごとに読みながら描画し、ページは一時ファイルにためてから書き出すので、
+    テキスト全体もページのリストもメモリに載せません（ページ数はHTMLの先頭に必要なため、
+    すべて描画してから書き出します）。描画キャッシュは create_html() と共通です。
+    """
+    output_dir = Path('output')
+    output_dir.mkdir(exist_ok=True)
+    output_path = output_dir / output_file
+    
+    with render_file_pages(source_path, image_map=image_map) as pages:
+        additions = html_additions(output_path, title, pages, extras)
+        write_output_chunks(output_path, iter_html(pages, title, additions))
+    
+    return output_path
+
+
+class RenderedPages:
+    """描画したページ（描画キャッシュから読んだリストか、ページをためた一時ファイル）
+    
+    iter_html() にページのリストの代わりに渡せます。一時ファイルの場合は、
+    ページのHTMLを1行ずつ返します（html_additions() で文字を集めるため）。
+    """
+    
+    def __init__(self, pages=None):
+        self.pages = pages
+        self.spool = None
+        self.page_count = len(pages) if pages is not None else 0
+        if pages is None:
+            import tempfile
+            self.spool = tempfile.TemporaryFile('w+', encoding='utf-8', newline='')
+    
+    def add(self, page):
+        self.spool.write(page if self.page_count == 0 else '\n\n' + page)
+        self.page_count += 1
+    
+    def __len__(self):
+        return self.page_count
+    
+    def __iter__(self):
+        if self.spool is None:
+            return iter(self.pages)
+        self.spool.seek(0)
+        return iter(self.spool)
+    
+    def iter_chunks(self, chunk_size=1 << 16):
+        """ページを '\n\n' でつないだHTMLを少しずつ返す"""
+        if self.spool is None:
+            for number, page in enumerate(self.pages):
+                yield page if number == 0 else '\n\n' + page
+            return
+        self.spool.seek(0)
+        for chunk in iter(lambda: self.spool.read(chunk_size), ''):
+            yield chunk
+    
+    def close(self):
+        if self.spool is not None:
+            self.spool.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+
+
+def render_file_pages(source_path, image_map=None):
+    """小説テキストのファイルを描画して RenderedPages を返す（描画キャッシュがあればそこから）
+    
+    ファイルを段落ごとに読みながら描画し、ページは一時ファイルにためるので、
+    テキスト全体もページのリストもメモリに載せません。
+    """
+    key = render_cache.file_cache_key(source_path, image_map)
+    pages_html = render_cache.load_pages(key)
+    if pages_html is not None:
+        return RenderedPages(pages_html)
+    
+    pages = RenderedPages()
+    try:
+        with render_cache.PageCacheWriter(key) as cache:
+            for page in iter_file_pages(source_path, image_map=image_map, parallel=True):
+                pages.add(page)
+                cache.add(page)
+    except BaseException:
+        pages.close()
+        raise
+    return pages
+
+
+def build_html(pages_html, title):
+    """ページのHTMLをテンプレートに埋め込み、HTML全体を返す"""
+    final_html = HTML_TEMPLATE.replace('{pages}', '\n\n'.join(pages_html))
+    final_html = final_html.replace('{page_count}', str(len(pages_html) + 1))
+    final_html = final_html.replace('{title}', title)
+    return final_html
+
+
+def iter_html(pages_html, title, additions=None):
+    """build_html() と同じHTMLを、ページごとに分けて返す（ファイルへの書き出し用）
+    
+    Args:
+        pages_html: ページのリストか RenderedPages
+        additions: html_additions() の結果（<head> と </body> の前に入れる部分）
+    """
+    if not isinstance(pages_html, RenderedPages):
+        pages_html = RenderedPages(pages_html)
+    head, tail = _html_head_tail(len(pages_html), title, additions)
+    yield head
+    yield from pages_html.iter_chunks()
+    yield tail
+
+
+def _html_head_tail(page_count, title, additions=None):
+    """HTML_TEMPLATE のページより前と後ろの部分（additions は </head> と </body> の前に入れる）"""
+    head, tail = HTML_TEMPLATE.split('{pages}')
+    head = head.replace('{page_count}', str(page_count + 1)).replace('{title}', title)
+    return add_to_template(head, tail, additions)
+
+
+def add_to_template(head, tail, additions=None):
+    """テンプレートの前後の部分に html_additions() の結果を入れる"""
+    if additions is None:
+        return head, tail
+    head_addition, body_addition = additions
+    return head.replace('</head>', head_addition + '</head>'), tail.replace('</body>', body_addition + '</body>')
+
+
+def html_additions(html_path, title, texts, extras=None):
+    """HTMLを書き出す前に、テンプレートに追加する部分を決める
     
-    # テキストをページに分割
+    HTMLを書き出してから書き換えると、毎回2回書き込むことになり、
+    内容が変わらなくても更新日時が変わってしまうので、書き出す前にまとめて決めます。
+    
+    Args:
+        html_path: 書き出すHTMLのパス
+        texts: HTMLで表示するページ（1行ずつでもページごとでもよい。必要な場合だけ読みます）
+        extras: {'font': サブセットを作るフォントのパス（なければ None）,
+                 'offline': サービスワーカーの登録スクリプトを入れるか}
+    
+    Returns:
+        (</head> の前に入れる部分, </body> の前に入れる部分)。追加するものがなければ None
+    """
+    if not extras or not (extras.get('font') or extras.get('offline')):
+        return None
+    head_addition = body_addition = ''
+    if extras.get('font'):
+        from font_subset import font_style
+        head_addition = font_style(html_path, itertools.chain([title], texts), extras['font'])
+    if extras.get('offline'):
+        from offline_cache import register_script
+        body_addition = register_script(html_path)
+    return head_addition, body_addition
+
+
+def render_pages_cached(novel_text, image_map=None, parallel=False):
+    """render_pages() と同じ結果を、描画キャッシュがあればそこから返す"""
+    key = render_cache.cache_key(novel_text, image_map)
+    pages = render_cache.load_pages(key)
+    if pages is None:
+        pages = render_pages(novel_text, image_map=image_map, parallel=parallel)
+        render_cache.store_pages(key, pages)
+    return pages
+
+
+def render_pages(novel_text, image_map=None, parallel=False):
+    """小説テキストをページごとのHTMLに変換
+    
+    Args:
+        parallel: True の場合、長い章（RENDER_PARALLEL の min_chars 以上）はシーンごとに
+            分けてプロセスプールで描画します。短い章はプールの起動の方が遅いので1プロセスで描画します
+    
+    Returns:
+        ページ（<div class="page">...</div>）のHTMLのリスト（タイトルページは含まない）
+    """
+    merged_paragraphs = _merge_paragraphs(novel_text.split('\n\n'))
+    if parallel and len(novel_text) >= RENDER_PARALLEL['min_chars']:
+        return _render_paragraphs_parallel(list(merged_paragraphs), image_map, RENDER_PARALLEL.get('max_workers'))
+    return _render_paragraphs(merged_paragraphs, image_map)
+
+
+def iter_file_pages(source_path, image_map=None, parallel=False):
+    """小説テキストのファイルを段落ごとに読みながら、render_pages() と同じページを1つずつ返す
+    
+    ファイル全体を読み込まないので、まとめた巻のような大きなテキストでも
+    使うメモリはほぼ一定です。
+    
+    Args:
+        parallel: True の場合、大きなファイル（RENDER_PARALLEL の min_chars バイト以上）は
+            シーンのまとまりごとにプロセスプールで描画します
+    """
+    from novel_reader import iter_paragraphs
+    
+    merged_paragraphs = _merge_paragraphs(iter_paragraphs(source_path))
+    if parallel and Path(source_path).stat().st_size >= RENDER_PARALLEL['min_chars']:
+        return _iter_pages_parallel(merged_paragraphs, image_map, RENDER_PARALLEL.get('max_workers'),
+                                    RENDER_PARALLEL.get('group_chars', 200000))
+    return _iter_pages(merged_paragraphs, image_map)
+
+
+def _is_scene_start(para):
+    para = para.strip()
+    return '=' * 10 in para or para.startswith('【シーン:')
+
+
+def _scene_groups(paragraphs, group_count):
+    """段落をシーンの区切りで、文字数がおおよそ均等な group_count 個以下のまとまりに分ける"""
+    scenes = []
+    for para in paragraphs:
+        if not scenes or _is_scene_start(para):
+            scenes.append([])
+        scenes[-1].append(para)
+    
+    target = sum(len(para) for para in paragraphs) / group_count
+    groups = []
+    size = 0
+    for scene in scenes:
+        if not groups or size >= target:
+            groups.append([])
+            size = 0
+        groups[-1].extend(scene)
+        size += sum(len(para) for para in scene)
+    return groups
+
+
+def _render_paragraphs_parallel(paragraphs, image_map=None, max_workers=None):
+    """シーンのまとまりごとにプロセスプールで描画し、元の順番につなげる"""
+    import os
+    from concurrent.futures import ProcessPoolExecutor
+    from itertools import repeat
+    
+    workers = max_workers or os.cpu_count() or 1
+    groups = _scene_groups(paragraphs, workers * 4)
+    if workers == 1 or len(groups) == 1:
+        return _render_paragraphs(paragraphs, image_map)
     pages_html = []
-    paragraphs = novel_text.split('\n\n')
+    with ProcessPoolExecutor(max_workers=min(workers, len(groups))) as pool:
+        for pages in pool.map(_render_paragraphs, groups, repeat(image_map)):
+            pages_html.extend(pages)
+    return pages_html
+
+
+def _iter_scene_chunks(paragraphs, group_chars):
+    """段落をシーンの区切りで、group_chars 文字ほどのまとまりにして順に返す"""
+    group = []
+    size = 0
+    for para in paragraphs:
+        if size >= group_chars and _is_scene_start(para):
+            yield group
+            group = []
+            size = 0
+        group.append(para)
+        size += len(para)
+    if group:
+        yield group
+
+
+def _iter_pages_parallel(paragraphs, image_map=None, max_workers=None, group_chars=200000):
+    """_render_paragraphs_parallel() の逐次版
+    
+    段落を読みながらシーンのまとまりをプロセスプールに渡し、終わったものから順番どおりに返します。
+    処理中のまとまりはプロセス数の2倍までに抑えるので、大きなファイルでもメモリは増え続けません。
+    """
+    import os
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor
+    
+    workers = max_workers or os.cpu_count() or 1
+    if workers == 1:
+        yield from _iter_pages(paragraphs, image_map)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = deque()
+        for group in _iter_scene_chunks(paragraphs, group_chars):
+            in_flight.append(pool.submit(_render_paragraphs, group, image_map))
+            if len(in_flight) >= workers * 2:
+                yield from in_flight.popleft().result()
+        while in_flight:
+            yield from in_flight.popleft().result()
+
+
+def _merge_paragraphs(paragraphs):
+    """選択肢セクションを次の分岐セクションと結合する
     
-    # 選択肢セクションを次の分岐セクションと結合する前処理
-    merged_paragraphs = []
-    i = 0
-    while i < len(paragraphs):
-        para = paragraphs[i].strip()
+    段落のリストでもファイルから少しずつ読んだ段落でも使えるように、段落を1つずつ受け取って
+    結合した段落を順に返します。先読みするのは分岐セクションの次の1段落だけなので、
+    手元に残るのは結合中の選択肢ブロック1つ分です。
+    """
+    paragraphs = iter(paragraphs)
+    pending = None  # 先読みした次の選択肢セクション
+    while True:
+        if pending is not None:
+            para, pending = pending, None
+        else:
+            para = next(paragraphs, None)
+            if para is None:
+                return
+        para = para.strip()
         
         # 選択肢セクションを検出
         if '【ドクターの選択肢】' in para or (para and para.split('\n')[0].strip().startswith('選択肢')):
             # 次の段落以降で分岐セクションを探して結合
             combined = [para]
-            j = i + 1
-            while j < len(paragraphs):
-                next_para = paragraphs[j].strip()
+            for next_para in paragraphs:
+                next_para = next_para.strip()
+                if '【ドクターの選択肢】' in next_para:
+                    # 次の選択肢セクションなので含めない
+                    pending = next_para
+                    break
                 combined.append(next_para)
-                # 分岐セクションの終わり（次の選択肢または通常テキスト）を検出
-                if '【ドクターの選択肢】' in next_para or (next_para and not next_para.startswith('【分岐:') and '【分岐:' not in next_para):
-                    # 分岐セクションが終わったので、次の選択肢の前で止まる
-                    if '【ドクターの選択肢】' in next_para:
-                        # 次の選択肢セクションなので含めない
-                        combined.pop()
-                        j -= 1
+                # 分岐セクションの終わり（通常テキスト）を検出
+                if next_para and '【分岐:' not in next_para:
                     break
-                j += 1
-            merged_paragraphs.append('\n\n'.join(combined))
-            i = j + 1
+            yield '\n\n'.join(combined)
         else:
-            merged_paragraphs.append(para)
-            i += 1
+            yield para
+
+
+def _render_paragraphs(merged_paragraphs, image_map=None):
+    """_merge_paragraphs() の結果をページのHTMLのリストにする（プロセスプールからも呼ばれる）"""
+    return list(_iter_pages(merged_paragraphs, image_map))
+
+
+def _iter_pages(merged_paragraphs, image_map=None):
+    """_merge_paragraphs() の結果から、ページのHTMLを1つずつ返す"""
+    fragments = {}  # 同じ選択肢・回答のページは1回だけ描画して使い回す
     
     for para in merged_paragraphs:
         para = para.strip()
@@ -382,9 +725,9 @@ def create_html(novel_text, output_file='generated_novel.html', title='小説'):
                 line = line.strip()
                 if line.startswith('【シーン:') and '】' in line:
                     heading = line.replace('【シーン:', '').replace('】', '').strip()
-                    pages_html.append(f'''    <div class="page">
+                    yield f'''    <div class="page">
         <h2>{heading}</h2>
-    </div>''')
+    </div>'''
             continue
         
         # 画像マーカーとテキストが混在している段落を分離
@@ -403,9 +746,9 @@ def create_html(novel_text, output_file='generated_novel.html', title='小説'):
                         is_background = '[背景]' in line or '【--background--】' in line
                         alt_text = "背景" if is_background else "イラスト"
                         
-                        pages_html.append(f'''    <div class="page">
-        <img class="illustration" src="{url}" alt="{alt_text}">
-    </div>''')
+                        yield f'''    <div class="page">
+        {illustration_html(url, alt_text, image_map)}
+    </div>'''
                 else:
                     # 画像行でない場合は保存
                     if line_stripped:
@@ -422,65 +765,131 @@ def create_html(novel_text, output_file='generated_novel.html', title='小説'):
         if para.startswith('【シーン:') and '】' in para:
             heading = para.replace('【シーン:', '').replace('】', '').strip()
             heading = heading.replace('\n', '<br>')
-            pages_html.append(f'''    <div class="page">
+            yield f'''    <div class="page">
         <h2>{heading}</h2>
-    </div>''')
+    </div>'''
             continue
         
         # 分岐セクションの検出と分割処理
         if '【ドクターの選択肢】' in para or '【分岐:' in para:
             # 分岐セクションを【分岐:】ごとに分割
-            branch_pages = _split_branch_section(para)
-            pages_html.extend(branch_pages)
+            yield from _split_branch_section(para, fragments)
             continue
         
-        # 通常のテキスト
-        # 【話者名】を上に表示する形式に変換
-        lines = para.split('\n')
-        formatted_lines = []
-        for line in lines:
-            # 【話者名】セリフ の形式を検出
-            if line.strip().startswith('【') and '】' in line:
-                # 話者名とセリフを分離
-                speaker_end = line.find('】')
-                speaker = line[:speaker_end + 1]  # 【話者名】
-                dialogue = line[speaker_end + 1:]  # セリフ部分
-                
-                # 話者名を<span>で囲んで改行を挿入
-                formatted_lines.append(f'<span class="speaker">{speaker}</span><br>{dialogue}')
-            else:
-                formatted_lines.append(line)
-        
-        formatted = '<br>\n            '.join(formatted_lines)
-        formatted = re.sub(r'(\d{1,2})(?=[年月日時分秒cc])', r'<span class="tcy">\1</span>', formatted)
-        
-        pages_html.append(f'''    <div class="page text">
-        <p>
-            {formatted}
-        </p>
-    </div>''')
+        # 通常のテキスト（長い段落は複数ページに分割）
+        for page_lines in _paginate_lines(para.split('\n'), PAGINATION['max_chars'], PAGINATION['max_lines']):
+            yield _create_text_page(page_lines)
+
+
+def _is_speaker_line(line):
+    return line.strip().startswith('【') and '】' in line
+
+
+def _split_long_line(line, max_chars):
+    """上限を超える地の文を文末（。！？）で分割する
+
+    話者付きのセリフは分割しません。文末で区切れない場合はそのまま返します。
+    """
+    if len(line) <= max_chars or _is_speaker_line(line):
+        return [line]
     
-    # HTMLを生成
-    final_html = html_template.replace('{pages}', '\n\n'.join(pages_html))
-    final_html = final_html.replace('{title}', title)
+    chunks = []
+    start = 0
+    last_break = None
+    for i, char in enumerate(line):
+        if char in '。！？':
+            last_break = i + 1
+        if i + 1 - start > max_chars and last_break and last_break > start:
+            chunks.append(line[start:last_break])
+            start = last_break
+    chunks.append(line[start:])
+    return [chunk for chunk in chunks if chunk]
+
+
+def _paginate_lines(lines, max_chars, max_lines):
+    """段落の行を、文字数と行数の上限に収まるページに分ける（線形時間）
+
+    行の途中では分割しないので、話者付きのセリフや縦中横（<span class="tcy">）が
+    ページをまたぐことはありません。話者付きのセリフは話者名の行も含めて2行と数えます。
     
-    # ファイルに保存
-    output_dir = Path('output')
-    output_dir.mkdir(exist_ok=True)
-    output_path = output_dir / output_file
+    Returns:
+        ページごとの行のリスト
+    """
+    if not max_chars or not max_lines:
+        return [lines]
+    
+    pages = []
+    current = []
+    chars = 0
+    height = 0
+    for line in lines:
+        for unit in _split_long_line(line, max_chars):
+            unit_height = 2 if _is_speaker_line(unit) else 1
+            if current and (chars + len(unit) > max_chars or height + unit_height > max_lines):
+                pages.append(current)
+                current = []
+                chars = 0
+                height = 0
+            current.append(unit)
+            chars += len(unit)
+            height += unit_height
+    if current:
+        pages.append(current)
+    return pages
+
+
+def _create_text_page(lines):
+    """通常のテキストページを生成（【話者名】を上に表示する形式に変換）"""
+    formatted_lines = []
+    for line in lines:
+        # 【話者名】セリフ の形式を検出
+        if _is_speaker_line(line):
+            # 話者名とセリフを分離
+            speaker_end = line.find('】')
+            speaker = line[:speaker_end + 1]  # 【話者名】
+            dialogue = line[speaker_end + 1:]  # セリフ部分
+            
+            # 話者名を<span>で囲んで改行を挿入
+            formatted_lines.append(f'<span class="speaker">{speaker}</span><br>{dialogue}')
+        else:
+            formatted_lines.append(line)
     
-    with open(output_path, 'w', encoding='utf-8') as f:
-        f.write(final_html)
+    formatted = '<br>\n            '.join(formatted_lines)
+    formatted = re.sub(r'(\d{1,2})(?=[年月日時分秒cc])', r'<span class="tcy">\1</span>', formatted)
     
-    return output_path
+    return f'''    <div class="page text">
+        <p>
+            {formatted}
+        </p>
+    </div>'''
+
+
+def _interned(fragments, builder, *args):
+    """builder(*args) の結果を返す（同じ引数で作ったページがあればそれを使い回す）
+    
+    使い回すのは描画の手間と、メモリ上の同じ文字列だけです。章のHTMLには
+    ページがそのまま並ぶので、同じ内容のページも毎回書き出され、章ごとのHTMLの
+    大きさは変わりません。1回だけ保存するのは描画キャッシュ（render_cache.py）と、
+    まとめ読みHTMLの遅延読み込みの章（volume_html.py）です。
+    """
+    if fragments is None:
+        return builder(*args)
+    key = (builder.__name__,) + tuple(tuple(arg) if isinstance(arg, list) else arg for arg in args)
+    page = fragments.get(key)
+    if page is None:
+        page = fragments[key] = builder(*args)
+    return page
 
 
-def _split_branch_section(content):
+def _split_branch_section(content, fragments=None):
     """分岐セクションを適切に分割して処理
     
     処理の流れ:
     1. 最初に全選択肢を表示するページ
     2. 各選択肢番号ごとに「選択肢 + 回答」のページを作成
+    
+    fragments に辞書を渡すと、同じ内容のページは描画し直さずに使い回します（章ごとに1つ）。
+    返すリストには同じページがそのまま何回も入ります（_interned() を参照）。
     """
     pages = []
     lines = content.split('\n')
@@ -565,7 +974,7 @@ def _split_branch_section(content):
             seen.add(choice)
     
     if unique_choices:
-        pages.append(_create_choices_page(unique_choices))
+        pages.append(_interned(fragments, _create_choices_page, unique_choices))
     
     # 各分岐の処理
     # 1. 単一選択肢（数値キー）: 選択肢 + 回答のページを作成
@@ -577,7 +986,7 @@ def _split_branch_section(content):
     for i in sorted(numeric_branches.keys()):
         branch_data = numeric_branches[i]
         # 選択肢 + 回答のページを作成
-        pages.append(_create_choice_with_response_page(branch_data['choice'], branch_data['lines']))
+        pages.append(_interned(fragments, _create_choice_with_response_page, branch_data['choice'], branch_data['lines']))
     
     # 複数選択肢が同じ結果になる場合（combined）の処理
     # 選択肢は既に全選択肢ページで表示済みなので、回答のみ表示
@@ -585,11 +994,11 @@ def _split_branch_section(content):
         branch_data = combined_branches[branch_id]
         # branch_idから番号部分を抽出 (combined_1&2&3 -> 1&2&3)
         option_nums = branch_id.replace('combined_', '')
-        pages.append(_create_combined_branch_page(branch_data['lines'], option_nums))
+        pages.append(_interned(fragments, _create_combined_branch_page, branch_data['lines'], option_nums))
     
     # 'end' 分岐がある場合は、選択肢なしで表示
     if 'end' in branches and branches['end']:
-        pages.append(_create_end_branch_page(branches['end']['lines']))
+        pages.append(_interned(fragments, _create_end_branch_page, branches['end']['lines']))
     
     return pages
 
@@ -714,11 +1123,25 @@ def _create_combined_branch_page(response_lines, option_nums):
     </div>'''
 
 
+def prepare_chapter_images(text):
+    """テキスト中の画像をキャッシュ・縮小して image_map を返す（--images オプション）
+    
+    text は文字列のほか、開いたファイルなど行のイテラブルでも構いません。
+    """
+    from image_cache import find_image_urls, prepare_images
+    
+    urls = find_image_urls(text)
+    image_map = prepare_images(urls)
+    print(f"✓ 画像: {len(image_map)}/{len(urls)} 枚をローカルキャッシュから表示します")
+    return image_map
+
+
 def main():
     import sys
     
     # コマンドライン引数チェック
     skip_ai = '--no-ai' in sys.argv or '--direct' in sys.argv
+    use_images = '--images' in sys.argv
     
     print("\n" + "=" * 80)
     if skip_ai:
@@ -762,8 +1185,10 @@ def main():
             print("AI変換をスキップして直接HTML生成します")
             print("=" * 80 + "\n")
             output_filename = f'{title}.html'
-            html_file = create_html(dialogues, output_file=output_filename, title=title)
+            html_file = create_html(dialogues, output_file=output_filename, title=title,
+                                    image_map=prepare_chapter_images(dialogues) if use_images else None)
             print(f"✓ HTMLファイルを生成しました: {html_file}")
+            print(format_write_stats())
             print(f"\nブラウザで開いて確認してください!")
             return
         
@@ -805,13 +1230,17 @@ def main():
         print(f"小説テキストが見つかりました: {novel_file.name}")
         print("=" * 80 + "\n")
         
-        with open(novel_file, 'r', encoding='utf-8') as f:
-            novel_text = f.read()
+        image_map = None
+        if use_images:
+            with open(novel_file, 'r', encoding='utf-8') as f:
+                image_map = prepare_chapter_images(f)
         
-        # 出力ファイル名をタイトルに基づいて決定
+        # 出力ファイル名をタイトルに基づいて決定（ファイルは段落ごとに読みながら描画）
         output_filename = f'{title}.html'
-        html_file = create_html(novel_text, output_file=output_filename, title=title)
+        html_file = create_html_from_file(novel_file, output_file=output_filename, title=title,
+                                          image_map=image_map)
         print(f"✓ HTMLファイルを生成しました: {html_file}")
+        print(format_write_stats())
         print(f"\nブラウザで開いて確認してください!")
     else:
         print(f"⚠ novel_output_{title}.txt または novel_output.txt がありません。")
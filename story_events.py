@@ -0,0 +1,196 @@
+"""
+物語データのNDJSON（1行に1つのJSON）での書き出し
+
+翻訳・チェック用のツールが ai_input_*.txt の【…】を正規表現で読み取らなくても済むように、
+ワークブックの各行を種類ごとのイベントとして1行ずつ書き出します。
+
+    {"type":"scene","workbook":"main_0_….xlsx","scene":"level_main_00_beg","index":0}
+    {"type":"line","scene":"…","row":3,"speaker":"アーミヤ","text":"{@nickname}、…"}
+    {"type":"decision","scene":"…","row":10,"decision":1}
+    {"type":"option","scene":"…","row":11,"decision":1,"option":"1","text":"……"}
+    {"type":"branch","scene":"…","row":14,"decision":1,"options":[1],"text":">Options_1"}
+    {"type":"image","scene":"…","row":20,"kind":"tween","url":"https://…"}
+
+- 行の解釈は ai_input と同じです（story_rows.story_row_kind を共通で使うので、
+  同じ行が出力され、同じ行が読み飛ばされます）。
+  ただしセリフの {@nickname} は置き換えずにそのまま書き出します。
+- ワークブックを読みながら1行ずつ書き出すので、どれだけ大きなワークブックでも
+  メモリの使用量は変わりません。一括処理の --events では、抽出と同じ読み込みで書き出します。
+- orjson があれば使います（pip install orjson）。なければ標準の json を使います（結果は同じです）。
+"""
+
+import json
+import os
+import sys
+from contextlib import contextmanager
+from pathlib import Path
+
+from output_writer import atomic_stream
+from story_rows import branch_options, story_row_kind
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+EVENTS_DIR = Path('output')
+
+
+def events_path(title, output_dir=EVENTS_DIR):
+    return Path(output_dir) / f'events_{title}.ndjson'
+
+
+def _default(value):
+    # orjson と同じ形式にそろえる（datetime は ISO 形式）
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+def dumps(event):
+    """イベントを改行付きの1行のJSON（バイト列）にする"""
+    if orjson is not None:
+        return orjson.dumps(event, default=_default, option=orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(event, ensure_ascii=False, separators=(',', ':'), default=_default) + '\n').encode('utf-8')
+
+
+def new_state():
+    """ワークブックの読み始めの状態（分岐の通し番号はシートをまたいで引き継ぐ）"""
+    return {'decision': 0, 'in_decision': False}
+
+
+def start_sheet(state):
+    """シートの読み始めに呼ぶ（format_ai_input と同じく、選択肢の途中かどうかはシートごとに戻す）"""
+    state['in_decision'] = False
+
+
+def scene_event(index, sheet_name, workbook=None):
+    event = {'type': 'scene'}
+    if workbook is not None:
+        event['workbook'] = workbook
+    event['scene'] = sheet_name
+    event['index'] = index
+    return event
+
+
+def row_event(state, scene, row, col2, col3):
+    """1行分のイベント（ai_input に出力されない行は None）"""
+    kind = story_row_kind(col2, col3, state['in_decision'])
+    if kind is None:
+        return None
+    if kind == 'decision':
+        state['decision'] += 1
+        state['in_decision'] = True
+        return {'type': 'decision', 'scene': scene, 'row': row, 'decision': state['decision']}
+    if kind == 'decision_end':
+        state['in_decision'] = False
+        return None
+    if kind == 'option':
+        return {'type': 'option', 'scene': scene, 'row': row, 'decision': state['decision'],
+                'option': col2[len('Option_'):], 'text': col3}
+    if kind == 'branch':
+        text = col3.strip()
+        return {'type': 'branch', 'scene': scene, 'row': row, 'decision': state['decision'],
+                'options': branch_options(text), 'text': text}
+    if kind == 'imagetween':
+        return {'type': 'image', 'scene': scene, 'row': row, 'kind': 'tween', 'url': col3}
+    if kind == 'image':
+        return {'type': 'image', 'scene': scene, 'row': row, 'kind': 'background', 'url': col3}
+    return {'type': 'line', 'scene': scene, 'row': row, 'speaker': col2.strip(), 'text': col3.strip()}
+
+
+def iter_events(sheets, workbook=None):
+    """(シート名, 行イテレータ) の並びからイベントを順に返す"""
+    state = new_state()
+    for index, (sheet_name, rows) in enumerate(sheets):
+        start_sheet(state)
+        yield scene_event(index, sheet_name, workbook)
+        for row, col2, col3 in rows:
+            event = row_event(state, sheet_name, row, col2, col3)
+            if event is not None:
+                yield event
+
+
+def _tee_rows(state, sheet_name, rows, write):
+    for row in rows:
+        event = row_event(state, sheet_name, *row)
+        if event is not None:
+            write(event)
+        yield row
+
+
+def _tee_sheets(sheets, write, workbook):
+    state = new_state()
+    for index, (sheet_name, rows) in enumerate(sheets):
+        start_sheet(state)
+        write(scene_event(index, sheet_name, workbook))
+        yield sheet_name, _tee_rows(state, sheet_name, rows, write)
+
+
+def tee_events(sheets, write, workbook=None):
+    """(シート名, 行イテレータ) をそのまま返しながら、各行のイベントを write() に渡す
+
+    抽出処理（format_ai_input など）に渡すシートの並びを包んで使います。
+    write が None の場合は sheets をそのまま返します。
+    """
+    if write is None:
+        return sheets
+    return _tee_sheets(sheets, write, workbook)
+
+
+@contextmanager
+def open_event_stream(path):
+    """イベントを1行ずつ書き出す関数を返す
+
+    path が '-' なら標準出力へ、None なら何もしない（None を返す）。
+    ファイルの場合は output_writer と同じく、書き終えてから置き換えます。
+    """
+    if path is None:
+        yield None
+    elif str(path) == '-':
+        out = sys.stdout.buffer
+        yield lambda event: out.write(dumps(event))
+        out.flush()
+    else:
+        with atomic_stream(path) as f:
+            yield lambda event: f.write(dumps(event))
+
+
+def export_workbook(excel_path, write):
+    """ワークブックを読みながらイベントを write() に渡し、イベントの数を返す"""
+    from story_rows import iter_workbook_sheets
+
+    count = 0
+    for event in iter_events(iter_workbook_sheets(excel_path), Path(excel_path).name):
+        write(event)
+        count += 1
+    return count
+
+
+def main(files, output=None):
+    """ワークブックをNDJSONに書き出す（cli.py export）
+
+    Args:
+        output: 出力先（'-' で標準出力、省略時はワークブックごとに output/events_[タイトル].ndjson）
+    """
+    from batch_converter import extract_title_from_filename
+
+    files = [Path(f) for f in files]
+    # 標準出力に書き出すときは、経過の表示が混ざらないように標準エラー出力へ
+    log = sys.stderr if output == '-' else sys.stdout
+    if output is not None:
+        try:
+            with open_event_stream(output) as write:
+                for excel_file in files:
+                    count = export_workbook(excel_file, write)
+                    print(f"✓ {excel_file.name}: {count:,}件", file=log)
+        except BrokenPipeError:
+            # head などの読み手が途中で終了した場合は、残りを捨てて正常に終わる
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 0
+    for excel_file in files:
+        path = events_path(extract_title_from_filename(excel_file.name))
+        with open_event_stream(path) as write:
+            count = export_workbook(excel_file, write)
+        print(f"✓ {excel_file.name}: {count:,}件 → {path}", file=log)
+    return 0
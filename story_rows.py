@@ -0,0 +1,393 @@
+"""
+Excelの行データを読み出す共通処理
+
+simple_converter.py / batch_converter.py / corpus_db.py から使います。
+openpyxlの読み取り専用モードでシートを1行ずつストリーミングするので、
+ワークブック全体をメモリに展開しません。
+章をメモリに置いておく場合は、列ごとにまとめた ChapterRows を使います。
+行から一括変換用の ai_input のテキストを作る処理（format_ai_input）もここにあり、
+batch_converter / バッチパイプライン / アプリから同じ結果になります
+（1ファイル用の simple_converter.format_dialogues は、ナレーションや画像の扱いが違います）。
+"""
+
+import datetime
+import re
+from array import array
+from collections import Counter
+
+try:
+    from config import DOCTOR_NAME
+except ImportError:
+    DOCTOR_NAME = "ドクター"
+
+try:
+    from config import BRANCH_MODE, BRANCH_DISPLAY
+except ImportError:
+    BRANCH_MODE = "include_all"
+    BRANCH_DISPLAY = {"show_options": True, "options_format": "inline"}
+
+# B列(話者列)に入る制御マーカー
+MARKER_KINDS = {
+    '--Decision--': 'decision',
+    '--Decision End--': 'decision_end',
+    '--Branch--': 'branch',
+    '--image--': 'image',
+    '--imagetween--': 'imagetween',
+    '--background--': 'background',
+    '----': 'separator',
+}
+
+
+def _format_float(value):
+    # 整数値の小数（Excelの数値セルは 3.0 のように読まれる）は 3 と表示する
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def _format_datetime(value):
+    if value.hour == value.minute == value.second == value.microsecond == 0:
+        return value.date().isoformat()
+    return value.isoformat(sep=' ')
+
+
+# 文字列以外のセルの値を文字列にする関数（型ごと）
+CELL_FORMATTERS = {
+    int: str,
+    float: _format_float,
+    bool: lambda value: 'TRUE' if value else 'FALSE',
+    datetime.datetime: _format_datetime,
+    datetime.date: datetime.date.isoformat,
+    datetime.time: datetime.time.isoformat,
+    datetime.timedelta: str,
+}
+
+
+def normalize_cell(value):
+    """セルの値を文字列（空なら None）にそろえる
+
+    数値・日付などのセルは CELL_FORMATTERS で型ごとに変換します
+    （例外処理は使わず、型で振り分けるだけなので速い）。
+    """
+    if type(value) is str or value is None:
+        return value
+    formatter = CELL_FORMATTERS.get(type(value))
+    return formatter(value) if formatter is not None else str(value)
+
+
+def open_workbook(excel_file):
+    """ワークブックを読み取り専用で開く（openpyxlはここで初めて読み込む）"""
+    import openpyxl
+    return openpyxl.load_workbook(excel_file, read_only=True)
+
+
+def classify_row(col2):
+    """B列の値から行の種類を判定
+
+    Returns:
+        'line'(話者付きセリフ) / 'narration'(話者なし) / 'option' /
+        MARKER_KINDS の値 / 'marker'(未知の --xxx-- マーカー)
+    """
+    if not col2:
+        return 'narration'
+    if not isinstance(col2, str):
+        return 'line'
+    kind = MARKER_KINDS.get(col2)
+    if kind:
+        return kind
+    if col2.startswith('Option_'):
+        return 'option'
+    if col2.startswith('--') and col2.endswith('--'):
+        return 'marker'
+    return 'line'
+
+
+# ai_input で話者として扱わない B列の値
+NOT_SPEAKERS = ('----', '--imagetween--', '--Decision--', '--Decision End--', '--Branch--')
+
+_BRANCH_OPTIONS = re.compile(r'>Options_([0-9&]+)')
+
+
+def story_row_kind(col2, col3, in_decision):
+    """ai_input と物語データ（story_events.py）で共通の、1行の解釈
+
+    Args:
+        in_decision: --Decision-- と --Decision End-- の間かどうか（シートごとに False から始める）
+
+    Returns:
+        'decision' / 'decision_end' / 'option' / 'branch' / 'imagetween' / 'image' / 'line'
+        （何も出力しない行は None）
+    """
+    if not col3:
+        return None
+    if col2 == '--Decision--':
+        return 'decision'
+    if col2 == '--Decision End--':
+        return 'decision_end'
+    if in_decision and col2 and col2.startswith('Option_'):
+        return 'option'
+    if col2 == '--Branch--':
+        return 'branch'
+    if col2 == '--imagetween--':
+        return 'imagetween'
+    if col2 == '--image--':
+        return 'image'
+    if col2 and col2 not in NOT_SPEAKERS:
+        return 'line'
+    return None
+
+
+def branch_options(branch_info):
+    """分岐の情報（>Options_1 や >Options_1&2&3）から選択肢の番号のリストを返す"""
+    match = _BRANCH_OPTIONS.search(branch_info)
+    return [int(n) for n in match.group(1).split('&') if n] if match else []
+
+
+def format_ai_input(sheets, errors=None):
+    """シートごとの行から ai_input のテキストを作る
+
+    Args:
+        sheets: (シート名, (行番号, B列, C列) のイテレータ) のイテレータ
+            （iter_workbook_sheets() または ChapterRows.iter_sheets()）
+        errors: リストを渡すと、処理できなかった行を (シート名, 行番号, 内容) で追加して
+            残りの行の処理を続けます（None の場合は例外をそのまま送出）
+
+    Returns:
+        (テキスト, 分岐の数)
+    """
+    all_text = []
+    decision_count = 0
+    include_branches = BRANCH_MODE == 'include_all'
+    show_options = BRANCH_DISPLAY.get('show_options', True)
+
+    for sheet_name, rows in sheets:
+        all_text.append(f"\n\n{'=' * 60}")
+        all_text.append(f"【シーン: {sheet_name}】")
+        all_text.append(f"{'=' * 60}\n")
+
+        in_decision = False
+        current_options = []
+        choices_already_displayed = False  # 選択肢を一度表示したかどうか
+
+        for row, col2, col3 in rows:
+            try:
+                kind = story_row_kind(col2, col3, in_decision)
+                if kind is None:
+                    continue
+
+                # 分岐システムの処理
+                if kind == 'decision':
+                    in_decision = True
+                    decision_count += 1
+                    current_options = []
+                    choices_already_displayed = False  # リセット
+                elif kind == 'decision_end':
+                    in_decision = False
+                    # 全ての選択肢を最初の1回だけ表示
+                    if current_options and include_branches and show_options and not choices_already_displayed:
+                        all_text.append('\n【ドクターの選択肢】')
+                        all_text.extend(current_options)
+                        all_text.append('')
+                        choices_already_displayed = True
+                elif kind == 'option':
+                    option_num = col2.replace('Option_', '')
+                    current_options.append(f"  選択肢{option_num}: {col3}")
+                elif kind == 'branch':
+                    if not include_branches:
+                        continue
+                    branch_info = col3.strip()
+                    all_text.append(f'\n【分岐: {branch_info}】')
+                    # >Options_1&2&3 のような複数選択肢にも対応
+                    if show_options:
+                        for option_num in branch_options(branch_info):
+                            if 0 < option_num <= len(current_options):
+                                all_text.append(current_options[option_num - 1])
+
+                # 画像
+                elif kind == 'imagetween':
+                    all_text.append(f'\n[画像]: {col3}')
+                elif kind == 'image':
+                    all_text.append(f'\n[背景]: {col3}')
+
+                # 話者とセリフ（{@nickname} を DOCTOR_NAME に置換）
+                else:
+                    dialogue = col3.strip().replace('{@nickname}', DOCTOR_NAME)
+                    all_text.append(f'【{col2.strip()}】{dialogue}')
+            except Exception as e:
+                # 1行の問題でワークブック全体を止めず、行ごとに記録して続ける
+                if errors is None:
+                    raise
+                errors.append((sheet_name, row, f'{type(e).__name__}: {e}'))
+
+    return '\n'.join(all_text), decision_count
+
+
+def iter_sheet_rows(sheet):
+    """シートの (行番号, B列, C列) を順に返す
+
+    B列・C列は normalize_cell() で文字列か None にそろえます（ほとんどのセルは文字列なので、
+    文字列以外のときだけ変換します）。
+    """
+    for row_number, row in enumerate(sheet.iter_rows(min_row=1, max_col=3, values_only=True), 1):
+        col2 = row[1] if len(row) > 1 else None
+        col3 = row[2] if len(row) > 2 else None
+        if type(col2) is not str and col2 is not None:
+            col2 = normalize_cell(col2)
+        if type(col3) is not str and col3 is not None:
+            col3 = normalize_cell(col3)
+        yield row_number, col2, col3
+
+
+def format_row_errors(errors, limit=10):
+    """抽出で読み飛ばした行 [(シート名, 行番号, 内容)] を表示用の文字列にする"""
+    lines = [f"⚠ 処理できなかった行: {len(errors)}行（読み飛ばしました）"]
+    for sheet_name, row_number, message in errors[:limit]:
+        lines.append(f"  - {sheet_name} {row_number}行目: {message}")
+    if len(errors) > limit:
+        lines.append(f"  …ほか {len(errors) - limit}行")
+    return '\n'.join(lines)
+
+
+def iter_workbook_sheets(excel_file):
+    """ワークブックの (シート名, 行イテレータ) を順に返す
+
+    行イテレータは iter_sheet_rows() と同じ形式です。
+    空のシートも見出しを出せるように、シート単位で返します。
+    """
+    wb = open_workbook(excel_file)
+    try:
+        for sheet_name in wb.sheetnames:
+            yield sheet_name, iter_sheet_rows(wb[sheet_name])
+    finally:
+        wb.close()
+
+
+def iter_workbook_rows(excel_file):
+    """C列が空でない行を (シート名, 行番号, 話者, テキスト, 種類) で返す"""
+    for sheet_name, rows in iter_workbook_sheets(excel_file):
+        for row_number, col2, col3 in rows:
+            if not col3:
+                continue
+            speaker = col2.strip() if isinstance(col2, str) else col2
+            text = col3.strip() if isinstance(col3, str) else col3
+            yield sheet_name, row_number, speaker, text, classify_row(col2)
+
+
+# ChapterRows の種類コード（array('B') に入れる番号）
+KIND_CODES = ('line', 'narration', 'option', 'marker') + tuple(dict.fromkeys(MARKER_KINDS.values()))
+_KIND_INDEX = {kind: code for code, kind in enumerate(KIND_CODES)}
+
+
+class ChapterRows:
+    """1章分の行を列ごとにまとめて持つ
+
+    行ごとに文字列やタプルを作る代わりに、
+    - 話者: 話者表の番号（array）。同じ話者名は1つの文字列を共有します
+    - 種類: classify_row() の種類のコード（array）
+    - 本文: 全行をつなげた1つの文字列と、各行の開始位置（array）
+    として持つので、章をいくつもメモリに置いてもかさばりません。
+    C列が空の行は（抽出でも使わないので）持ちません。
+    """
+
+    def __init__(self):
+        self.sheet_names = []
+        self.sheet_starts = array('I')   # 各シートの最初の行の添字
+        self.row_numbers = array('I')
+        self.speaker_ids = array('I')
+        self.kind_codes = array('B')
+        self.text_offsets = array('I', [0])
+        self.speakers = [None]           # 話者表（0番は話者なし）
+        self.text = ''
+        self.other_values = {}           # 文字列以外のC列（数値・日付など）: 添字 → 値
+        self._speaker_index = {None: 0}
+        self._parts = []
+
+    @classmethod
+    def from_sheets(cls, sheets):
+        """iter_workbook_sheets() と同じ形式の (シート名, 行イテレータ) から作る"""
+        chapter = cls()
+        for sheet_name, rows in sheets:
+            chapter.add_sheet(sheet_name)
+            for row_number, col2, col3 in rows:
+                if col3:
+                    chapter.append(row_number, col2, col3)
+        chapter.finish()
+        return chapter
+
+    @classmethod
+    def from_workbook(cls, excel_file):
+        return cls.from_sheets(iter_workbook_sheets(excel_file))
+
+    def add_sheet(self, sheet_name):
+        self.sheet_names.append(sheet_name)
+        self.sheet_starts.append(len(self.row_numbers))
+
+    def append(self, row_number, col2, col3):
+        index = len(self.row_numbers)
+        speaker_id = self._speaker_index.get(col2)
+        if speaker_id is None:
+            speaker_id = self._speaker_index[col2] = len(self.speakers)
+            self.speakers.append(col2)
+        if isinstance(col3, str):
+            text = col3
+        else:
+            text = ''
+            self.other_values[index] = col3
+        self.row_numbers.append(row_number)
+        self.speaker_ids.append(speaker_id)
+        self.kind_codes.append(_KIND_INDEX[classify_row(col2)])
+        self._parts.append(text)
+        self.text_offsets.append(self.text_offsets[-1] + len(text))
+
+    def finish(self):
+        """追加した本文を1つの文字列にまとめる（追加が終わったら呼ぶ）"""
+        if self._parts:
+            self.text += ''.join(self._parts)
+            self._parts = []
+
+    def __len__(self):
+        return len(self.row_numbers)
+
+    def value(self, index):
+        """index 行目のC列の値"""
+        if index in self.other_values:
+            return self.other_values[index]
+        return self.text[self.text_offsets[index]:self.text_offsets[index + 1]]
+
+    def _sheet_bounds(self):
+        ends = list(self.sheet_starts[1:]) + [len(self)]
+        return zip(self.sheet_names, self.sheet_starts, ends)
+
+    def _iter_range(self, start, end):
+        speakers = self.speakers
+        for index in range(start, end):
+            yield self.row_numbers[index], speakers[self.speaker_ids[index]], self.value(index)
+
+    def iter_sheets(self):
+        """iter_workbook_sheets() と同じ形式で返す（C列が空の行は含まない）"""
+        for sheet_name, start, end in self._sheet_bounds():
+            yield sheet_name, self._iter_range(start, end)
+
+    def iter_rows(self):
+        """iter_workbook_rows() と同じ形式で返す"""
+        for sheet_name, start, end in self._sheet_bounds():
+            for index in range(start, end):
+                col2 = self.speakers[self.speaker_ids[index]]
+                col3 = self.value(index)
+                speaker = col2.strip() if isinstance(col2, str) else col2
+                text = col3.strip() if isinstance(col3, str) else col3
+                yield sheet_name, self.row_numbers[index], speaker, text, KIND_CODES[self.kind_codes[index]]
+
+    def kind_counts(self):
+        """種類ごとの行数 {種類: 行数}"""
+        counts = Counter(self.kind_codes)
+        return {KIND_CODES[code]: count for code, count in counts.items()}
+
+    def speaker_counts(self):
+        """話者付きセリフの話者ごとの行数（Counter）"""
+        line_code = _KIND_INDEX['line']
+        counts = Counter(speaker_id for speaker_id, code in zip(self.speaker_ids, self.kind_codes)
+                         if code == line_code)
+        result = Counter()
+        for speaker_id, count in counts.items():
+            speaker = self.speakers[speaker_id]
+            result[speaker.strip() if isinstance(speaker, str) else speaker] += count
+        return result
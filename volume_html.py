@@ -0,0 +1,120 @@
+"""
+複数の章を1つのHTMLにまとめる（まとめ読みモード）
+
+main_0_…, main_1_… のように続いている章を、番号順に1つの縦書きHTMLにします。
+各章のページは描画キャッシュ（render_cache.py）から読むので、描画済みの章は
+描画し直しません。書き出しは1章ずつ行うので、章が増えてもメモリ使用量は
+1章分で済みます。
+
+2章目以降はJSON（<script type="application/json">）に入れておき、章の扉ページが
+画面に近づいたときに展開します（章の区切りが遅延読み込みの単位になります）。
+JSONには同じ内容のページ（よくある分岐の回答など）を1回だけ入れ、番号で参照します。
+"""
+
+import json
+from pathlib import Path
+
+from output_writer import atomic_stream
+from render_cache import intern_pages
+from simple_converter import HTML_TEMPLATE, add_to_template, html_additions, render_pages_cached
+
+# 章の扉ページが近づいたら、その章のJSON {fragments, pages} からページを組み立てる
+# 折りたたまれた章の扉ページは隣り合っているので、一度に展開するのは一番手前の1章だけにして、
+# 展開したページの配置が決まってから（2フレーム後に）残りの扉ページを監視し直す
+LAZY_CHAPTER_SCRIPT = """    <script>
+    (function () {
+        var pending = Array.prototype.slice.call(document.querySelectorAll('.chapter-title[data-chapter]'))
+            .filter(function (marker) { return document.getElementById('chapter-' + marker.dataset.chapter); });
+        var observer = new IntersectionObserver(function (entries) {
+            var target = null;
+            entries.forEach(function (entry) {
+                if (entry.isIntersecting && (!target || pending.indexOf(entry.target) < pending.indexOf(target))) {
+                    target = entry.target;
+                }
+            });
+            if (!target) return;
+            observer.disconnect();
+            pending.splice(pending.indexOf(target), 1);
+            var chunk = document.getElementById('chapter-' + target.dataset.chapter);
+            var data = JSON.parse(chunk.textContent);
+            chunk.insertAdjacentHTML('afterend', data.pages.map(function (id) {
+                return data.fragments[id];
+            }).join('\\n\\n'));
+            chunk.remove();
+            requestAnimationFrame(function () { requestAnimationFrame(observeAll); });
+        }, {root: document.body, rootMargin: '0px 50% 0px 50%'});
+        function observeAll() {
+            pending.forEach(function (marker) { observer.observe(marker); });
+        }
+        observeAll();
+    })();
+    </script>
+"""
+
+
+def _read_text(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def _chapter_pages(source_path, image_map):
+    return render_pages_cached(_read_text(source_path), image_map=image_map)
+
+
+def _lazy_chapter_json(pages):
+    """ページのリストを遅延読み込み用のJSONにする（</script> で途切れないようにエスケープ）"""
+    fragments, order = intern_pages(pages)
+    data = json.dumps({'fragments': fragments, 'pages': order}, ensure_ascii=False)
+    return data.replace('</', '<\\/')
+
+
+def _iter_volume_texts(chapters):
+    """まとめ読みのHTMLで表示する章のタイトルとページ（--font で文字を集めるため）"""
+    for display_title, source_path, image_map in chapters:
+        yield display_title
+        yield from _chapter_pages(source_path, image_map)
+
+
+def create_volume_html(chapters, output_file='volume.html', title='小説', extras=None):
+    """章をまとめた1つのHTMLを作る
+
+    Args:
+        chapters: (表示タイトル, テキストファイルのパス, image_map) のリスト（この順番で並べます）
+        output_file: output/ 以下のファイル名
+        title: まとめたときのタイトル
+        extras: HTMLに追加するもの（simple_converter.html_additions() を参照）
+
+    Returns:
+        出力ファイルのパス
+    """
+    # 1回目: 描画キャッシュを用意してページ数を数える（未描画の章だけ描画）
+    page_count = 1 + len(chapters)
+    for _, source_path, image_map in chapters:
+        page_count += len(_chapter_pages(source_path, image_map))
+
+    output_path = Path('output') / output_file
+    head, tail = HTML_TEMPLATE.split('{pages}')
+    head = head.replace('{page_count}', str(page_count)).replace('{title}', title)
+    tail = tail.replace('</body>', LAZY_CHAPTER_SCRIPT + '</body>')
+    head, tail = add_to_template(head, tail, html_additions(output_path, title, _iter_volume_texts(chapters), extras))
+
+    # 2回目: キャッシュから1章ずつ書き出す
+    with atomic_stream(output_path) as f:
+        f.write(head.encode('utf-8'))
+        for number, (display_title, source_path, image_map) in enumerate(chapters, 1):
+            pages = _chapter_pages(source_path, image_map)
+            f.write(f'''    <div class="page chapter-title" data-chapter="{number}">
+        <h1>{display_title}</h1>
+    </div>
+
+'''.encode('utf-8'))
+            if number > 1:
+                f.write(f'    <script type="application/json" id="chapter-{number}">'.encode('utf-8'))
+                f.write(_lazy_chapter_json(pages).encode('utf-8'))
+                f.write(b'</script>')
+            else:
+                f.write('\n\n'.join(pages).encode('utf-8'))
+            f.write(b'\n\n')
+        f.write(tail.encode('utf-8'))
+
+    return output_path
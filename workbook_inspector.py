@@ -0,0 +1,138 @@
+"""
+Excelファイルの構造をまとめて確認するツール
+
+シートごとの行数・実データの範囲・マーカーの出現数・未知のマーカー・
+話者ごとの行数を表示します。ワークブックは読み取り専用モードで
+1行ずつ読むので、全体をメモリに展開しません。複数ファイルは並列に処理します。
+
+使い方: python cli.py inspect [Excelファイル ...] [--head 行数] [--jobs 並列数]
+"""
+
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from story_rows import classify_row, open_workbook
+
+# 表示するマーカー（種類 → 表示名）
+MARKER_LABELS = {
+    'decision': '--Decision--',
+    'decision_end': '--Decision End--',
+    'branch': '--Branch--',
+    'option': 'Option_*',
+    'image': '--image--',
+    'imagetween': '--imagetween--',
+    'background': '--background--',
+    'separator': '----',
+}
+
+
+def inspect_sheet(sheet, head=0):
+    """1シート分の集計を返す"""
+    rows = 0
+    last_row = 0
+    last_col = 0
+    markers = Counter()
+    unknown_markers = Counter()
+    speakers = Counter()
+    head_rows = []
+
+    for row_number, values in enumerate(sheet.iter_rows(values_only=True), 1):
+        filled = [i for i, value in enumerate(values, 1) if value is not None and value != '']
+        if not filled:
+            continue
+        rows += 1
+        last_row = row_number
+        last_col = max(last_col, filled[-1])
+        if len(head_rows) < head:
+            head_rows.append((row_number, values[:filled[-1]]))
+
+        col2 = values[1] if len(values) > 1 else None
+        if not col2:
+            continue
+        kind = classify_row(col2)
+        if kind in MARKER_LABELS:
+            markers[MARKER_LABELS[kind]] += 1
+        elif kind == 'marker':
+            unknown_markers[col2] += 1
+        else:
+            speakers[str(col2).strip()] += 1
+
+    return {
+        'name': sheet.title,
+        'rows': rows,
+        'extent': (last_row, last_col),
+        'markers': markers,
+        'unknown_markers': unknown_markers,
+        'speakers': speakers,
+        'head': head_rows,
+    }
+
+
+def inspect_workbook(excel_file, head=0):
+    """ワークブック全体の集計を返す（プロセスプールから呼ばれる）"""
+    started = time.perf_counter()
+    wb = open_workbook(excel_file)
+    try:
+        sheets = [inspect_sheet(wb[name], head) for name in wb.sheetnames]
+    finally:
+        wb.close()
+    return {
+        'workbook': Path(excel_file).name,
+        'sheets': sheets,
+        'seconds': time.perf_counter() - started,
+    }
+
+
+def inspect_workbooks(excel_files, head=0, jobs=None):
+    """複数のワークブックを並列に集計（結果は入力の順番）"""
+    excel_files = list(excel_files)
+    if len(excel_files) <= 1 or jobs == 1:
+        return [inspect_workbook(f, head) for f in excel_files]
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(inspect_workbook, excel_files, [head] * len(excel_files)))
+
+
+def format_report(report, top=10):
+    """集計結果を表示用の文字列にする"""
+    lines = [
+        '=' * 80,
+        f"{report['workbook']}  ({len(report['sheets'])}シート, {report['seconds']:.2f}秒)",
+        '=' * 80,
+    ]
+    markers = Counter()
+    unknown_markers = Counter()
+    speakers = Counter()
+    for sheet in report['sheets']:
+        last_row, last_col = sheet['extent']
+        lines.append(f"  {sheet['name']}: {sheet['rows']:,}行 (実データ範囲 {last_row}行 × {last_col}列)")
+        for row_number, values in sheet['head']:
+            cells = ' | '.join(f"{chr(ord('A') + i)}={value}" for i, value in enumerate(values))
+            lines.append(f"      行{row_number:3d}: {cells}")
+        markers.update(sheet['markers'])
+        unknown_markers.update(sheet['unknown_markers'])
+        speakers.update(sheet['speakers'])
+
+    lines.append('\n  マーカー:')
+    for label in MARKER_LABELS.values():
+        lines.append(f"    {label:18} {markers[label]:6,d}")
+    if unknown_markers:
+        lines.append('\n  ⚠ 未知のマーカー:')
+        for marker, count in unknown_markers.most_common():
+            lines.append(f"    {marker:18} {count:6,d}")
+    lines.append(f"\n  話者 ({len(speakers)}人):")
+    for speaker, count in speakers.most_common(top):
+        lines.append(f"    {count:6,d}  {speaker}")
+    return '\n'.join(lines)
+
+
+def main(files=None, head=0, top=10, jobs=None):
+    """指定したワークブック（省略時は main_*.xlsx）を集計して表示"""
+    excel_files = [Path(f) for f in files] if files else sorted(Path('.').glob('main_*.xlsx'))
+    if not excel_files:
+        print("エラー: main_*.xlsx ファイルが見つかりません。")
+        return
+    for report in inspect_workbooks(excel_files, head=head, jobs=jobs):
+        print(format_report(report, top=top))
+        print()